@@ -0,0 +1,236 @@
+"""
+analytics.py
+Hourly/daily sales rollups kept up to date as orders are placed and change status,
+so the admin dashboard can answer date-range questions without scanning `orders`.
+
+The record_* functions only add statements to the caller's session; the caller
+commits them together with the order change.
+
+Rebuild all rollups from the orders table (e.g. after deploying this on existing data):
+Usage: python analytics.py rebuild
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, literal_column, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import models
+
+GRAINS = ("hour", "day")
+GROUP_BY = ("product", "category", "size")
+
+
+def bucket_start(ts: datetime, grain: str) -> datetime:
+    """Truncate a timestamp to the start of its hour/day bucket, as naive UTC."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if grain == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(db: Session, model, key_cols, rows):
+    """INSERT rows, adding the numeric columns onto any existing row with the same key."""
+    if not rows:
+        return
+    add_cols = [c for c in rows[0] if c not in key_cols and c != "category"]
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_cols,
+            set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in add_cols},
+        )
+        db.execute(stmt)
+        return
+
+    # Other backends: read-modify-write inside the caller's transaction
+    for row in rows:
+        existing = db.query(model).filter_by(**{c: row[c] for c in key_cols}).with_for_update().first()
+        if existing:
+            for c in add_cols:
+                setattr(existing, c, getattr(existing, c) + row[c])
+        else:
+            db.add(model(**row))
+    db.flush()
+
+
+def _merge(acc: dict, key, **values):
+    for name, value in values.items():
+        acc[key][name] = acc[key].get(name, 0) + value
+
+
+def _order_rows(orders):
+    """Aggregate (placed_at, status, [(product_id, category, size, quantity, price)]) tuples into rollup rows."""
+    totals, sales, statuses = defaultdict(dict), defaultdict(dict), defaultdict(dict)
+    for placed_at, status, lines in orders:
+        revenue = sum(q * p for _, _, _, q, p in lines)
+        units = sum(q for _, _, _, q, _ in lines)
+        for grain in GRAINS:
+            bucket = bucket_start(placed_at, grain)
+            _merge(totals, (grain, bucket), orders=1, revenue=revenue, units=units)
+            _merge(statuses, (grain, bucket, status), orders=1)
+            for product_id, category, size, quantity, price in lines:
+                key = (grain, bucket, product_id, size or "")
+                sales[key]["category"] = category or ""
+                _merge(sales, key, units=quantity, revenue=quantity * price)
+
+    return (
+        [dict(grain=g, bucket=b, **v) for (g, b), v in totals.items()],
+        [dict(grain=g, bucket=b, product_id=p, size=s, **v) for (g, b, p, s), v in sales.items()],
+        [dict(grain=g, bucket=b, status=st, **v) for (g, b, st), v in statuses.items()],
+    )
+
+
+def _write(db: Session, orders):
+    totals, sales, statuses = _order_rows(orders)
+    _upsert(db, models.OrderRollup, ["grain", "bucket"], totals)
+    _upsert(db, models.SalesRollup, ["grain", "bucket", "product_id", "size"], sales)
+    _upsert(db, models.StatusRollup, ["grain", "bucket", "status"], statuses)
+
+
+def record_order(db: Session, order: models.Order):
+    """Add a newly placed order to the rollups. Items must have `product` set."""
+    lines = [
+        (item.product_id, item.product.category if item.product else "", item.size, item.quantity, item.price)
+        for item in order.items
+    ]
+    _write(db, [(order.created_at, order.status, lines)])
+
+
+def record_status_changes(db: Session, changes):
+    """Move orders between funnel statuses. `changes` is an iterable of (placed_at, old_status, new_status)."""
+    deltas = defaultdict(dict)
+    for placed_at, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        for grain in GRAINS:
+            bucket = bucket_start(placed_at, grain)
+            _merge(deltas, (grain, bucket, old_status), orders=-1)
+            _merge(deltas, (grain, bucket, new_status), orders=1)
+    rows = [dict(grain=g, bucket=b, status=st, **v) for (g, b, st), v in deltas.items() if v["orders"]]
+    _upsert(db, models.StatusRollup, ["grain", "bucket", "status"], rows)
+
+
+def record_status_change(db: Session, order: models.Order, old_status: str):
+    record_status_changes(db, [(order.created_at, old_status, order.status)])
+
+
+# ── Queries ───────────────────────────────────────────────────────────────────
+
+def default_range(start: datetime = None, end: datetime = None):
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    return start, end
+
+
+def _in_range(model, grain, start, end):
+    step = timedelta(days=1) if grain == "day" else timedelta(hours=1)
+    return (
+        model.grain == grain,
+        model.bucket >= bucket_start(start, grain),
+        model.bucket < bucket_start(end, grain) + step,
+    )
+
+
+def sales_summary(db: Session, start: datetime, end: datetime, grain: str = "day"):
+    rows = (
+        db.query(models.OrderRollup)
+        .filter(*_in_range(models.OrderRollup, grain, start, end))
+        .order_by(models.OrderRollup.bucket)
+        .all()
+    )
+    buckets = [{"bucket": r.bucket, "orders": r.orders, "revenue": r.revenue, "units": r.units} for r in rows]
+    return {
+        "grain": grain,
+        "start": start,
+        "end": end,
+        "orders": sum(b["orders"] for b in buckets),
+        "revenue": sum(b["revenue"] for b in buckets),
+        "units": sum(b["units"] for b in buckets),
+        "buckets": buckets,
+    }
+
+
+def sales_breakdown(db: Session, start: datetime, end: datetime, group_by: str = "product", grain: str = "day", limit: int = 50):
+    column = {
+        "product": models.SalesRollup.product_id,
+        "category": models.SalesRollup.category,
+        "size": models.SalesRollup.size,
+    }[group_by]
+    units = func.sum(models.SalesRollup.units)
+    revenue = func.sum(models.SalesRollup.revenue)
+    rows = (
+        db.query(column, units, revenue)
+        .filter(*_in_range(models.SalesRollup, grain, start, end))
+        .group_by(column)
+        .order_by(revenue.desc())
+        .limit(limit)
+        .all()
+    )
+    return [{"key": str(key), "units": u or 0, "revenue": r or 0.0} for key, u, r in rows]
+
+
+def status_funnel(db: Session, start: datetime, end: datetime, grain: str = "day"):
+    rows = (
+        db.query(models.StatusRollup.status, func.sum(models.StatusRollup.orders))
+        .filter(*_in_range(models.StatusRollup, grain, start, end))
+        .group_by(models.StatusRollup.status)
+        .all()
+    )
+    return {status: count for status, count in rows if count}
+
+
+# ── Rebuild ───────────────────────────────────────────────────────────────────
+
+def _order_lines(order, item):
+    return (
+        select(order.id.label("order_id"), order.created_at, order.status,
+               item.product_id, models.Product.category, item.size, item.quantity, item.price)
+        .outerjoin(item, item.order_id == order.id)
+        .outerjoin(models.Product, models.Product.id == item.product_id)
+    )
+
+
+def rebuild(db: Session, batch_size: int = 1000):
+    """Recompute every rollup from the orders and archived orders in one streaming pass."""
+    db.query(models.OrderRollup).delete()
+    db.query(models.SalesRollup).delete()
+    db.query(models.StatusRollup).delete()
+
+    rows = db.execute(
+        union_all(_order_lines(models.Order, models.OrderItem),
+                  _order_lines(models.ArchivedOrder, models.ArchivedOrderItem))
+        .order_by(literal_column("order_id")),
+        execution_options={"yield_per": batch_size},
+    )
+
+    batch, current_id = [], None
+    for order_id, created_at, status, product_id, category, size, quantity, price in rows:
+        if order_id != current_id:
+            if len(batch) >= batch_size:
+                _write(db, batch)
+                batch = []
+            batch.append((created_at, status, []))
+            current_id = order_id
+        if product_id is not None:
+            batch[-1][2].append((product_id, category, size, quantity or 0, price or 0.0))
+    _write(db, batch)
+    db.commit()
+
+
+if __name__ == "__main__":
+    import sys
+    import database
+
+    if sys.argv[1:] != ["rebuild"]:
+        print(__doc__)
+        sys.exit(1)
+    session = database.get_sessionmaker()()
+    try:
+        rebuild(session)
+        print("[✓] Analytics rollups rebuilt.")
+    finally:
+        session.close()
@@ -0,0 +1,118 @@
+"""
+archive_orders.py
+Moves delivered orders older than --older-than-days (default ARCHIVE_AFTER_DAYS, 180) and
+their items from orders/order_items to orders_archive/order_items_archive.
+
+Without this the hot tables grow forever; with it they hold only recent and open orders,
+so their indexes stay small enough to stay in memory. Customers still see archived orders
+in their history (crud.get_user_orders reads both), and the analytics/recommendations
+rebuilds include them. Archived orders are read-only: their status can no longer change.
+
+Orders move in batches of --batch-size, each in its own transaction (insert into the
+archive, then delete from the hot tables), oldest first. On PostgreSQL the rows are
+locked with SKIP LOCKED, so the job can run alongside the app or a second copy of itself,
+and the monthly archive partitions a batch needs are created first.
+
+Create the archive tables on existing databases with migrate_add_order_archive.py.
+Run periodically (cron, or --interval to keep running):
+Usage: python archive_orders.py [--older-than-days 180] [--batch-size 1000] [--interval SECONDS]
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, select, text
+import models
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+BATCH_SIZE = 1000
+
+ORDER_COLUMNS = ("id", "created_at", "user_id", "status", "total_price", "shipping_address",
+                 "discount_total", "coupon_code")
+ITEM_COLUMNS = ("id", "order_id", "product_id", "quantity", "size", "price")
+
+
+def _month(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def ensure_partitions(conn, months):
+    """Create the monthly orders_archive / order_items_archive partitions (PostgreSQL only)."""
+    for start in sorted(months):
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=timezone.utc)
+        for table in (models.ArchivedOrder.__tablename__, models.ArchivedOrderItem.__tablename__):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table}_p{start:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+
+
+def archive_batch(conn, cutoff: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """Archive up to batch_size delivered orders created before cutoff. Returns how many moved."""
+    orders, items = models.Order.__table__, models.OrderItem.__table__
+    postgres = conn.dialect.name == "postgresql"
+
+    pick = (
+        select(orders.c.id, orders.c.created_at)
+        .where(orders.c.status == "Delivered", orders.c.created_at < cutoff)
+        .order_by(orders.c.created_at, orders.c.id)
+        .limit(batch_size)
+    )
+    if postgres:
+        pick = pick.with_for_update(skip_locked=True)
+    rows = conn.execute(pick).all()
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+    if postgres:
+        ensure_partitions(conn, {_month(row.created_at) for row in rows})
+
+    conn.execute(insert(models.ArchivedOrder.__table__).from_select(
+        ORDER_COLUMNS, select(*(orders.c[c] for c in ORDER_COLUMNS)).where(orders.c.id.in_(ids))
+    ))
+    conn.execute(insert(models.ArchivedOrderItem.__table__).from_select(
+        ITEM_COLUMNS + ("created_at",),
+        select(*(items.c[c] for c in ITEM_COLUMNS), orders.c.created_at)
+        .join(orders, orders.c.id == items.c.order_id)
+        .where(items.c.order_id.in_(ids)),
+    ))
+    conn.execute(delete(items).where(items.c.order_id.in_(ids)))
+    conn.execute(delete(orders).where(orders.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive(engine, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE) -> dict:
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    moved = batches = 0
+    while True:
+        with engine.begin() as conn:
+            n = archive_batch(conn, cutoff, batch_size)
+        if not n:
+            break
+        moved += n
+        batches += 1
+        if n < batch_size:
+            break
+    return {"orders": moved, "batches": batches, "cutoff": cutoff.isoformat(),
+            "seconds": round(time.perf_counter() - started, 2)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Move old delivered orders to the archive tables.")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=0, help="run every N seconds instead of once")
+    args = parser.parse_args()
+
+    while True:
+        stats = archive(database.get_engine(), args.older_than_days, args.batch_size)
+        print(f"[✓] Archived {stats['orders']} orders created before {stats['cutoff']} "
+              f"in {stats['batches']} batches, {stats['seconds']}s")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,295 @@
+"""
+benchmark.py
+Micro-benchmarks for the hot paths behind the storefront: crud queries, response
+serialization, password verification and JWT decoding.
+
+Each benchmark runs against a seeded database and is timed with timeit: the loop count
+is calibrated so a run takes about 0.2s, then --repeat runs are taken and the median
+per-call time is reported. The database is a temporary SQLite file by default;
+--database-url points elsewhere, but its tables are dropped and recreated, so it is
+refused without --reset and must never be a database with real data.
+crud benchmarks open a fresh session per call, as a request does.
+
+Results can be saved as JSON (--save-baseline) and later runs compared against them
+(--baseline): a benchmark whose median is more than --threshold slower fails the run
+(exit status 1), so a change to query or serialization code has to justify itself.
+
+Usage: python benchmark.py [--products 1000] [--orders 500] [--cart-items 10] [--filter crud]
+                           [--database-url URL --reset] [--save-baseline FILE] [--baseline FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta, timezone
+
+BENCHMARKS = {}
+PASSWORD = "benchmark-password"
+
+
+def benchmark(name: str):
+    """Register fn(ctx) returning the zero-argument callable to time."""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+# ── Dataset ───────────────────────────────────────────────────────────────────
+
+def prepare(url: str, n_products: int, n_orders: int, cart_items: int, seed: int, reset: bool) -> dict:
+    os.environ["DATABASE_URL"] = url
+    import auth, catalog_import, database, models
+    from sqlalchemy import insert
+
+    if reset:
+        models.Base.metadata.drop_all(bind=database.get_engine())
+    models.Base.metadata.create_all(bind=database.get_engine())
+    rng = random.Random(seed)
+    catalog_import.import_products(database.get_engine(), ({
+        "title": f"Benchmark product {i}", "description": "Generated for benchmarks.",
+        "price": round(rng.uniform(10, 150), 2), "category": rng.choice(["Tops", "Dresses", "Bottoms"]),
+        "stock": 10_000_000, "images": [f"https://example.com/{i}.jpg"], "sizes": ["S", "M", "L"],
+    } for i in range(n_products)))
+
+    db = database.get_sessionmaker()()
+    try:
+        buyer = models.User(email="buyer@example.com", hashed_password=auth.get_password_hash(PASSWORD), is_verified=True)
+        shopper = models.User(email="shopper@example.com", hashed_password=buyer.hashed_password, is_verified=True)
+        db.add_all([buyer, shopper])
+        db.flush()
+        product_ids = [i for (i,) in db.query(models.Product.id).order_by(models.Product.id)]
+
+        # Order history for get_user_orders: two lines per order
+        start = datetime.now(timezone.utc) - timedelta(days=365)
+        db.execute(insert(models.Order), [{
+            "user_id": buyer.id, "status": "Delivered", "total_price": 100.0, "shipping_address": "1 Bench St",
+            "created_at": start + timedelta(minutes=i),
+        } for i in range(n_orders)])
+        order_ids = [i for (i,) in db.query(models.Order.id).filter(models.Order.user_id == buyer.id)]
+        db.execute(insert(models.OrderItem), [{
+            "order_id": order_id, "product_id": rng.choice(product_ids), "quantity": 1, "size": "M", "price": 50.0,
+        } for order_id in order_ids for _ in range(2)])
+
+        # The serialization benchmark's cart; add_to_cart works on the shopper's own cart
+        cart = models.Cart(user_id=buyer.id)
+        db.add(cart)
+        db.flush()
+        db.add_all(models.CartItem(cart_id=cart.id, product_id=product_ids[i], quantity=1, size="M")
+                   for i in range(min(cart_items, len(product_ids))))
+        db.commit()
+        return {"buyer_id": buyer.id, "shopper_id": shopper.id, "product_ids": product_ids,
+                "cart_items": min(cart_items, len(product_ids)), "hashed_password": buyer.hashed_password, "rng": rng}
+    finally:
+        db.close()
+
+
+def _with_session(fn):
+    import database
+
+    def call():
+        db = database.get_sessionmaker()()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+    return call
+
+
+# ── Benchmarks ────────────────────────────────────────────────────────────────
+
+@benchmark("crud.get_products")
+def bench_get_products(ctx):
+    import crud
+
+    pages = max(1, len(ctx["product_ids"]) // 100)
+    return _with_session(lambda db: crud.get_products(db, skip=ctx["rng"].randrange(pages) * 100, limit=100))
+
+
+@benchmark("crud.get_product")
+def bench_get_product(ctx):
+    import crud
+
+    return _with_session(lambda db: crud.get_product(db, ctx["rng"].choice(ctx["product_ids"])))
+
+
+@benchmark("crud.get_user_by_email")
+def bench_get_user_by_email(ctx):
+    import crud
+
+    # Runs on every authenticated request (dependencies.get_current_user)
+    return _with_session(lambda db: crud.get_user_by_email(db, ctx["rng"].choice(["buyer@example.com", "shopper@example.com"])))
+
+
+@benchmark("crud.get_cart")
+def bench_get_cart(ctx):
+    import crud
+
+    return _with_session(lambda db: crud.get_cart(db, ctx["buyer_id"]))
+
+
+@benchmark("crud.update_cart_item")
+def bench_update_cart_item(ctx):
+    import crud
+
+    # Rewrites one of the buyer's existing lines: cart lookup, item lookup, commit, refresh
+    lines = ctx["product_ids"][:max(1, ctx["cart_items"])]
+    return _with_session(lambda db: crud.update_cart_item(db, ctx["buyer_id"], ctx["rng"].choice(lines), "M",
+                                                          ctx["rng"].randint(1, 3)))
+
+
+@benchmark("crud.add_to_cart")
+def bench_add_to_cart(ctx):
+    import crud, schemas
+
+    # A bounded set of lines, so the cart stops growing after the first calls
+    items = [schemas.CartItemCreate(product_id=p, quantity=1, size="L") for p in ctx["product_ids"][:20]]
+    return _with_session(lambda db: crud.add_to_cart(db, ctx["shopper_id"], ctx["rng"].choice(items)))
+
+
+@benchmark("crud.create_order")
+def bench_create_order(ctx):
+    import crud, schemas
+
+    def order():
+        ids = ctx["rng"].sample(ctx["product_ids"], 2)
+        return schemas.OrderCreate(shipping_address="1 Bench St",
+                                   items=[{"product_id": i, "quantity": 1, "size": "M"} for i in ids])
+    # Placed as the shopper so the buyer's history read by get_user_orders stays fixed
+    return _with_session(lambda db: crud.create_order(db, order(), ctx["shopper_id"]))
+
+
+@benchmark("crud.get_user_orders")
+def bench_get_user_orders(ctx):
+    import crud, schemas
+
+    # Serialized as GET /api/orders/ does, so lazy loads of order items are included
+    return _with_session(lambda db: [schemas.Order.model_validate(o).model_dump_json()
+                                     for o in crud.get_user_orders(db, ctx["buyer_id"], limit=100)[0]])
+
+
+@benchmark("schemas.Product x100")
+def bench_product_serialization(ctx):
+    import crud, database, schemas
+
+    db = database.get_sessionmaker()()
+    try:
+        products = crud.get_products(db, limit=100)
+    finally:
+        db.close()  # the loaded, detached rows are all the benchmark needs
+    return lambda: [schemas.Product.model_validate(p).model_dump_json() for p in products]
+
+
+@benchmark("schemas.Cart")
+def bench_cart_serialization(ctx):
+    import crud, database, schemas
+
+    db = database.get_sessionmaker()()
+    try:
+        cart = crud.get_cart(db, ctx["buyer_id"])
+        schemas.Cart.model_validate(cart)  # load items and products once
+    finally:
+        db.close()
+    return lambda: schemas.Cart.model_validate(cart).model_dump_json()
+
+
+@benchmark("auth.verify_password")
+def bench_verify_password(ctx):
+    import auth
+
+    return lambda: auth.verify_password(PASSWORD, ctx["hashed_password"])
+
+
+@benchmark("auth.jwt_decode")
+def bench_jwt_decode(ctx):
+    import auth
+    from jose import jwt
+
+    token = auth.create_access_token({"sub": "buyer@example.com"}, timedelta(hours=1))
+    return lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+def measure(fn, repeat: int) -> dict:
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    per_call = [t / loops for t in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 2),
+        "min_us": round(min(per_call) * 1e6, 2),
+        "loops": loops,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    slower = []
+    for name, r in results.items():
+        b = baseline.get("results", {}).get(name)
+        if b and r["median_us"] > b["median_us"] * (1 + threshold):
+            slower.append(f"{name}: {b['median_us']} -> {r['median_us']} us")
+    return slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for crud, serialization and auth.")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=500, help="orders in the benchmark user's history")
+    parser.add_argument("--cart-items", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables of --database-url first (required)")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown of the median vs baseline")
+    args = parser.parse_args()
+
+    if args.database_url and not args.reset:
+        # The dataset is seeded from scratch; running on a database with data in it would
+        # mean dropping that data, so that has to be asked for explicitly
+        parser.error("--database-url wipes that database's tables; pass --reset to confirm it is a throwaway database")
+    url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "benchmark.db")
+    ctx = prepare(url, args.products, args.orders, args.cart_items, args.seed, reset=args.reset)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    base_results = (baseline or {}).get("results", {})
+
+    results = {}
+    print(f"{'benchmark':28} {'median us':>12} {'min us':>12} {'loops':>7}" + ("  vs base" if baseline else ""))
+    for name, factory in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = r = measure(factory(ctx), args.repeat)
+        line = f"{name:28} {r['median_us']:12.1f} {r['min_us']:12.1f} {r['loops']:7}"
+        if name in base_results:
+            line += f"  {100 * (r['median_us'] / base_results[name]['median_us'] - 1):+6.1f}%"
+        print(line)
+
+    report = {
+        "config": {k: getattr(args, k) for k in ("products", "orders", "cart_items", "seed")},
+        "database": url.split(":", 1)[0],
+        "python": platform.python_version(),
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[✓] Baseline saved to {args.save_baseline}")
+    if baseline:
+        if baseline.get("config") != report["config"]:
+            print("[!] Baseline was recorded with different settings; comparison is only indicative")
+        slower = compare(results, baseline, args.threshold)
+        for line in slower:
+            print(f"[✗] Slower than baseline: {line}")
+        if slower:
+            sys.exit(1)
+        print("[✓] No benchmark slower than baseline")
@@ -0,0 +1,114 @@
+"""
+cache.py
+Small in-process TTL caches for hot read paths.
+
+Each worker has its own copy, so entries are kept short-lived and writers call
+invalidate() or the invalidate_* helpers after committing to drop the keys they changed.
+Those drop the keys here and publish the invalidation on the "cache" pubsub topic; with
+REDIS_URL set, every worker that called listen_for_invalidations() (main.py's lifespan
+does) drops them too. Without Redis, other workers only catch up when entries expire, so
+the TTLs below bound how stale they can be.
+"""
+import threading
+import time
+import uuid
+import pubsub
+
+MISSING = object()
+# Every cache created, for metrics.py
+CACHES = []
+INVALIDATION_TOPIC = "cache"
+# Marks this process's own broadcasts, which it has already applied
+_ORIGIN = uuid.uuid4().hex
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float = 30.0, maxsize: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
+        CACHES.append(self)
+
+    def get(self, key):
+        """Return the cached value, or MISSING if absent or expired."""
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value, ttl: float = None):
+        """Store value for the cache's ttl, or for `ttl` seconds if that is shorter."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                # Cheap bound: drop expired entries, then the oldest insertion
+                now = time.monotonic()
+                for k in [k for k, (expires, _) in self._data.items() if expires <= now]:
+                    del self._data[k]
+                if len(self._data) >= self.maxsize:
+                    del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# schemas.Product keyed by product id, served by GET /api/products/{id}
+product_cache = TTLCache("product", ttl=30.0)
+
+# First pages of GET /api/products/ keyed by (skip, limit); the home page and the catalog
+# both load (0, 100). Any product change clears the whole cache.
+product_list_cache = TTLCache("product_list", ttl=30.0, maxsize=100)
+
+# Related product ids keyed by product id, from recommendations.py. Only ids are cached,
+# so product edits never leave stale details here; rebuilds invalidate it.
+related_cache = TTLCache("related", ttl=600.0)
+
+
+def _drop(cache: TTLCache, keys):
+    if keys is None:
+        cache.clear()
+    else:
+        cache.invalidate(*keys)
+
+
+def invalidate(cache: TTLCache, keys=None):
+    """Drop `keys` (everything if None) from `cache` in this worker and every other."""
+    _drop(cache, keys)
+    try:
+        pubsub.publish(INVALIDATION_TOPIC, {"type": "cache.invalidate", "origin": _ORIGIN, "cache": cache.name,
+                                            "keys": None if keys is None else list(keys)})
+    except Exception as e:
+        # Other workers still expire the entries within the TTL
+        print(f"[cache] broadcasting invalidation of {cache.name} failed: {e}")
+
+
+def invalidate_products(product_ids=None):
+    """Drop the given products from every product-keyed cache, or everything if None."""
+    invalidate(product_list_cache)
+    invalidate(product_cache, product_ids)
+
+
+def _on_invalidation(message: dict):
+    if message.get("origin") == _ORIGIN:
+        return
+    for cache in CACHES:
+        if cache.name == message.get("cache"):
+            _drop(cache, message.get("keys"))
+
+
+def listen_for_invalidations():
+    """Apply invalidations published by other workers and scripts to this worker's caches."""
+    pubsub.handle(INVALIDATION_TOPIC, _on_invalidation)
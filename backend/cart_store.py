@@ -0,0 +1,548 @@
+"""
+cart_store.py
+Optional write-behind storage for carts, for deployments where cart edits dominate writes.
+
+By default (CART_STORE unset) routers/cart.py goes straight to crud.py, and every edit is
+a few SELECTs and a commit. With CART_STORE set, carts are read from the database once and
+then kept in a keyed store; edits only change the store and mark the cart dirty, and a
+background flusher (started by main.py's lifespan) writes dirty carts to carts/cart_items
+every CART_FLUSH_INTERVAL seconds, FLUSH_BATCH carts per transaction. Checkout flushes the
+user's cart synchronously first, after waiting for any background write of it still in
+flight, so orders are always placed from what the user saw.
+
+CART_STORE=memory
+    A dict per worker. Route each user to the same worker (sticky sessions) when running
+    several. Every edit is appended to a write-ahead log in CART_WAL_DIR before it is
+    acknowledged (CART_WAL_FSYNC=1 also fsyncs each record). The log is rotated at each
+    flush and a segment is deleted once everything in it is in the database. At startup,
+    segments left by dead workers (not flock()ed by a live process) are replayed into the
+    database. Records hold the line's new absolute quantity, so replaying one twice is harmless.
+CART_STORE=redis
+    Carts as Redis hashes shared by all workers (REDIS_URL, needs the `redis` package), so
+    no sticky routing is needed; durability is Redis's own. Falls back to memory if Redis is
+    unavailable.
+"""
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+import crud, metrics, models
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so any leftover segment is replayed at startup
+    fcntl = None
+
+CART_STORE = os.getenv("CART_STORE", "").lower()
+REDIS_URL = os.getenv("REDIS_URL", "")
+FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", "2.0"))
+WAL_DIR = os.getenv("CART_WAL_DIR", os.path.join(os.path.dirname(__file__), "cart_wal"))
+WAL_FSYNC = os.getenv("CART_WAL_FSYNC", "") == "1"
+FLUSH_BATCH = 200
+IDLE_SECONDS = 1800  # clean carts untouched this long are dropped from memory
+REDIS_PREFIX = "cloth_store:cart:"
+REDIS_DIRTY = "cloth_store:cart_dirty"
+REDIS_WRITING = "cloth_store:cart_writing"  # user id -> lease deadline, while a flush writes it
+REDIS_TTL = 7 * 86400
+WRITE_LEASE = 30.0  # longest a checkout waits for an in-flight write of its cart
+
+
+# ── Database side ─────────────────────────────────────────────────────────────
+
+def _load(db: Session, user_id: int):
+    """(cart_id or None, {(product_id, size): quantity}) as stored in the database."""
+    cart_id = db.scalar(select(models.Cart.id).where(models.Cart.user_id == user_id))
+    lines = {}
+    if cart_id is not None:
+        for product_id, size, quantity in db.execute(
+            select(models.CartItem.product_id, models.CartItem.size, models.CartItem.quantity)
+            .where(models.CartItem.cart_id == cart_id)
+        ):
+            lines[(product_id, size)] = quantity
+    return cart_id, lines
+
+
+def _write(db: Session, carts: dict) -> dict:
+    """Replace the stored lines of each {user_id: lines} cart, creating carts as needed.
+    Lines for products that no longer exist are dropped. Returns {user_id: cart_id}."""
+    cart_ids = dict(db.execute(select(models.Cart.user_id, models.Cart.id)
+                               .where(models.Cart.user_id.in_(list(carts)))).all())
+    missing = [user_id for user_id in carts if user_id not in cart_ids]
+    if missing:
+        db.execute(insert(models.Cart), [{"user_id": user_id} for user_id in missing])
+        cart_ids.update(db.execute(select(models.Cart.user_id, models.Cart.id)
+                                   .where(models.Cart.user_id.in_(missing))).all())
+    ids = list(cart_ids.values())
+    db.execute(update(models.Cart).where(models.Cart.id.in_(ids)).values(updated_at=func.now()))
+    db.execute(delete(models.CartItem).where(models.CartItem.cart_id.in_(ids)))
+    product_ids = {product_id for lines in carts.values() for product_id, _ in lines}
+    existing = set(db.scalars(select(models.Product.id).where(models.Product.id.in_(product_ids)))) if product_ids else set()
+    rows = [{"cart_id": cart_ids[user_id], "product_id": product_id, "size": size, "quantity": quantity}
+            for user_id, lines in carts.items() for (product_id, size), quantity in lines.items()
+            if product_id in existing]
+    if rows:
+        db.execute(insert(models.CartItem), rows)
+    db.commit()
+    return cart_ids
+
+
+def _write_batch(session_factory, batch: dict):
+    """One transaction for `batch`. Returns its {user_id: cart_id}, or None if it failed."""
+    started = time.perf_counter()
+    db = session_factory()
+    try:
+        cart_ids = _write(db, batch)
+        metrics.cart_store_flushed.inc(amount=len(batch))
+        return cart_ids
+    except Exception as e:
+        db.rollback()
+        print(f"[cart_store] flushing {len(batch)} carts failed: {e}")
+        return None
+    finally:
+        db.close()
+        metrics.cart_store_flush_seconds.observe(time.perf_counter() - started)
+
+
+def _write_batches(session_factory, carts: dict):
+    """Write carts FLUSH_BATCH at a time. Returns ({user_id: cart_id} written, user ids that failed).
+
+    A failed batch is retried one cart per transaction, so a cart that cannot be written
+    (e.g. a product deleted between _write's check and its insert) only holds back itself.
+    """
+    cart_ids, failed = {}, []
+    user_ids = list(carts)
+    for start in range(0, len(user_ids), FLUSH_BATCH):
+        batch = {user_id: carts[user_id] for user_id in user_ids[start:start + FLUSH_BATCH]}
+        written = _write_batch(session_factory, batch)
+        if written is not None:
+            cart_ids.update(written)
+            continue
+        for user_id, lines in batch.items():
+            written = _write_batch(session_factory, {user_id: lines}) if len(batch) > 1 else None
+            if written is None:
+                failed.append(user_id)
+            else:
+                cart_ids.update(written)
+    return cart_ids, failed
+
+
+# ── Stores ────────────────────────────────────────────────────────────────────
+
+class MemoryCartStore:
+    def __init__(self, wal_dir: str):
+        self._carts = {}    # user_id -> {"cart_id", "lines", "touched"}
+        self._dirty = set()
+        self._writing = set()  # carts being written by flush()/flush_user() right now
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._wal_dir = wal_dir
+        self._wal = None    # (path, file) of the segment being appended to
+        self._sealed = []   # rotated segments waiting for a successful flush
+        self._seq = 0
+
+    def _log(self, record: dict):
+        if self._wal is None:
+            os.makedirs(self._wal_dir, exist_ok=True)
+            self._seq += 1
+            path = os.path.join(self._wal_dir, f"cart-{os.getpid()}-{self._seq:06d}.wal")
+            fh = open(path, "a", encoding="utf-8")
+            if fcntl:
+                # Held until the segment is deleted: tells replay() this worker is alive
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._wal = (path, fh)
+        fh = self._wal[1]
+        fh.write(json.dumps(record) + "\n")
+        fh.flush()
+        if WAL_FSYNC:
+            os.fsync(fh.fileno())
+
+    def state(self, user_id: int, load):
+        with self._lock:
+            entry = self._carts.get(user_id)
+            if entry is not None:
+                entry["touched"] = time.monotonic()
+                return entry["cart_id"], dict(entry["lines"])
+        cart_id, lines = load(user_id)
+        with self._lock:
+            entry = self._carts.setdefault(user_id, {"cart_id": cart_id, "lines": lines})
+            entry["touched"] = time.monotonic()
+            return entry["cart_id"], dict(entry["lines"])
+
+    def set_quantity(self, user_id: int, product_id: int, size: str, quantity: int, load, add: bool = False):
+        self.state(user_id, load)
+        with self._lock:
+            entry = self._carts[user_id]
+            key = (product_id, size)
+            if not add and key not in entry["lines"]:
+                # Like crud.update_cart_item: only lines already in the cart are changed
+                return entry["cart_id"], dict(entry["lines"])
+            if add:
+                quantity += entry["lines"].get(key, 0)
+            if quantity > 0:
+                entry["lines"][key] = quantity
+            else:
+                entry["lines"].pop(key, None)
+            self._log({"u": user_id, "p": product_id, "s": size, "q": max(quantity, 0)})
+            self._dirty.add(user_id)
+            return entry["cart_id"], dict(entry["lines"])
+
+    def clear(self, user_id: int, load=None, flushed: bool = False):
+        """Empty the cart; `flushed` when the database cart is already empty (checkout)."""
+        if load is not None:
+            self.state(user_id, load)
+        with self._lock:
+            entry = self._carts.get(user_id)
+            if entry is not None:
+                entry["lines"].clear()
+            # Logged even when not cached, so a replay cannot bring back older lines
+            self._log({"u": user_id, "clear": True})
+            if flushed:
+                self._dirty.discard(user_id)
+            else:
+                self._dirty.add(user_id)
+            return (entry or {}).get("cart_id"), {}
+
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def _written_back(self, cart_ids: dict, failed: list):
+        """After a write (lock held): learn new cart ids, re-dirty failures, wake waiters."""
+        for user_id, cart_id in cart_ids.items():
+            entry = self._carts.get(user_id)
+            if entry is not None:
+                entry["cart_id"] = cart_id
+        self._dirty.update(failed)
+        self._writing.difference_update(cart_ids, failed)
+        self._written.notify_all()
+
+    def flush(self, session_factory) -> int:
+        with self._lock:
+            if self._wal is not None:
+                self._sealed.append(self._wal)
+                self._wal = None
+            sealed = list(self._sealed)
+            # A cart flush_user() is writing stays dirty for the next round, so two
+            # writes of one cart never race
+            carts = {user_id: dict(self._carts[user_id]["lines"]) for user_id in self._dirty - self._writing}
+            skipped = len(self._dirty) > len(carts)
+            self._dirty.difference_update(carts)
+            self._writing.update(carts)
+            now = time.monotonic()
+            for user_id in [u for u, e in self._carts.items()
+                            if now - e["touched"] > IDLE_SECONDS and u not in self._dirty and u not in self._writing]:
+                del self._carts[user_id]
+        cart_ids, failed = _write_batches(session_factory, carts) if carts else ({}, [])
+        with self._lock:
+            self._written_back(cart_ids, failed)
+            if not failed and not skipped:
+                # Everything logged in these segments is now in the database
+                for path, fh in sealed:
+                    fh.close()
+                    os.remove(path)
+                    self._sealed.remove((path, fh))
+        return len(carts) - len(failed)
+
+    def flush_user(self, user_id: int, session_factory):
+        """Write the user's cart now. Waits for a flush() already writing it: until that
+        commits, the database holds an older copy and the cart is no longer marked dirty."""
+        with self._lock:
+            if not self._written.wait_for(lambda: user_id not in self._writing, timeout=WRITE_LEASE):
+                raise RuntimeError("cart could not be saved")
+            entry = self._carts.get(user_id)
+            if entry is None or user_id not in self._dirty:
+                return
+            lines = dict(entry["lines"])
+            self._dirty.discard(user_id)
+            self._writing.add(user_id)
+        cart_ids, failed = _write_batches(session_factory, {user_id: lines})
+        with self._lock:
+            self._written_back(cart_ids, failed)
+        if failed:
+            raise RuntimeError("cart could not be saved")
+
+    def replay(self, session_factory) -> dict:
+        """Write carts logged by workers that died before flushing them, then drop their logs."""
+        segments = []
+        for path in sorted(glob.glob(os.path.join(self._wal_dir, "cart-*.wal")), key=os.path.getmtime):
+            fh = open(path, "r", encoding="utf-8")
+            if fcntl:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    fh.close()  # a live worker's segment
+                    continue
+            segments.append((path, fh))
+        records = defaultdict(list)
+        for path, fh in segments:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last write
+                records[record["u"]].append(record)
+        carts = {}
+        if records:
+            db = session_factory()
+            try:
+                for user_id, ops in records.items():
+                    lines = _load(db, user_id)[1]
+                    for op in ops:
+                        if op.get("clear"):
+                            lines.clear()
+                        elif op["q"] > 0:
+                            lines[(op["p"], op["s"])] = op["q"]
+                        else:
+                            lines.pop((op["p"], op["s"]), None)
+                    carts[user_id] = lines
+            finally:
+                db.close()
+            if _write_batches(session_factory, carts)[1]:
+                for _, fh in segments:
+                    fh.close()
+                raise RuntimeError("replaying the cart log failed; segments kept")
+        for path, fh in segments:
+            fh.close()
+            os.remove(path)
+        return {"segments": len(segments), "carts": len(carts)}
+
+
+# Move up to ARGV[1] ids from the dirty set (KEYS[1]) into the writing set (KEYS[2]) with
+# lease deadline ARGV[3]. Ids another flush still holds (lease after ARGV[2], now) stay dirty.
+_CLAIM_DIRTY = """
+local ids = redis.call('SPOP', KEYS[1], ARGV[1])
+local claimed, busy = {}, {}
+for _, id in ipairs(ids) do
+    local lease = redis.call('ZSCORE', KEYS[2], id)
+    if lease and tonumber(lease) > tonumber(ARGV[2]) then
+        table.insert(busy, id)
+    else
+        redis.call('ZADD', KEYS[2], ARGV[3], id)
+        table.insert(claimed, id)
+    end
+end
+if #busy > 0 then redis.call('SADD', KEYS[1], unpack(busy)) end
+return claimed
+"""
+
+# Claim one user (ARGV[1]) the same way: -1 while another write holds it, 0 if not dirty, 1 claimed
+_CLAIM_USER = """
+local lease = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if lease and tonumber(lease) > tonumber(ARGV[2]) then return -1 end
+if redis.call('SREM', KEYS[1], ARGV[1]) == 0 then return 0 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+return 1
+"""
+
+# Release written ids: ARGV[1] is the cart key prefix, then (user id, cart id) pairs, with
+# an empty cart id for a failed write, which goes back into the dirty set
+_RELEASE = """
+for i = 2, #ARGV, 2 do
+    local user, cart = ARGV[i], ARGV[i + 1]
+    if cart == '' then
+        redis.call('SADD', KEYS[1], user)
+    elseif redis.call('EXISTS', ARGV[1] .. user) == 1 then
+        redis.call('HSET', ARGV[1] .. user, '_', cart)
+    end
+    redis.call('ZREM', KEYS[2], user)
+end
+"""
+
+
+class RedisCartStore:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._redis.ping()
+        self._claim_dirty = self._redis.register_script(_CLAIM_DIRTY)
+        self._claim_user = self._redis.register_script(_CLAIM_USER)
+        self._release = self._redis.register_script(_RELEASE)
+
+    @staticmethod
+    def _decode(data: dict):
+        lines = {}
+        for field, quantity in data.items():
+            if field != "_":
+                product_id, size = field.split("|", 1)
+                lines[(int(product_id), size)] = int(quantity)
+        return int(data.get("_") or 0) or None, lines
+
+    def state(self, user_id: int, load):
+        key = REDIS_PREFIX + str(user_id)
+        data = self._redis.hgetall(key)
+        if not data:
+            cart_id, lines = load(user_id)
+            # HSETNX throughout: a concurrent edit on another worker wins over this load
+            pipe = self._redis.pipeline()
+            pipe.hsetnx(key, "_", cart_id or 0)
+            for (product_id, size), quantity in lines.items():
+                pipe.hsetnx(key, f"{product_id}|{size}", quantity)
+            pipe.expire(key, REDIS_TTL)
+            pipe.hgetall(key)
+            data = pipe.execute()[-1]
+        return self._decode(data)
+
+    def set_quantity(self, user_id: int, product_id: int, size: str, quantity: int, load, add: bool = False):
+        cart_id, lines = self.state(user_id, load)
+        if not add and (product_id, size) not in lines:
+            return cart_id, lines  # only lines already in the cart are changed
+        key, field = REDIS_PREFIX + str(user_id), f"{product_id}|{size}"
+        if add:
+            quantity = self._redis.hincrby(key, field, quantity)
+        elif quantity > 0:
+            self._redis.hset(key, field, quantity)
+        if quantity <= 0:
+            self._redis.hdel(key, field)
+        pipe = self._redis.pipeline()
+        pipe.sadd(REDIS_DIRTY, user_id)
+        pipe.expire(key, REDIS_TTL)
+        pipe.hgetall(key)
+        return self._decode(pipe.execute()[-1])
+
+    def clear(self, user_id: int, load=None, flushed: bool = False):
+        key = REDIS_PREFIX + str(user_id)
+        cart_id = self.state(user_id, load)[0] if load is not None else None
+        fields = [f for f in self._redis.hkeys(key) if f != "_"]
+        if fields:
+            self._redis.hdel(key, *fields)
+        if flushed:
+            self._redis.srem(REDIS_DIRTY, user_id)
+        else:
+            self._redis.sadd(REDIS_DIRTY, user_id)
+        return cart_id, {}
+
+    def dirty_count(self) -> int:
+        return self._redis.scard(REDIS_DIRTY)
+
+    def _snapshot(self, user_ids):
+        pipe = self._redis.pipeline()
+        for user_id in user_ids:
+            pipe.hgetall(REDIS_PREFIX + str(user_id))
+        return {int(user_id): self._decode(data)[1] for user_id, data in zip(user_ids, pipe.execute())}
+
+    def _write(self, session_factory, user_ids) -> list:
+        """Snapshot and write claimed carts, then release them. Returns the failed user ids."""
+        cart_ids, failed = {}, [int(u) for u in user_ids]
+        try:
+            cart_ids, failed = _write_batches(session_factory, self._snapshot(user_ids))
+        finally:
+            args = [REDIS_PREFIX]
+            for user_id in map(int, user_ids):
+                args += [user_id, cart_ids.get(user_id, "")]
+            self._release(keys=[REDIS_DIRTY, REDIS_WRITING], args=args)
+        return failed
+
+    def flush(self, session_factory) -> int:
+        # The claim script hands each dirty cart to exactly one writer; the lease in
+        # REDIS_WRITING lets a checkout on any worker wait for that write to commit
+        now = time.time()
+        self._redis.zremrangebyscore(REDIS_WRITING, "-inf", now)
+        user_ids = self._claim_dirty(keys=[REDIS_DIRTY, REDIS_WRITING], args=[10 * FLUSH_BATCH, now, now + WRITE_LEASE])
+        if not user_ids:
+            return 0
+        return len(user_ids) - len(self._write(session_factory, user_ids))
+
+    def flush_user(self, user_id: int, session_factory):
+        deadline = time.monotonic() + WRITE_LEASE
+        while True:
+            now = time.time()
+            claimed = self._claim_user(keys=[REDIS_DIRTY, REDIS_WRITING], args=[user_id, now, now + WRITE_LEASE])
+            if claimed == 0:
+                return
+            if claimed == 1:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError("cart could not be saved")
+            time.sleep(0.05)  # a flusher is writing this cart; its copy may be older
+        if self._write(session_factory, [user_id]):
+            raise RuntimeError("cart could not be saved")
+
+    def replay(self, session_factory) -> dict:
+        return {"segments": 0, "carts": 0}  # nothing is lost with the worker
+
+
+def _make_store():
+    if CART_STORE == "redis":
+        try:
+            return RedisCartStore(REDIS_URL)
+        except ImportError:
+            print("[cart_store] CART_STORE=redis but the redis package is not installed; using memory")
+        except Exception as e:
+            print(f"[cart_store] Redis unavailable ({e}); using memory")
+    if CART_STORE in ("memory", "redis"):
+        return MemoryCartStore(WAL_DIR)
+    return None
+
+
+store = _make_store()
+enabled = store is not None
+
+
+# ── API used by routers/cart.py and routers/orders.py ─────────────────────────
+
+def _response(db: Session, user_id: int, cart_id, lines: dict) -> dict:
+    """A schemas.Cart-shaped dict. Lines not yet flushed have no row, so item ids are 0."""
+    products = crud.get_cached_products(db, list({product_id for product_id, _ in lines}))
+    return {
+        "id": cart_id or 0,
+        "user_id": user_id,
+        "items": [{"id": 0, "product_id": product_id, "size": size, "quantity": quantity, "product": products[product_id]}
+                  for (product_id, size), quantity in lines.items() if product_id in products],
+    }
+
+
+def get_cart(db: Session, user_id: int) -> dict:
+    return _response(db, user_id, *store.state(user_id, lambda u: _load(db, u)))
+
+
+def add_item(db: Session, user_id: int, product_id: int, size: str, quantity: int) -> dict:
+    return _response(db, user_id, *store.set_quantity(user_id, product_id, size, quantity, lambda u: _load(db, u), add=True))
+
+
+def set_item(db: Session, user_id: int, product_id: int, size: str, quantity: int) -> dict:
+    return _response(db, user_id, *store.set_quantity(user_id, product_id, size, quantity, lambda u: _load(db, u)))
+
+
+def clear_cart(db: Session, user_id: int) -> dict:
+    return _response(db, user_id, *store.clear(user_id, lambda u: _load(db, u)))
+
+
+def flush_user(user_id: int):
+    """Write the user's cart now; called before checkout reads cart_items."""
+    import database
+
+    store.flush_user(user_id, database.get_sessionmaker())
+
+
+def checked_out(user_id: int):
+    """Checkout emptied the user's cart in the database; empty the stored copy too."""
+    store.clear(user_id, flushed=True)
+
+
+def flush() -> int:
+    import database
+
+    return store.flush(database.get_sessionmaker())
+
+
+def replay() -> dict:
+    import database
+
+    return store.replay(database.get_sessionmaker())
+
+
+async def run_flusher(interval: float = FLUSH_INTERVAL):
+    """Flush dirty carts every `interval` seconds in the threadpool; started by main.py's lifespan."""
+    from starlette.concurrency import run_in_threadpool
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(flush)
+        except Exception as e:
+            print(f"[cart_store] flush failed: {e}")
@@ -0,0 +1,146 @@
+"""
+cart_sweeper.py
+Deletes carts idle for longer than CART_TTL_DAYS (default 30), with their items.
+
+Every user who opens the cart page gets a cart row, so without this carts and cart_items
+only ever grow. A cart's updated_at is its last activity (crud.py touches it on every
+edit); the sweeper walks the ix_carts_updated_at index oldest first and deletes up to
+--batch-size carts per transaction, so row locks are held briefly and the app's cart
+writes are never blocked for long. On PostgreSQL candidate carts are locked with SKIP
+LOCKED, so several sweepers (or one per API worker) can run at once.
+
+Stock release: the store does not reserve stock for carts today. Deployments that do can
+register a hook in a module named by CART_SWEEPER_HOOK_MODULES:
+
+    @cart_sweeper.release_hook
+    def release(db, lines):  # lines: (cart_id, user_id, product_id, size, quantity)
+        ...
+
+Hooks run inside the batch transaction, so released stock and deleted carts commit together.
+Cart lines are only read when a hook is registered.
+
+Run periodically (cron, or --interval to keep running), or inside the API by setting
+CART_SWEEP_INTERVAL (seconds); its metrics are then exported at /metrics.
+Usage: python cart_sweeper.py [--ttl-days 30] [--batch-size 500] [--interval SECONDS]
+"""
+import asyncio
+import importlib
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+import metrics, models
+
+CART_TTL_DAYS = float(os.getenv("CART_TTL_DAYS", "30"))
+SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "0"))
+BATCH_SIZE = 500
+RELEASE_HOOKS = []
+
+
+def release_hook(fn):
+    """Register fn(db, lines) to be called with the lines of every batch of expired carts."""
+    RELEASE_HOOKS.append(fn)
+    return fn
+
+
+def load_hooks():
+    for name in os.getenv("CART_SWEEPER_HOOK_MODULES", "").split(","):
+        if name.strip():
+            importlib.import_module(name.strip())
+
+
+def sweep_batch(db: Session, cutoff: datetime, batch_size: int = BATCH_SIZE):
+    """Delete up to batch_size carts idle since before cutoff. Returns (carts, items) deleted."""
+    started = time.perf_counter()
+    pick = (
+        select(models.Cart.id)
+        .where(models.Cart.updated_at < cutoff)
+        .order_by(models.Cart.updated_at)
+        .limit(batch_size)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        pick = pick.with_for_update(skip_locked=True)
+    cart_ids = db.scalars(pick).all()
+    if not cart_ids:
+        db.rollback()
+        return 0, 0
+
+    # Re-checked by every statement: a cart edited since it was picked (SQLite has no row
+    # locks) keeps its items. On SQLite the first DELETE takes the write lock, so the
+    # set cannot change between the statements below.
+    expired = select(models.Cart.id).where(models.Cart.id.in_(cart_ids), models.Cart.updated_at < cutoff)
+    if RELEASE_HOOKS:
+        lines = db.execute(
+            select(models.CartItem.cart_id, models.Cart.user_id, models.CartItem.product_id,
+                   models.CartItem.size, models.CartItem.quantity)
+            .join(models.Cart, models.Cart.id == models.CartItem.cart_id)
+            .where(models.CartItem.cart_id.in_(expired))
+        ).all()
+        for hook in RELEASE_HOOKS:
+            hook(db, lines)
+
+    items = db.execute(delete(models.CartItem).where(models.CartItem.cart_id.in_(expired))).rowcount
+    carts = db.execute(
+        delete(models.Cart).where(models.Cart.id.in_(cart_ids), models.Cart.updated_at < cutoff)
+    ).rowcount
+    db.commit()
+    metrics.cart_sweep_batch_seconds.observe(time.perf_counter() - started)
+    metrics.carts_expired.inc(amount=carts)
+    metrics.cart_items_expired.inc(amount=items)
+    return carts, items
+
+
+def sweep(session_factory, ttl_days: float = CART_TTL_DAYS, batch_size: int = BATCH_SIZE) -> dict:
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+    totals = {"carts": 0, "items": 0, "batches": 0}
+    db = session_factory()
+    try:
+        while True:
+            carts, items = sweep_batch(db, cutoff, batch_size)
+            if not carts:
+                break
+            totals["carts"] += carts
+            totals["items"] += items
+            totals["batches"] += 1
+    finally:
+        db.close()
+    metrics.cart_sweeps.inc()
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    return totals
+
+
+async def run_periodically(session_factory, interval: float = SWEEP_INTERVAL):
+    """Sweep every `interval` seconds in the threadpool; started by main.py's lifespan."""
+    from starlette.concurrency import run_in_threadpool
+
+    load_hooks()
+    while True:
+        try:
+            stats = await run_in_threadpool(sweep, session_factory)
+            if stats["carts"]:
+                print(f"[cart_sweeper] deleted {stats['carts']} idle carts ({stats['items']} items)")
+        except Exception as e:
+            print(f"[cart_sweeper] sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Delete carts idle for longer than the TTL.")
+    parser.add_argument("--ttl-days", type=float, default=CART_TTL_DAYS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=0, help="sweep every N seconds instead of once")
+    args = parser.parse_args()
+
+    load_hooks()
+    while True:
+        stats = sweep(database.get_sessionmaker(), args.ttl_days, args.batch_size)
+        print(f"[✓] Deleted {stats['carts']} idle carts ({stats['items']} items) "
+              f"in {stats['batches']} batches, {stats['seconds']}s")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,209 @@
+"""
+catalog_import.py
+Bulk product import from CSV or JSONL, upserting by product title.
+
+Rows are validated in chunks against schemas.ProductCreate; bad rows are reported
+and skipped, good rows are loaded in a single transaction. On PostgreSQL the rows are
+COPY'd into a temp staging table and merged with two set-based statements; on other
+databases (SQLite) each chunk is merged with executemany UPDATE/INSERT batches.
+
+CSV columns: title, description, price, category, stock, images, sizes
+(images/sizes as a JSON list or "|"-separated).
+
+Usage: python catalog_import.py products.csv [--format csv|jsonl] [--chunk-size 5000]
+"""
+import csv
+import io
+import json
+from sqlalchemy import bindparam, insert, select, text, update
+from pydantic import ValidationError
+import models, schemas
+
+FIELDS = ("title", "description", "price", "category", "stock", "images", "sizes")
+MAX_REPORTED_ERRORS = 1000
+
+
+def _parse_list(value):
+    value = (value or "").strip()
+    if value.startswith("["):
+        return json.loads(value)
+    return [v.strip() for v in value.split("|") if v.strip()]
+
+
+def read_rows(stream, fmt: str = "csv"):
+    """Yield one dict per record from a text stream, or the ValueError for an unparsable record."""
+    if fmt == "jsonl":
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+        return
+
+    for row in csv.DictReader(stream):
+        try:
+            row["images"] = _parse_list(row.get("images"))
+            row["sizes"] = _parse_list(row.get("sizes"))
+        except ValueError as e:
+            yield e
+            continue
+        yield row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for number, row in enumerate(rows, start=1):
+        chunk.append((number, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validate(chunk, report):
+    """Return validated product dicts for a chunk, recording errors for the rest."""
+    valid = {}
+    for number, row in chunk:
+        if isinstance(row, Exception):
+            _error(report, number, f"could not parse record: {row}")
+            continue
+        try:
+            product = schemas.ProductCreate(**row).model_dump()
+        except ValidationError as e:
+            _error(report, number, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        except (TypeError, ValueError) as e:
+            _error(report, number, str(e))
+            continue
+        # Last occurrence of a title within the chunk wins
+        valid[product["title"]] = product
+    return list(valid.values())
+
+
+def _error(report, number, message):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": number, "error": message})
+
+
+# ── PostgreSQL: COPY into staging, then merge ─────────────────────────────────
+
+_insert_staging = text(
+    f"INSERT INTO product_import ({', '.join(FIELDS)}) VALUES"
+    " (:title, :description, :price, :category, :stock, CAST(:images AS JSON), CAST(:sizes AS JSON))"
+)
+
+
+def _copy_to_staging(conn, products):
+    """COPY a chunk into product_import with the driver's COPY API: copy_expert on psycopg2,
+    cursor.copy() on psycopg 3; drivers without one (pg8000, ...) get an executemany."""
+    driver = conn.dialect.driver
+    if driver not in ("psycopg2", "psycopg"):
+        conn.execute(_insert_staging, [
+            {**{f: p[f] for f in FIELDS}, "images": json.dumps(p["images"]), "sizes": json.dumps(p["sizes"])}
+            for p in products
+        ])
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for p in products:
+        writer.writerow([p["title"], p["description"], p["price"], p["category"], p["stock"],
+                         json.dumps(p["images"]), json.dumps(p["sizes"])])
+    sql = f"COPY product_import ({', '.join(FIELDS)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.cursor()
+    try:
+        if driver == "psycopg":
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def _merge_postgres(conn, chunks, report):
+    conn.execute(text(
+        "CREATE TEMP TABLE product_import ("
+        " title VARCHAR, description TEXT, price FLOAT, category VARCHAR, stock INTEGER,"
+        " images JSON, sizes JSON) ON COMMIT DROP"
+    ))
+    for products in chunks:
+        _copy_to_staging(conn, products)
+    # Titles repeated across chunks: keep the latest
+    conn.execute(text(
+        "DELETE FROM product_import a USING product_import b"
+        " WHERE a.title = b.title AND a.ctid < b.ctid"
+    ))
+
+    report["updated"] = conn.execute(text(
+        "UPDATE products p SET description = s.description, price = s.price, category = s.category,"
+        " stock = s.stock, images = s.images, sizes = s.sizes, version = p.version + 1,"
+        " updated_at = now()"
+        " FROM product_import s WHERE p.title = s.title"
+    )).rowcount
+    report["inserted"] = conn.execute(text(
+        f"INSERT INTO products ({', '.join(FIELDS)})"
+        f" SELECT {', '.join('s.' + f for f in FIELDS)} FROM product_import s"
+        " WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.title = s.title)"
+    )).rowcount
+
+
+# ── Other databases: executemany per chunk ────────────────────────────────────
+
+def _merge_batched(conn, chunks, report):
+    table = models.Product.__table__
+    update_stmt = (
+        update(table)
+        .where(table.c.title == bindparam("b_title"))
+        .values({**{f: bindparam(f) for f in FIELDS if f != "title"}, "version": table.c.version + 1})
+    )
+    for products in chunks:
+        titles = [p["title"] for p in products]
+        existing = set(conn.execute(select(table.c.title).where(table.c.title.in_(titles))).scalars())
+        updates = [dict(p, b_title=p["title"]) for p in products if p["title"] in existing]
+        inserts = [p for p in products if p["title"] not in existing]
+        if updates:
+            conn.execute(update_stmt, updates)
+        if inserts:
+            conn.execute(insert(table), inserts)
+        report["updated"] += len(updates)
+        report["inserted"] += len(inserts)
+
+
+def import_products(engine, rows, chunk_size: int = 5000):
+    """Validate and upsert an iterable of product dicts. Returns an import report."""
+    report = {"inserted": 0, "updated": 0, "error_count": 0, "errors": []}
+    chunks = (products for products in (_validate(c, report) for c in _chunks(rows, chunk_size)) if products)
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            _merge_postgres(conn, chunks, report)
+        else:
+            _merge_batched(conn, chunks, report)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import database
+
+    parser = argparse.ArgumentParser(description="Bulk import products from CSV/JSONL.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    started = time.perf_counter()
+    with open(args.path, newline="", encoding="utf-8") as f:
+        result = import_products(database.get_engine(), read_rows(f, fmt), chunk_size=args.chunk_size)
+
+    for err in result["errors"]:
+        print(f"  row {err['row']}: {err['error']}")
+    print(f"[✓] Inserted {result['inserted']}, updated {result['updated']}, "
+          f"rejected {result['error_count']} in {time.perf_counter() - started:.1f}s")
@@ -1,5 +1,7 @@
+from dotenv import load_dotenv
+load_dotenv()  # same DATABASE_URL as the server
 import models, database
 
 print("Creating database tables...")
-models.Base.metadata.create_all(bind=database.engine)
+models.Base.metadata.create_all(bind=database.get_engine())
 print("Tables created successfully.")
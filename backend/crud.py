@@ -1,14 +1,31 @@
-from sqlalchemy.orm import Session
-import models, schemas
+import base64
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy import Float, Integer, String, bindparam, cast, column, func, or_, select, tuple_, update, values
+from sqlalchemy.orm import Session, contains_eager, selectinload
+import models, schemas, analytics, cache, outbox, pubsub, promotions
 from auth import get_password_hash
 from fastapi import HTTPException, status
 
+# Statements for the per-request lookups, built once with bind parameters. Building a
+# Query per call costs more than the query itself on a warm pool; a prebuilt select()
+# skips construction and hits the engine's compiled-SQL cache directly.
+_user_by_id = select(models.User).where(models.User.id == bindparam("user_id")).limit(1)
+_user_by_email = select(models.User).where(models.User.email == bindparam("email")).limit(1)
+_product_by_id = select(models.Product).where(models.Product.id == bindparam("product_id")).limit(1)
+_cart_by_user = select(models.Cart).where(models.Cart.user_id == bindparam("user_id")).limit(1)
+_cart_item = select(models.CartItem).where(
+    models.CartItem.cart_id == bindparam("cart_id"),
+    models.CartItem.product_id == bindparam("product_id"),
+    models.CartItem.size == bindparam("size"),
+).limit(1)
+
 # User CRUD
 def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.execute(_user_by_id, {"user_id": user_id}).scalars().first()
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.execute(_user_by_email, {"email": email}).scalars().first()
 
 def get_user_by_phone(db: Session, phone: str):
     return db.query(models.User).filter(models.User.phone == phone).first()
@@ -31,13 +48,41 @@ def get_products(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Product).offset(skip).limit(limit).all()
 
 def get_product(db: Session, product_id: int):
-    return db.query(models.Product).filter(models.Product.id == product_id).first()
+    return db.execute(_product_by_id, {"product_id": product_id}).scalars().first()
+
+def get_cached_products(db: Session, product_ids) -> dict:
+    """schemas.Product by id for the given ids, from product_cache plus one IN query for
+    the rest. Ids of deleted products are simply absent."""
+    products = {}
+    for product_id in product_ids:
+        cached = cache.product_cache.get(product_id)
+        if cached is not cache.MISSING:
+            products[product_id] = cached
+    missing = [i for i in product_ids if i not in products]
+    if missing:
+        for db_product in db.query(models.Product).filter(models.Product.id.in_(missing)):
+            products[db_product.id] = schemas.Product.model_validate(db_product)
+            cache.product_cache.set(db_product.id, products[db_product.id])
+    return products
+
+def get_related_product_ids(db: Session, product_id: int) -> list:
+    """Related product ids precomputed by recommendations.py, best first (cached)."""
+    ids = cache.related_cache.get(product_id)
+    if ids is cache.MISSING:
+        ids = db.scalars(
+            select(models.ProductRelation.related_id)
+            .where(models.ProductRelation.product_id == product_id)
+            .order_by(models.ProductRelation.rank)
+        ).all()
+        cache.related_cache.set(product_id, ids)
+    return ids
 
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    cache.invalidate_products([db_product.id])
     return db_product
 
 def update_product(db: Session, product_id: int, product: schemas.ProductUpdate):
@@ -48,10 +93,13 @@ def update_product(db: Session, product_id: int, product: schemas.ProductUpdate)
     update_data = product.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_product, key, value)
+    db_product.version = (db_product.version or 0) + 1
+    pubsub.publish_after_commit(db, f"product:{product_id}", pubsub.stock_message(db_product))
     
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    cache.invalidate_products([product_id])
     return db_product
 
 def delete_product(db: Session, product_id: int):
@@ -59,70 +107,301 @@ def delete_product(db: Session, product_id: int):
     if db_product:
         db.delete(db_product)
         db.commit()
+        cache.invalidate_products([product_id])
     return db_product
 
+def bulk_update_products(db: Session, updates: List[schemas.ProductBulkItem]):
+    """Apply partial price/stock/category updates to many products in one statement.
+
+    All-or-nothing: if any product is missing, at a different version than expected, or
+    would go below zero stock, nothing is written and a 409 lists the offending ids.
+    Returns {product_id: new_version}.
+    """
+    ids = [u.id for u in updates]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Each product may appear only once per bulk update")
+
+    table = models.Product.__table__
+    rows = [u.model_dump() for u in updates]
+
+    if db.get_bind().dialect.name == "postgresql":
+        # UPDATE products SET ... FROM (VALUES ...) AS v(...) WHERE products.id = v.id
+        v = values(
+            column("id", Integer), column("price", Float), column("stock_delta", Integer),
+            column("category", String), column("version", Integer), name="v",
+        ).data([(r["id"], r["price"], r["stock_delta"], r["category"], r["version"]) for r in rows])
+        # Explicit casts: an all-NULL VALUES column would otherwise be typed as text
+        v_id, v_price, v_delta, v_category, v_version = (
+            cast(v.c.id, Integer), cast(v.c.price, Float), cast(v.c.stock_delta, Integer),
+            cast(v.c.category, String), cast(v.c.version, Integer),
+        )
+        stmt = (
+            update(table)
+            .where(table.c.id == v_id)
+            .where(or_(v_version.is_(None), table.c.version == v_version))
+            .where(table.c.stock + func.coalesce(v_delta, 0) >= 0)
+            .values(
+                price=func.coalesce(v_price, table.c.price),
+                stock=table.c.stock + func.coalesce(v_delta, 0),
+                category=func.coalesce(v_category, table.c.category),
+                version=table.c.version + 1,
+            )
+        )
+        matched = db.execute(stmt).rowcount
+    else:
+        # No UPDATE ... FROM VALUES here: one executemany of the same statement
+        b_price, b_delta = bindparam("b_price", type_=Float), bindparam("b_stock_delta", type_=Integer)
+        b_category, b_version = bindparam("b_category", type_=String), bindparam("b_version", type_=Integer)
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .where(or_(b_version.is_(None), table.c.version == b_version))
+            .where(table.c.stock + func.coalesce(b_delta, 0) >= 0)
+            .values(
+                price=func.coalesce(b_price, table.c.price),
+                stock=table.c.stock + func.coalesce(b_delta, 0),
+                category=func.coalesce(b_category, table.c.category),
+                version=table.c.version + 1,
+            )
+        )
+        matched = db.execute(stmt, [{f"b_{k}": val for k, val in r.items()} for r in rows]).rowcount
+
+    if matched != len(rows):
+        db.rollback()
+        current = {row.id: row for row in db.query(models.Product.id, models.Product.version, models.Product.stock).filter(models.Product.id.in_(ids))}
+        missing, conflicts, insufficient = [], [], []
+        for u in updates:
+            row = current.get(u.id)
+            if row is None:
+                missing.append(u.id)
+            elif u.version is not None and row.version != u.version:
+                conflicts.append(u.id)
+            elif row.stock + (u.stock_delta or 0) < 0:
+                insufficient.append(u.id)
+        raise HTTPException(status_code=409, detail={
+            "message": "Bulk update rejected, nothing was changed",
+            "missing": missing,
+            "version_conflicts": conflicts,
+            "insufficient_stock": insufficient,
+        })
+
+    versions = {}
+    for row in db.query(models.Product.id, models.Product.version, models.Product.stock, models.Product.price).filter(models.Product.id.in_(ids)):
+        versions[row.id] = row.version
+        pubsub.publish_after_commit(db, f"product:{row.id}", pubsub.stock_message(row))
+    db.commit()
+    cache.invalidate_products(ids)
+    return versions
+
 # Order CRUD
-def create_order(db: Session, order: schemas.OrderCreate, user_id: int):
+def _place_order(db: Session, user_id: int, shipping_address: str, lines, coupon_code: Optional[str] = None):
+    """Check and deduct stock for (product, quantity, size) lines and add the order.
+
+    Promotions are applied by promotions.price_lines, the same pricing the cart shows, but
+    evaluated afresh rather than from the cart pricing cache.
+    Flushes but does not commit, so callers can fold more work into the same transaction.
+    """
+    coupon_code = promotions.normalize_code(coupon_code)
+    priced = promotions.price_lines(
+        db, [(product.id, product.category, product.price, quantity, size) for product, quantity, size in lines],
+        coupon_code, cached=False,
+    )
+    if coupon_code and priced.coupon_code is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired coupon code")
+
     # Calculate total price and verify stock
     total_price = 0.0
     db_order_items = []
     
-    for item in order.items:
-        product = get_product(db, item.product_id)
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        if product.stock < item.quantity:
+    for (product, quantity, size), line in zip(lines, priced.lines):
+        if product.stock < quantity:
             raise HTTPException(status_code=400, detail=f"Not enough stock for {product.title}")
         
         # Deduct stock
-        product.stock -= item.quantity
+        product.stock -= quantity
         
-        # Create order item
+        # Create order item; the price paid per unit, so revenue figures stay net of discounts
+        unit_price = product.price - line.discount / quantity if line.discount else product.price
         db_item = models.OrderItem(
-            product_id=product.id,
-            quantity=item.quantity,
-            size=item.size,
-            price=product.price # Snapshot price
+            product=product,
+            quantity=quantity,
+            size=size,
+            price=unit_price # Snapshot price
         )
         db_order_items.append(db_item)
-        total_price += product.price * item.quantity
+        total_price += unit_price * quantity
 
+    # created_at is set here rather than by the server so the analytics buckets
+    # written now match the ones later status changes are counted against
     db_order = models.Order(
         user_id=user_id,
-        total_price=total_price,
-        shipping_address=order.shipping_address,
-        status="Pending"
+        total_price=round(total_price, 2),
+        shipping_address=shipping_address,
+        discount_total=priced.discount,
+        coupon_code=priced.coupon_code,
+        status="Pending",
+        created_at=datetime.now(timezone.utc),
+        items=db_order_items,
     )
     db.add(db_order)
+    db.flush()
+    analytics.record_order(db, db_order)
+    outbox.enqueue(db, "order.created", {
+        "order_id": db_order.id,
+        "user_id": user_id,
+        "product_ids": sorted({item.product_id for item in db_order_items}),
+    })
+    for product, _, _ in lines:
+        pubsub.publish_after_commit(db, f"product:{product.id}", pubsub.stock_message(product))
+    pubsub.publish_after_commit(db, "orders", {
+        "type": "order.created", "order_id": db_order.id, "status": db_order.status, "total_price": db_order.total_price,
+    })
+    return db_order
+
+def create_order(db: Session, order: schemas.OrderCreate, user_id: int):
+    lines = []
+    for item in order.items:
+        product = get_product(db, item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+        lines.append((product, item.quantity, item.size))
+
+    db_order = _place_order(db, user_id, order.shipping_address, lines, order.coupon_code)
     db.commit()
+    cache.invalidate_products([product.id for product, _, _ in lines])
     db.refresh(db_order)
-    
-    # Associate items with order
-    for item in db_order_items:
-        item.order_id = db_order.id
-        db.add(item)
-    
+    return db_order
+
+def create_order_from_cart(db: Session, user_id: int, shipping_address: str, coupon_code: Optional[str] = None):
+    """Turn the user's cart into an order and empty the cart, in one transaction."""
+    # One joined query for the cart lines and their products; on PostgreSQL the
+    # product rows stay locked until commit so concurrent checkouts can't oversell.
+    cart_items = (
+        db.query(models.CartItem)
+        .join(models.Cart, models.Cart.id == models.CartItem.cart_id)
+        .join(models.CartItem.product)
+        .options(contains_eager(models.CartItem.product))
+        .filter(models.Cart.user_id == user_id)
+        .order_by(models.CartItem.product_id)
+        .with_for_update(of=models.Product)
+        .all()
+    )
+    if not cart_items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    product_ids = [i.product_id for i in cart_items]
+    db_order = _place_order(db, user_id, shipping_address, [(i.product, i.quantity, i.size) for i in cart_items], coupon_code)
+    db.query(models.CartItem).filter(models.CartItem.cart_id == cart_items[0].cart_id).delete(synchronize_session=False)
     db.commit()
+    cache.invalidate_products(product_ids)
     db.refresh(db_order)
     return db_order
 
 def get_orders(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Order).offset(skip).limit(limit).all()
 
-def get_user_orders(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).offset(skip).limit(limit).all()
+def get_user_orders(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 50):
+    """A user's orders newest first, live and archived alike, paged by (created_at, id).
+
+    Each table is read with the same keyset condition off its (user_id, created_at, id)
+    index and the two pages are merged. Returns (orders, next_cursor) like query_orders.
+    """
+    position = decode_order_cursor(cursor) if cursor else None
+    merged = []
+    for model in (models.Order, models.ArchivedOrder):
+        query = db.query(model).filter(model.user_id == user_id)
+        if position:
+            query = query.filter(tuple_(model.created_at, model.id) < tuple_(*position))
+        merged.extend(
+            query.options(selectinload(model.items))
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(limit + 1)
+        )
+    merged.sort(key=lambda o: (o.created_at, o.id), reverse=True)
+    next_cursor = encode_order_cursor(merged[limit - 1]) if len(merged) > limit else None
+    return merged[:limit], next_cursor
+
+def encode_order_cursor(order: models.Order) -> str:
+    return base64.urlsafe_b64encode(f"{order.created_at.isoformat()}|{order.id}".encode()).decode()
+
+def decode_order_cursor(cursor: str):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def query_orders(db: Session, status: Optional[str] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None, user_id: Optional[int] = None,
+                 cursor: Optional[str] = None, limit: int = 50):
+    """Newest-first orders matching the filters, paged by (created_at, id) instead of OFFSET.
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    query = db.query(models.Order)
+    if status:
+        query = query.filter(models.Order.status == status)
+    if user_id is not None:
+        query = query.filter(models.Order.user_id == user_id)
+    if start:
+        query = query.filter(models.Order.created_at >= start)
+    if end:
+        query = query.filter(models.Order.created_at < end)
+    if cursor:
+        created_at, order_id = decode_order_cursor(cursor)
+        query = query.filter(tuple_(models.Order.created_at, models.Order.id) < tuple_(created_at, order_id))
+
+    orders = (
+        query.options(selectinload(models.Order.items))
+        .order_by(models.Order.created_at.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = encode_order_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+def bulk_update_order_status(db: Session, order_ids: List[int], status: str, from_status: Optional[str] = None):
+    """Move many orders to `status` with a single UPDATE. Returns the number of orders changed."""
+    query = db.query(models.Order.id, models.Order.created_at, models.Order.status).filter(
+        models.Order.id.in_(order_ids), models.Order.status != status
+    )
+    if from_status:
+        query = query.filter(models.Order.status == from_status)
+    # Lock the rows so the funnel deltas below match what the UPDATE changes
+    rows = query.with_for_update().all()
+    if not rows:
+        return 0
+
+    db.query(models.Order).filter(models.Order.id.in_([row.id for row in rows])).update(
+        {models.Order.status: status}, synchronize_session=False
+    )
+    analytics.record_status_changes(db, [(row.created_at, row.status, status) for row in rows])
+    outbox.enqueue_many(db, "order.status_changed", [
+        {"order_id": row.id, "old_status": row.status, "status": status} for row in rows
+    ])
+    pubsub.publish_after_commit(db, "orders", {"type": "order.status", "order_ids": [row.id for row in rows], "status": status})
+    db.commit()
+    return len(rows)
 
 def update_order_status(db: Session, order_id: int, status: str):
     order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if order:
+        old_status = order.status
         order.status = status
+        analytics.record_status_change(db, order, old_status)
+        if old_status != status:
+            outbox.enqueue(db, "order.status_changed", {"order_id": order.id, "old_status": old_status, "status": status})
+            pubsub.publish_after_commit(db, "orders", {"type": "order.status", "order_ids": [order.id], "status": status})
         db.commit()
         db.refresh(order)
     return order
 
 # Cart CRUD
 def get_cart(db: Session, user_id: int):
-    return db.query(models.Cart).filter(models.Cart.user_id == user_id).first()
+    return db.execute(_cart_by_user, {"user_id": user_id}).scalars().first()
+
+def _get_cart_item(db: Session, cart_id: int, product_id: int, size: str):
+    return db.execute(_cart_item, {"cart_id": cart_id, "product_id": product_id, "size": size}).scalars().first()
 
 def create_cart(db: Session, user_id: int):
     db_cart = models.Cart(user_id=user_id)
@@ -137,11 +416,7 @@ def add_to_cart(db: Session, user_id: int, item: schemas.CartItemCreate):
         cart = create_cart(db, user_id)
     
     # Check if item already exists
-    db_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart.id,
-        models.CartItem.product_id == item.product_id,
-        models.CartItem.size == item.size
-    ).first()
+    db_item = _get_cart_item(db, cart.id, item.product_id, item.size)
 
     if db_item:
         db_item.quantity += item.quantity
@@ -153,7 +428,8 @@ def add_to_cart(db: Session, user_id: int, item: schemas.CartItemCreate):
             size=item.size
         )
         db.add(db_item)
-    
+    cart.updated_at = func.now()
+
     db.commit()
     db.refresh(cart)
     return cart
@@ -163,14 +439,11 @@ def remove_from_cart(db: Session, user_id: int, product_id: int, size: str):
     if not cart:
         return None
     
-    db_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart.id,
-        models.CartItem.product_id == product_id,
-        models.CartItem.size == size
-    ).first()
+    db_item = _get_cart_item(db, cart.id, product_id, size)
 
     if db_item:
         db.delete(db_item)
+        cart.updated_at = func.now()
         db.commit()
         db.refresh(cart)
     return cart
@@ -183,14 +456,11 @@ def update_cart_item(db: Session, user_id: int, product_id: int, size: str, quan
     if quantity <= 0:
         return remove_from_cart(db, user_id, product_id, size)
 
-    db_item = db.query(models.CartItem).filter(
-        models.CartItem.cart_id == cart.id,
-        models.CartItem.product_id == product_id,
-        models.CartItem.size == size
-    ).first()
+    db_item = _get_cart_item(db, cart.id, product_id, size)
 
     if db_item:
         db_item.quantity = quantity
+        cart.updated_at = func.now()
         db.commit()
         db.refresh(cart)
     return cart
@@ -199,6 +469,55 @@ def clear_cart(db: Session, user_id: int):
     cart = get_cart(db, user_id)
     if cart:
         db.query(models.CartItem).filter(models.CartItem.cart_id == cart.id).delete()
+        cart.updated_at = func.now()
         db.commit()
         db.refresh(cart)
     return cart
+
+# Promotion CRUD
+def get_promotions(db: Session):
+    return db.query(models.Promotion).order_by(models.Promotion.id).all()
+
+def get_promotion(db: Session, promotion_id: int):
+    return db.query(models.Promotion).filter(models.Promotion.id == promotion_id).first()
+
+def _check_promotion(promotion: schemas.PromotionCreate):
+    if promotion.kind not in models.PROMOTION_KINDS:
+        raise HTTPException(status_code=400, detail=f"Invalid kind. Must be one of: {', '.join(models.PROMOTION_KINDS)}")
+    if promotion.kind == "percent_off" and not 0 < promotion.value <= 100:
+        raise HTTPException(status_code=400, detail="percent_off value must be between 0 and 100")
+    if promotion.kind == "amount_off" and promotion.value <= 0:
+        raise HTTPException(status_code=400, detail="amount_off value must be positive")
+    if promotion.kind == "buy_x_get_y" and (promotion.buy_quantity < 1 or promotion.get_quantity < 1):
+        raise HTTPException(status_code=400, detail="buy_x_get_y needs buy_quantity and get_quantity of at least 1")
+
+def create_promotion(db: Session, promotion: schemas.PromotionCreate):
+    _check_promotion(promotion)
+    data = promotion.model_dump()
+    data["coupon_code"] = promotions.normalize_code(data["coupon_code"])
+    db_promotion = models.Promotion(**data)
+    db.add(db_promotion)
+    db.commit()
+    db.refresh(db_promotion)
+    promotions.invalidate()
+    return db_promotion
+
+def update_promotion(db: Session, promotion_id: int, promotion: schemas.PromotionCreate):
+    db_promotion = get_promotion(db, promotion_id)
+    if not db_promotion:
+        return None
+    _check_promotion(promotion)
+    for key, value in promotion.model_dump().items():
+        setattr(db_promotion, key, promotions.normalize_code(value) if key == "coupon_code" else value)
+    db.commit()
+    db.refresh(db_promotion)
+    promotions.invalidate()
+    return db_promotion
+
+def delete_promotion(db: Session, promotion_id: int):
+    db_promotion = get_promotion(db, promotion_id)
+    if db_promotion:
+        db.delete(db_promotion)
+        db.commit()
+        promotions.invalidate()
+    return db_promotion
@@ -7,7 +7,7 @@ import crud, models, schemas, database, auth
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/users/token")
 
 def get_db():
-    db = database.SessionLocal()
+    db = database.get_sessionmaker()()
     try:
         yield db
     finally:
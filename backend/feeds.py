@@ -0,0 +1,228 @@
+"""
+feeds.py
+Writes the product feed (Google-Shopping-style XML and CSV) and the sitemap for the
+whole catalog as gzip-compressed static files, served by the app at /feeds/.
+
+Products are split into chunks by id range (--chunk-size, FEED_CHUNK_SIZE, default 10000
+ids per chunk, well under the 50,000 URL sitemap limit). Each chunk k is three files:
+
+    products-0000k.xml.gz   RSS 2.0 items with g: attributes (Google Merchant Center)
+    products-0000k.csv.gz   the same fields as CSV
+    sitemap-0000k.xml.gz    product page URLs with <lastmod>
+
+plus sitemap.xml, the sitemap index to submit, and manifest.json with every chunk's
+product count and last change. Rows are read from a server-side cursor and written
+straight into gzip streams, so memory stays flat however big the catalog is. Each file
+is written to a temporary name and renamed into place, so readers never see half a file.
+
+Runs are incremental: only chunks holding a product whose updated_at is newer than the
+previous run (less FEED_OVERLAP_SECONDS, for transactions still in flight back then), or
+whose product count changed (inserts, deletes), are rewritten; chunks that became empty
+are removed. --full rewrites everything. Existing databases need
+migrate_add_product_updated_at.py first.
+
+Product links point at FEED_SITE_URL (the storefront, default http://localhost:5173),
+the sitemap index at FEEDS_URL (where /feeds/ is served, default
+http://localhost:8000/feeds); prices are in FEED_CURRENCY (default INR). Run it from one place only, after deploying
+and then periodically (cron, or --interval to keep running):
+Usage: python feeds.py [--full] [--chunk-size 10000] [--interval SECONDS]
+"""
+import csv
+import gzip
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+from sqlalchemy import and_, func, or_, select
+import models
+
+FEEDS_DIR = os.getenv("FEEDS_DIR", os.path.join(os.path.dirname(__file__), "feeds"))
+SITE_URL = os.getenv("FEED_SITE_URL", "http://localhost:5173").rstrip("/")
+# Absolute base for the feed files themselves (sitemap index entries); the API's address
+FEEDS_URL = os.getenv("FEEDS_URL", "http://localhost:8000/feeds").rstrip("/")
+CURRENCY = os.getenv("FEED_CURRENCY", "INR")
+CHUNK_SIZE = int(os.getenv("FEED_CHUNK_SIZE", "10000"))
+OVERLAP_SECONDS = int(os.getenv("FEED_OVERLAP_SECONDS", "300"))
+TITLE = "Online Women's Cloth Store"
+FETCH_ROWS = 2000
+
+CSV_FIELDS = ("id", "title", "description", "link", "image_link", "price", "availability", "product_type", "condition")
+MANIFEST = "manifest.json"
+
+
+def _utc(ts):
+    if ts is None:
+        return None
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def _absolute(url: str) -> str:
+    if not url or url.startswith(("http://", "https://")):
+        return url or ""
+    return f"{SITE_URL}/{url.lstrip('/')}"
+
+
+def _fields(row) -> dict:
+    images = row.images or []
+    return {
+        "id": str(row.id),
+        "title": row.title or "",
+        "description": row.description or "",
+        "link": f"{SITE_URL}/products/{row.id}",
+        "image_link": _absolute(images[0]) if images else "",
+        "price": f"{row.price or 0:.2f} {CURRENCY}",
+        "availability": "in_stock" if (row.stock or 0) > 0 else "out_of_stock",
+        "product_type": row.category or "",
+        "condition": "new",
+    }
+
+
+def _chunk_name(kind: str, chunk: int, ext: str) -> str:
+    return f"{kind}-{chunk + 1:05d}.{ext}.gz"
+
+
+def _open(path: str):
+    return gzip.open(path + ".tmp", "wt", encoding="utf-8", newline="", compresslevel=6)
+
+
+def _write_chunk(out_dir: str, chunk: int, rows) -> dict:
+    """Write the three files of one chunk from its rows (ordered by id)."""
+    names = [_chunk_name("products", chunk, "xml"), _chunk_name("products", chunk, "csv"),
+             _chunk_name("sitemap", chunk, "xml")]
+    paths = [os.path.join(out_dir, name) for name in names]
+    count, last_change = 0, None
+    with _open(paths[0]) as feed, _open(paths[1]) as table, _open(paths[2]) as sitemap:
+        feed.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0">\n<channel>\n'
+                   f"<title>{escape(TITLE)}</title>\n<link>{escape(SITE_URL)}</link>\n"
+                   f"<description>{escape(TITLE)} products</description>\n")
+        writer = csv.writer(table)
+        writer.writerow(CSV_FIELDS)
+        sitemap.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for row in rows:
+            f = _fields(row)
+            feed.write(
+                f"<item><g:id>{f['id']}</g:id><title>{escape(f['title'])}</title>"
+                f"<description>{escape(f['description'])}</description><link>{escape(f['link'])}</link>"
+                f"<g:image_link>{escape(f['image_link'])}</g:image_link><g:price>{f['price']}</g:price>"
+                f"<g:availability>{f['availability']}</g:availability>"
+                f"<g:product_type>{escape(f['product_type'])}</g:product_type>"
+                f"<g:condition>{f['condition']}</g:condition></item>\n"
+            )
+            writer.writerow([f[k] for k in CSV_FIELDS])
+            updated = _utc(row.updated_at)
+            lastmod = f"<lastmod>{updated:%Y-%m-%d}</lastmod>" if updated else ""
+            sitemap.write(f"<url><loc>{escape(f['link'])}</loc>{lastmod}</url>\n")
+            count += 1
+            if updated and (last_change is None or updated > last_change):
+                last_change = updated
+        feed.write("</channel>\n</rss>\n")
+        sitemap.write("</urlset>\n")
+    for path in paths:
+        os.replace(path + ".tmp", path)
+    return {"count": count, "updated_at": last_change.isoformat() if last_change else None}
+
+
+def _remove_chunk(out_dir: str, chunk: int):
+    for name in (_chunk_name("products", chunk, "xml"), _chunk_name("products", chunk, "csv"),
+                 _chunk_name("sitemap", chunk, "xml")):
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def _write_index(out_dir: str, chunks: dict):
+    path = os.path.join(out_dir, "sitemap.xml")
+    with open(path + ".tmp", "w", encoding="utf-8") as index:
+        index.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for chunk in sorted(chunks):
+            lastmod = chunks[chunk]["updated_at"]
+            index.write(f"<sitemap><loc>{escape(FEEDS_URL)}/{_chunk_name('sitemap', chunk, 'xml')}</loc>"
+                        + (f"<lastmod>{lastmod[:10]}</lastmod>" if lastmod else "") + "</sitemap>\n")
+        index.write("</sitemapindex>\n")
+    os.replace(path + ".tmp", path)
+
+
+def _read_manifest(out_dir: str):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def generate(engine, out_dir: str = FEEDS_DIR, chunk_size: int = CHUNK_SIZE, full: bool = False) -> dict:
+    """Bring the feed files in out_dir up to date. Returns what was rewritten."""
+    started = time.perf_counter()
+    run_at = datetime.now(timezone.utc)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _read_manifest(out_dir)
+    if manifest is None or manifest.get("chunk_size") != chunk_size:
+        full = True
+    known = {int(k): v for k, v in manifest["chunks"].items()} if manifest else {}
+    previous = {} if full else known
+
+    product = models.Product.__table__
+    chunk_of = (product.c.id // chunk_size).label("chunk")
+    with engine.connect() as conn:
+        counts = dict(conn.execute(select(chunk_of, func.count()).group_by(chunk_of)).all())
+        if full:
+            dirty = set(counts)
+        else:
+            since = datetime.fromisoformat(manifest["generated_at"]) - timedelta(seconds=OVERLAP_SECONDS)
+            changed = conn.execute(select(chunk_of).where(product.c.updated_at >= since).distinct()).scalars()
+            dirty = set(changed) | {k for k in counts if previous.get(k, {}).get("count") != counts[k]}
+            dirty &= set(counts)
+        emptied = set(known) - set(counts)
+
+        chunks = dict(previous)
+        if dirty:
+            stmt = select(product.c.id, product.c.title, product.c.description, product.c.price, product.c.category,
+                          product.c.stock, product.c.images, product.c.updated_at).order_by(product.c.id)
+            if not full:
+                # One id range scan per changed chunk, all through the same cursor
+                stmt = stmt.where(or_(*(
+                    and_(product.c.id >= k * chunk_size, product.c.id < (k + 1) * chunk_size) for k in sorted(dirty)
+                )))
+            result = conn.execution_options(yield_per=FETCH_ROWS).execute(stmt)
+            for chunk, rows in itertools.groupby(result, key=lambda row: row.id // chunk_size):
+                chunks[chunk] = _write_chunk(out_dir, chunk, rows)
+
+    for chunk in emptied:
+        _remove_chunk(out_dir, chunk)
+        chunks.pop(chunk, None)
+    _write_index(out_dir, chunks)
+
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"generated_at": run_at.isoformat(), "chunk_size": chunk_size,
+                   "chunks": {str(k): v for k, v in sorted(chunks.items())}}, f, indent=1)
+    os.replace(path + ".tmp", path)
+    return {"chunks": len(chunks), "rewritten": len(dirty), "removed": len(emptied), "full": full,
+            "products": sum(counts.values()), "seconds": round(time.perf_counter() - started, 2)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Write the product feed and sitemap files.")
+    parser.add_argument("--full", action="store_true", help="rewrite every chunk, not just changed ones")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--interval", type=float, default=0, help="run every N seconds instead of once")
+    args = parser.parse_args()
+
+    full = args.full
+    while True:
+        stats = generate(database.get_engine(), chunk_size=args.chunk_size, full=full)
+        print(f"[✓] Feeds: {stats['products']} products in {stats['chunks']} chunks, rewrote "
+              f"{stats['rewritten']}, removed {stats['removed']}, {stats['seconds']}s")
+        if not args.interval:
+            break
+        full = False
+        time.sleep(args.interval)
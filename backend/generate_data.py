@@ -0,0 +1,278 @@
+"""
+generate_data.py
+Synthetic, production-sized data for scale testing: users, products with sizes and
+images, carts and orders, with realistic skew.
+
+- Product popularity and buyer activity follow Zipf-like curves: a few SKUs and a few
+  heavy buyers account for most order lines, as in real shops.
+- Orders are spread over --days, ids increase with time, and the status follows age
+  (recent orders Pending, old ones Delivered).
+- Orders have 1-8 lines; carts mostly a few items, about 1% hold 100.
+
+Everything is drawn from one NumPy generator seeded with --seed, so the same arguments on
+an empty database produce the same rows, with timestamps relative to the time of the run
+(use --reset for comparable benchmark runs).
+Rows get explicit ids after the current maximum and are written in one transaction:
+COPY on PostgreSQL (sequences are moved past the new ids afterwards), executemany
+elsewhere. All generated users share the password GENERATED_PASSWORD.
+
+Rollups and recommendations are derived data; --rebuild-derived recomputes them at the end.
+
+Usage: python generate_data.py [--users 10000] [--products 5000] [--orders 100000] [--carts 2000]
+                               [--days 365] [--seed 42] [--reset] [--rebuild-derived]
+"""
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from sqlalchemy import func, insert, select, text
+import auth, models
+
+GENERATED_PASSWORD = "password123"
+ORDER_CHUNK = 100_000
+
+CATEGORIES = {
+    "Tops": ["XS", "S", "M", "L", "XL"],
+    "Dresses": ["XS", "S", "M", "L"],
+    "Bottoms": ["24", "25", "26", "27", "28", "29", "30"],
+    "Outerwear": ["S", "M", "L", "XL"],
+    "Ethnic Wear": ["S", "M", "L", "XL", "XXL"],
+}
+ADJECTIVES = ["Classic", "Floral", "Linen", "Oversized", "Cropped", "Pleated", "Silk", "Denim", "Cozy", "Elegant"]
+NOUNS = {
+    "Tops": ["Tee", "Blouse", "Tank", "Shirt"],
+    "Dresses": ["Maxi Dress", "Wrap Dress", "Gown", "Sundress"],
+    "Bottoms": ["Jeans", "Skirt", "Trousers", "Shorts"],
+    "Outerwear": ["Jacket", "Coat", "Cardigan", "Blazer"],
+    "Ethnic Wear": ["Kurti", "Saree", "Lehenga", "Anarkali"],
+}
+
+
+def zipf_weights(n: int, exponent: float, rng) -> np.ndarray:
+    """Probabilities for n items where the k-th most popular has weight k^-exponent, in random id order."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+# ── Writing ───────────────────────────────────────────────────────────────────
+
+# PostgreSQL drivers with a COPY API; others get executemany batches like SQLite
+COPY_DRIVERS = ("psycopg2", "psycopg")
+
+
+def _uses_copy(conn) -> bool:
+    return conn.dialect.name == "postgresql" and conn.dialect.driver in COPY_DRIVERS
+
+
+def _copy(conn, table: str, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(json.dumps(v) if isinstance(v, list) else ("" if v is None else v) for v in row)
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.cursor()
+    try:
+        if conn.dialect.driver == "psycopg":
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def write_rows(conn, model, columns, rows, batch_size: int = 50_000):
+    """Bulk-insert an iterable of tuples: COPY on PostgreSQL (psycopg2 or psycopg 3),
+    executemany batches elsewhere."""
+    table = model.__table__
+    copy = _uses_copy(conn)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _flush(conn, table, columns, batch, copy)
+            batch = []
+    if batch:
+        _flush(conn, table, columns, batch, copy)
+
+
+def _flush(conn, table, columns, batch, copy):
+    if copy:
+        _copy(conn, table.name, columns, batch)
+    else:
+        conn.execute(insert(table), [dict(zip(columns, row)) for row in batch])
+
+
+def _next_id(conn, model) -> int:
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _timestamps(base: datetime, seconds: np.ndarray, copy: bool):
+    """Datetimes, or ISO strings for COPY's CSV."""
+    if copy:
+        return [(base + timedelta(seconds=int(s))).isoformat() for s in seconds]
+    return [base + timedelta(seconds=int(s)) for s in seconds]
+
+
+# ── Generators ────────────────────────────────────────────────────────────────
+
+def generate_products(conn, n: int, rng) -> dict:
+    first = _next_id(conn, models.Product)
+    names = list(CATEGORIES)
+    category = rng.integers(0, len(names), n)
+    price = np.round(rng.lognormal(np.log(40), 0.5, n), 2)
+    stock = rng.integers(0, 500, n)
+    adjective = rng.integers(0, len(ADJECTIVES), n)
+    noun = rng.integers(0, 4, n)
+
+    def rows():
+        for i in range(n):
+            pid, cat = first + i, names[category[i]]
+            yield (pid, f"{ADJECTIVES[adjective[i]]} {NOUNS[cat][noun[i]]} #{pid}",
+                   f"Generated {cat.lower()} item for scale testing.", float(price[i]), cat, int(stock[i]),
+                   [f"https://placehold.co/600x800?text=Product+{pid}"], CATEGORIES[cat], 1)
+
+    write_rows(conn, models.Product,
+               ("id", "title", "description", "price", "category", "stock", "images", "sizes", "version"), rows())
+    n_sizes = np.array([len(CATEGORIES[c]) for c in names])[category]
+    return {"ids": np.arange(first, first + n), "price": price, "category": category, "n_sizes": n_sizes}
+
+
+def generate_users(conn, n: int) -> np.ndarray:
+    first = _next_id(conn, models.User)
+    hashed = auth.get_password_hash(GENERATED_PASSWORD)
+    write_rows(conn, models.User, ("id", "email", "hashed_password", "is_admin", "is_verified"),
+               ((first + i, f"user{first + i}@example.test", hashed, False, True) for i in range(n)))
+    return np.arange(first, first + n)
+
+
+def _sizes_for(products: dict, product_idx: np.ndarray, rng) -> list:
+    names = list(CATEGORIES)
+    pick = (rng.random(len(product_idx)) * products["n_sizes"][product_idx]).astype(np.int64)
+    return [CATEGORIES[names[c]][s] for c, s in zip(products["category"][product_idx].tolist(), pick.tolist())]
+
+
+def generate_orders(conn, n: int, days: int, user_ids, products: dict, rng) -> int:
+    """Write n orders and their items in chunks; returns the number of order items."""
+    copy = _uses_copy(conn)
+    first_order = _next_id(conn, models.Order)
+    buyer_p = zipf_weights(len(user_ids), 0.8, rng)
+    product_p = zipf_weights(len(products["ids"]), 1.1, rng)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    base = now - timedelta(days=days)
+    # Sorted so that order ids increase with created_at, like real inserts
+    offsets = np.sort(rng.integers(0, days * 86400, n))
+    total_items = 0
+
+    for start in range(0, n, ORDER_CHUNK):
+        size = min(ORDER_CHUNK, n - start)
+        order_ids = np.arange(first_order + start, first_order + start + size)
+        seconds = offsets[start:start + size]
+        age_days = (days * 86400 - seconds) / 86400
+        status = np.select([age_days > 14, age_days > 5, age_days > 2], ["Delivered", "Shipped", "Dispatched"], "Pending")
+        buyers = rng.choice(user_ids, size=size, p=buyer_p)
+
+        lines = np.minimum(rng.geometric(0.55, size), 8)
+        line_order = np.repeat(np.arange(size), lines)
+        line_product = rng.choice(len(products["ids"]), size=len(line_order), p=product_p)
+        quantity = np.minimum(rng.geometric(0.7, len(line_order)), 5)
+        price = products["price"][line_product]
+        totals = np.round(np.bincount(line_order, weights=price * quantity, minlength=size), 2)
+
+        created = _timestamps(base, seconds, copy)
+        write_rows(conn, models.Order, ("id", "user_id", "status", "total_price", "shipping_address", "created_at"),
+                   zip(order_ids.tolist(), buyers.tolist(), status.tolist(), totals.tolist(),
+                       (f"{int(u)} Generated Street, Test City" for u in buyers), created))
+        write_rows(conn, models.OrderItem, ("order_id", "product_id", "quantity", "size", "price"),
+                   zip(order_ids[line_order].tolist(), products["ids"][line_product].tolist(), quantity.tolist(),
+                       _sizes_for(products, line_product, rng), price.tolist()))
+        total_items += len(line_order)
+        print(f"  orders {start + size}/{n}")
+    return total_items
+
+
+def generate_carts(conn, n: int, user_ids, products: dict, rng) -> int:
+    copy = _uses_copy(conn)
+    first_cart = _next_id(conn, models.Cart)
+    owners = rng.choice(user_ids, size=min(n, len(user_ids)), replace=False)
+    n = len(owners)
+    product_p = zipf_weights(len(products["ids"]), 1.1, rng)
+    # Mostly small carts, and a few very large ones
+    counts = np.where(rng.random(n) < 0.01, 100, np.minimum(rng.geometric(0.3, n), 30))
+    counts = np.minimum(counts, len(products["ids"]))
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    updated = _timestamps(now - timedelta(days=60), rng.integers(0, 60 * 86400, n), copy)
+
+    write_rows(conn, models.Cart, ("id", "user_id", "created_at", "updated_at"),
+               ((first_cart + i, int(owners[i]), updated[i], updated[i]) for i in range(n)))
+
+    def items():
+        for i in range(n):
+            # Distinct products per cart so (cart, product, size) stays unique
+            idx = rng.choice(len(products["ids"]), size=int(counts[i]), replace=False, p=product_p)
+            for product_id, size in zip(products["ids"][idx].tolist(), _sizes_for(products, idx, rng)):
+                yield first_cart + i, product_id, int(rng.integers(1, 3)), size
+    write_rows(conn, models.CartItem, ("cart_id", "product_id", "quantity", "size"), items())
+    return int(counts.sum())
+
+
+def _advance_sequences(conn):
+    for table in ("users", "products", "orders", "order_items", "carts", "cart_items"):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+
+
+def generate(engine, users: int, products: int, orders: int, carts: int, days: int = 365, seed: int = 42) -> dict:
+    rng = np.random.default_rng(seed)
+    stats = {}
+    with engine.begin() as conn:
+        started = time.perf_counter()
+        product_info = generate_products(conn, products, rng)
+        user_ids = generate_users(conn, users)
+        stats["order_items"] = generate_orders(conn, orders, days, user_ids, product_info, rng) if orders else 0
+        stats["cart_items"] = generate_carts(conn, carts, user_ids, product_info, rng) if carts else 0
+        if conn.dialect.name == "postgresql":
+            _advance_sequences(conn)
+    stats.update(users=users, products=products, orders=orders, carts=min(carts, users),
+                 seconds=round(time.perf_counter() - started, 1))
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset.")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--carts", type=int, default=2_000)
+    parser.add_argument("--days", type=int, default=365, help="spread orders over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    parser.add_argument("--rebuild-derived", action="store_true", help="rebuild analytics rollups and recommendations")
+    args = parser.parse_args()
+
+    if args.reset:
+        models.Base.metadata.drop_all(bind=database.get_engine())
+    models.Base.metadata.create_all(bind=database.get_engine())
+
+    stats = generate(database.get_engine(), args.users, args.products, args.orders, args.carts, args.days, args.seed)
+    print(f"[✓] {stats['users']} users, {stats['products']} products, {stats['orders']} orders "
+          f"({stats['order_items']} items), {stats['carts']} carts ({stats['cart_items']} items) in {stats['seconds']}s")
+
+    if args.rebuild_derived:
+        import analytics, recommendations
+
+        session = database.get_sessionmaker()()
+        try:
+            analytics.rebuild(session)
+        finally:
+            session.close()
+        print("[✓] Analytics rollups rebuilt.")
+        rel = recommendations.rebuild(database.get_engine())
+        print(f"[✓] {rel['relations']} product relations rebuilt.")
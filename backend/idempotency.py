@@ -0,0 +1,243 @@
+"""
+idempotency.py
+Idempotency-Key support for mutating endpoints (order creation, checkout, cart edits...).
+
+A client sends `Idempotency-Key: <uuid>` with a POST/PUT/PATCH/DELETE. The first request
+with a given key runs normally and its response is stored for IDEMPOTENCY_TTL_HOURS.
+Retries with the same key get the stored response back, marked `Idempotent-Replayed: true`,
+without running the endpoint again. A retry that arrives while the first request is still
+running waits for it instead of executing a second time. Reusing a key for a different
+request is rejected with 422.
+
+Keys are scoped to the bearer token's subject, so only authenticated requests are covered;
+requests without the header are passed straight through. 5xx responses are not stored,
+so a retry after a server error runs again.
+
+Purge expired keys (e.g. from cron):
+Usage: python idempotency.py purge
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from jose import JWTError, jwt
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+import auth, database, models
+
+HEADER = b"idempotency-key"
+METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# A claim with no response after this long is assumed to belong to a crashed worker
+STALE_AFTER = timedelta(seconds=float(os.getenv("IDEMPOTENCY_STALE_SECONDS", "120")))
+
+CLAIMED, REPLAY, IN_FLIGHT, MISMATCH = "claimed", "replay", "in_flight", "mismatch"
+
+# Requests this worker is currently executing, as (event loop, asyncio.Event), so local
+# duplicates wake up as soon as the first finishes instead of polling the database
+_local_inflight = {}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _aware(ts: datetime) -> datetime:
+    # SQLite hands timestamps back without tzinfo; they were written as UTC
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _owner(headers: dict):
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+def _claim(owner: str, key: str, fingerprint: str):
+    """Become the request that executes `key`, or report why not.
+
+    Returns (state, detail): the stored response for REPLAY, the claim's created_at for
+    CLAIMED (what _finish matches on, since a stale claim can be deleted and re-made
+    by a retry while its request is still running), None otherwise.
+    """
+    db = database.get_sessionmaker()()
+    try:
+        for _ in range(3):
+            now = _now()
+            existing = db.query(models.IdempotencyKey).filter_by(owner=owner, key=key).first()
+            if existing is not None:
+                stale = existing.status_code is None and _aware(existing.created_at) <= now - STALE_AFTER
+                if _aware(existing.expires_at) > now and not stale:
+                    if existing.fingerprint != fingerprint:
+                        return MISMATCH, None
+                    if existing.status_code is None:
+                        return IN_FLIGHT, None
+                    return REPLAY, (existing.status_code, existing.content_type, existing.response_body)
+                db.delete(existing)
+                db.commit()
+
+            db.add(models.IdempotencyKey(
+                owner=owner, key=key, fingerprint=fingerprint, created_at=now, expires_at=now + TTL,
+            ))
+            try:
+                db.commit()
+                return CLAIMED, now
+            except IntegrityError:
+                # Another request claimed it first; look again
+                db.rollback()
+        return IN_FLIGHT, None
+    finally:
+        db.close()
+
+
+def _finish(owner: str, key: str, claimed_at: datetime, status_code: int, content_type, body: bytes):
+    """Store the response for replay, or release the claim if it shouldn't be replayed.
+    A no-op if the claim was taken over as stale in the meantime."""
+    db = database.get_sessionmaker()()
+    try:
+        query = db.query(models.IdempotencyKey).filter_by(owner=owner, key=key, created_at=claimed_at, status_code=None)
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            text = None
+        if status_code >= 500 or text is None:
+            query.delete(synchronize_session=False)
+        else:
+            query.update({"status_code": status_code, "content_type": content_type, "response_body": text},
+                         synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_expired(db) -> int:
+    deleted = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.expires_at < _now()).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    return deleted
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status_code: int, content):
+    await _send_response(send, status_code, "application/json", json.dumps(content).encode())
+
+
+async def _send_response(send, status_code: int, content_type, body: bytes, extra_headers=()):
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode("latin-1")))
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METHODS:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        raw_key = headers.get(HEADER)
+        owner = _owner(headers) if raw_key else None
+        if not owner:
+            return await self.app(scope, receive, send)
+
+        key = raw_key.decode("latin-1")[:255]
+        body = await _read_body(receive)
+        fingerprint = hashlib.sha256(
+            b"\n".join([scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        state, stored = await run_in_threadpool(_claim, owner, key, fingerprint)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        delay = 0.05
+        while state == IN_FLIGHT and time.monotonic() < deadline:
+            loop, event = _local_inflight.get((owner, key), (None, None))
+            if loop is asyncio.get_running_loop():
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+            state, stored = await run_in_threadpool(_claim, owner, key, fingerprint)
+
+        if state == MISMATCH:
+            return await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
+        if state == IN_FLIGHT:
+            return await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is still in progress"})
+        if state == REPLAY:
+            status_code, content_type, text = stored
+            return await _send_response(send, status_code, content_type, text.encode("utf-8"),
+                                        [(b"idempotent-replayed", b"true")])
+
+        # CLAIMED: run the endpoint once, capturing what it sends
+        claimed_at = stored
+        event = asyncio.Event()
+        _local_inflight[(owner, key)] = (asyncio.get_running_loop(), event)
+        response = {"status": 500, "content_type": None, "body": []}
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            try:
+                await run_in_threadpool(_finish, owner, key, claimed_at, response["status"], response["content_type"],
+                                        b"".join(response["body"]))
+            finally:
+                if _local_inflight.get((owner, key), (None, None))[1] is event:
+                    del _local_inflight[(owner, key)]
+                event.set()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["purge"]:
+        print(__doc__)
+        sys.exit(1)
+    session = database.get_sessionmaker()()
+    try:
+        print(f"[✓] Purged {purge_expired(session)} expired idempotency keys.")
+    finally:
+        session.close()
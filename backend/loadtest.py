@@ -0,0 +1,280 @@
+"""
+loadtest.py
+Scenario-based load test of the API, run in-process against a freshly seeded database.
+
+Virtual users run a weighted mix of scenarios concurrently through an ASGI client, so
+requests go through the real middleware, routers, crud and database (sync endpoints
+in the threadpool, as under uvicorn) without a network hop:
+
+    browse     anonymous product list pages, product details and related products
+    login      password login
+    cart       view cart, add items, change quantities, remove an item
+    checkout   fill the cart and check out with an Idempotency-Key
+
+Each virtual user has its own seeded RNG and runs a fixed number of iterations, so the
+same arguments produce the same request mix. Reported per endpoint: requests, errors,
+p50/p95/p99 latency; plus overall throughput. Save a run as a baseline and compare later
+runs against it: an endpoint whose p95 grows by more than --threshold is a regression and
+the exit status is 1.
+
+By default a temporary SQLite database is used. --database-url runs against another
+database (e.g. a local Postgres); its tables are dropped and recreated with --reset.
+
+Usage: python loadtest.py [--users 20] [--iterations 25] [--products 500] [--seed 1]
+                          [--database-url URL [--reset]] [--save-baseline FILE] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+SCENARIOS = {"browse": 60, "login": 10, "cart": 20, "checkout": 10}
+PASSWORD = "loadtest-password"
+SIZES = ["S", "M", "L"]
+# Endpoints with fewer requests than this in either run are too noisy to compare on p95
+MIN_SAMPLES = 30
+
+
+# ── Setup ─────────────────────────────────────────────────────────────────────
+
+def prepare_database(url: str, reset: bool):
+    """Point database.py at `url` before the app is imported; returns the app module."""
+    os.environ["DATABASE_URL"] = url
+    import database, models
+
+    if reset:
+        models.Base.metadata.drop_all(bind=database.get_engine())
+    models.Base.metadata.create_all(bind=database.get_engine())
+    import main
+    return main
+
+
+def seed(n_products: int, n_users: int, rng: random.Random) -> dict:
+    """Create load-test products and users; returns their ids and emails."""
+    import auth, catalog_import, database, models
+
+    categories = ["Tops", "Dresses", "Bottoms", "Outerwear"]
+    rows = [{
+        "title": f"Load test product {i}", "description": "Generated for load testing.",
+        "price": round(rng.uniform(10, 150), 2), "category": categories[i % len(categories)],
+        # Plenty of stock so checkouts never fail for lack of it
+        "stock": 1_000_000, "images": [], "sizes": SIZES,
+    } for i in range(n_products)]
+    catalog_import.import_products(database.get_engine(), rows)
+
+    hashed = auth.get_password_hash(PASSWORD)
+    db = database.get_sessionmaker()()
+    try:
+        emails = [f"loadtest{i}@example.com" for i in range(n_users)]
+        existing = {e for (e,) in db.query(models.User.email).filter(models.User.email.in_(emails))}
+        db.add_all(models.User(email=e, hashed_password=hashed, is_verified=True) for e in emails if e not in existing)
+        db.commit()
+        product_ids = [i for (i,) in db.query(models.Product.id).filter(models.Product.title.like("Load test product %"))]
+    finally:
+        db.close()
+    return {"product_ids": sorted(product_ids), "emails": emails}
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.enabled = True
+
+    async def call(self, client, label: str, method: str, url: str, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        if self.enabled:
+            self.latencies[label].append(time.perf_counter() - started)
+            if response.status_code not in expect:
+                self.errors[label] += 1
+        return response
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for label, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        endpoints[label] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(label, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {"seconds": round(elapsed, 2), "requests": total,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0, "endpoints": endpoints}
+
+
+# ── Scenarios ─────────────────────────────────────────────────────────────────
+
+class VirtualUser:
+    def __init__(self, client, recorder, rng: random.Random, email: str, product_ids):
+        self.client = client
+        self.rec = recorder
+        self.rng = rng
+        self.email = email
+        self.product_ids = product_ids
+        self.token = None
+
+    def _product(self):
+        # Popular products get most of the traffic
+        index = min(int(self.rng.paretovariate(1.2)) - 1, len(self.product_ids) - 1)
+        return self.product_ids[index]
+
+    async def _headers(self):
+        if self.token is None:
+            await self.login()
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def login(self):
+        r = await self.rec.call(self.client, "POST /users/token", "POST", "/api/users/token",
+                                data={"username": self.email, "password": PASSWORD})
+        self.token = r.json().get("access_token") if r.status_code == 200 else None
+
+    async def browse(self):
+        page = self.rng.randrange(0, max(1, len(self.product_ids) // 20))
+        await self.rec.call(self.client, "GET /products/", "GET", f"/api/products/?skip={page * 20}&limit=20")
+        for _ in range(self.rng.randint(1, 3)):
+            product_id = self._product()
+            await self.rec.call(self.client, "GET /products/{id}", "GET", f"/api/products/{product_id}")
+            await self.rec.call(self.client, "GET /products/{id}/related", "GET", f"/api/products/{product_id}/related")
+
+    async def _add(self, headers):
+        product_id, size = self._product(), self.rng.choice(SIZES)
+        await self.rec.call(self.client, "POST /cart/items", "POST", "/api/cart/items", headers=headers,
+                            json={"product_id": product_id, "quantity": self.rng.randint(1, 2), "size": size})
+        return product_id, size
+
+    async def cart(self):
+        headers = await self._headers()
+        await self.rec.call(self.client, "GET /cart/", "GET", "/api/cart/", headers=headers)
+        product_id, size = await self._add(headers)
+        await self.rec.call(self.client, "PUT /cart/items/{id}", "PUT", f"/api/cart/items/{product_id}?size={size}",
+                            headers=headers, json={"quantity": self.rng.randint(1, 4)})
+        if self.rng.random() < 0.3:
+            await self.rec.call(self.client, "DELETE /cart/items/{id}", "DELETE",
+                                f"/api/cart/items/{product_id}?size={size}", headers=headers)
+
+    async def checkout(self):
+        headers = await self._headers()
+        for _ in range(self.rng.randint(1, 3)):
+            await self._add(headers)
+        key = str(uuid.UUID(int=self.rng.getrandbits(128)))
+        await self.rec.call(self.client, "POST /orders/from-cart", "POST", "/api/orders/from-cart",
+                            headers={**headers, "Idempotency-Key": key}, json={"shipping_address": "1 Load Test Road"})
+
+    async def run(self, iterations: int):
+        names, weights = zip(*SCENARIOS.items())
+        for _ in range(iterations):
+            await getattr(self, self.rng.choices(names, weights)[0])()
+
+
+async def run_load(app, data: dict, users: int, iterations: int, seed: int) -> dict:
+    import httpx
+
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, so run the app's startup/shutdown here
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+        def vu(i, offset):
+            return VirtualUser(client, recorder, random.Random(seed * 100_003 + i + offset),
+                               data["emails"][i % len(data["emails"])], data["product_ids"])
+
+        # Warm-up pass (caches, pool, imports) that is not recorded
+        recorder.enabled = False
+        await asyncio.gather(*(vu(i, 50_000).run(2) for i in range(min(users, 4))))
+        recorder.enabled = True
+
+        started = time.perf_counter()
+        await asyncio.gather(*(vu(i, 0).run(iterations) for i in range(users)))
+        return summarize(recorder, time.perf_counter() - started)
+
+
+# ── Reporting ─────────────────────────────────────────────────────────────────
+
+def print_report(result: dict, baseline: dict = None):
+    base = (baseline or {}).get("endpoints", {})
+    print(f"\n{'endpoint':32} {'reqs':>6} {'errs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}" + ("  p95 vs base" if base else ""))
+    for label, e in result["endpoints"].items():
+        line = f"{label:32} {e['requests']:6} {e['errors']:5} {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} {e['p99_ms']:8.1f}"
+        if label in base and base[label]["p95_ms"]:
+            line += f"  {100 * (e['p95_ms'] / base[label]['p95_ms'] - 1):+6.1f}%"
+        print(line)
+    print(f"\n{result['requests']} requests in {result['seconds']}s = {result['throughput_rps']} req/s")
+
+
+def regressions(result: dict, baseline: dict, threshold: float) -> list:
+    found = []
+    for label, e in result["endpoints"].items():
+        b = baseline.get("endpoints", {}).get(label)
+        comparable = b and min(b["requests"], e["requests"]) >= MIN_SAMPLES and b["p95_ms"]
+        if comparable and e["p95_ms"] > b["p95_ms"] * (1 + threshold):
+            found.append(f"{label}: p95 {b['p95_ms']} -> {e['p95_ms']} ms")
+        if b is not None and e["errors"] > b["errors"]:
+            found.append(f"{label}: errors {b['errors']} -> {e['errors']}")
+    if baseline.get("throughput_rps") and result["throughput_rps"] < baseline["throughput_rps"] * (1 - threshold):
+        found.append(f"throughput {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API in-process.")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=25, help="scenarios per virtual user")
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--accounts", type=int, default=50, help="user accounts shared by the virtual users")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="default: a temporary SQLite file")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables of --database-url first")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95/throughput change vs baseline")
+    args = parser.parse_args()
+
+    url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "loadtest.db")
+    main = prepare_database(url, reset=args.reset)
+    data = seed(args.products, args.accounts, random.Random(args.seed))
+    print(f"[✓] Seeded {len(data['product_ids'])} products, {len(data['emails'])} accounts on {url.split('@')[-1]}")
+
+    result = asyncio.run(run_load(main.app, data, args.users, args.iterations, args.seed))
+    result["config"] = {k: getattr(args, k) for k in ("users", "iterations", "products", "accounts", "seed")}
+    result["database"] = url.split(":", 1)[0]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[✓] Baseline saved to {args.save_baseline}")
+    if baseline:
+        if baseline.get("config") != result["config"]:
+            print("[!] Baseline was recorded with different settings; comparison is only indicative")
+        found = regressions(result, baseline, args.threshold)
+        for line in found:
+            print(f"[✗] Regression: {line}")
+        if found:
+            sys.exit(1)
+        print("[✓] No regressions against baseline")
@@ -1,16 +1,92 @@
-from fastapi import FastAPI
+import time
+IMPORT_STARTED = time.perf_counter()  # cold-start timing starts before the heavy imports
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 import os
 from dotenv import load_dotenv
 load_dotenv()  # Load .env before everything else
-import models, database
-from routers import users, products, orders, cart, upload
+import database, idempotency, metrics, tracing, profiling, warmup, cart_sweeper, cart_store, feeds, cache
+from routers import users, products, orders, cart, upload, analytics, export, events, debug, health, promotions
+
+# Tables are not created here any more: run `python create_tables.py` once per database.
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+    # Creating the engine does not connect; the first query (or the warm-up) does
+    engine = database.get_engine()
+    # Count and time every SQL statement and pool checkout (exposed at /metrics)
+    metrics.instrument_engine(engine)
+    tracing.instrument_engine(engine)
+    if profiling.ENABLED:
+        profiling.instrument_engine(engine)
+
+    # Product/related cache invalidations from other workers and batch jobs (via Redis)
+    cache.listen_for_invalidations()
+
+    if cart_store.enabled:
+        # Carts logged by a crashed worker reach the database before we take traffic
+        replayed = await run_in_threadpool(cart_store.replay)
+        if replayed["carts"]:
+            print(f"[startup] replayed {replayed['carts']} carts from {replayed['segments']} cart log segments")
+
+    warm = None
+    if warmup.ENABLED:
+        try:
+            warm = await run_in_threadpool(warmup.warm_up)
+        except Exception as e:
+            # A cold cache is not a reason to refuse to start; /health/ready checks the database
+            print(f"[startup] warm-up failed: {e}")
+
+    import_seconds = IMPORT_SECONDS
+    lifespan_seconds = time.perf_counter() - started
+    metrics.startup_seconds.set(import_seconds, "import")
+    metrics.startup_seconds.set(lifespan_seconds, "lifespan")
+    app.state.startup = {"import_seconds": round(import_seconds, 3),
+                         "lifespan_seconds": round(lifespan_seconds, 3),
+                         "warmup": warm}
+    print(f"[startup] import {import_seconds:.3f}s, lifespan {lifespan_seconds:.3f}s"
+          + (f", warm-up {warm}" if warm else ""))
 
-# Create database tables
-models.Base.metadata.create_all(bind=database.engine)
+    # Optional in-process maintenance, so its metrics show up at /metrics
+    background = []
+    if cart_sweeper.SWEEP_INTERVAL > 0:
+        background.append(asyncio.create_task(cart_sweeper.run_periodically(database.get_sessionmaker())))
+    if cart_store.enabled:
+        background.append(asyncio.create_task(cart_store.run_flusher()))
+    yield
+    for task in background:
+        task.cancel()
+    if cart_store.enabled:
+        await run_in_threadpool(cart_store.flush)
+    engine.dispose()
 
-app = FastAPI(title="Women's Cloth Store API")
+
+app = FastAPI(title="Women's Cloth Store API", lifespan=lifespan)
+
+# Request/crud spans when TRACING_EXPORTER is set; a no-op otherwise. SQL spans are
+# added in lifespan() once the engine exists.
+tracing.setup(app)
+
+# Replays stored responses for retried requests carrying an Idempotency-Key.
+# Added before CORS so replayed responses still get CORS headers.
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
+# Admin-only profiling hooks; not installed at all unless PROFILING_ENABLED=1.
+# Inside CORS so profile responses are readable from the admin UI's origin.
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(debug.router, prefix="/api")
 
 # CORS Configuration
 origins = [
@@ -24,19 +100,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the frontend read product ETags to revalidate with If-None-Match
+    expose_headers=["ETag"],
 )
 
-# Serve uploaded images as static files at /uploads/<filename>
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# Added last so it is outermost and times the whole request
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Serve uploaded images as static files at /uploads/<filename> (the directory is created in lifespan())
+app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR, check_dir=False), name="uploads")
+# Product feed and sitemap files written by feeds.py, at /feeds/sitemap.xml etc.
+app.mount("/feeds", StaticFiles(directory=feeds.FEEDS_DIR, check_dir=False), name="feeds")
+
+# Liveness/readiness probes, outside /api
+app.include_router(health.router)
 
 app.include_router(users.router, prefix="/api")
 app.include_router(products.router, prefix="/api")
 app.include_router(orders.router, prefix="/api")
 app.include_router(cart.router, prefix="/api")
+app.include_router(promotions.router, prefix="/api")
 app.include_router(upload.router, prefix="/api")
+app.include_router(analytics.router, prefix="/api")
+app.include_router(export.router, prefix="/api")
+app.include_router(events.router, prefix="/api")
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Women's Cloth Store API"}
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics(authorization: str = Header(None)):
+    """Prometheus text exposition of this worker's metrics."""
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
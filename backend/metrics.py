@@ -0,0 +1,343 @@
+"""
+metrics.py
+Prometheus metrics for the API, served as text at GET /metrics.
+
+Collected:
+- per route template: request latency histogram, request counts by status,
+  and how many SQL queries / how much SQL time each request needed
+- requests in flight
+- every SQL statement's duration, and queries by kind (SELECT/INSERT/...)
+- connection pool checkout waits and current pool usage
+- time spent in named sections such as password hashing (see timed())
+- hit/miss counts and hit ratio of every cache.TTLCache
+
+Everything is kept in plain in-process counters; each worker exposes its own numbers,
+so scrape every worker (or run one worker per scrape target). Set METRICS_TOKEN to
+require `Authorization: Bearer <token>` on /metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from sqlalchemy import event
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+REGISTRY = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        # Optional callable returning {label tuple: value}, read at scrape time instead
+        self._collect = collect
+        REGISTRY.append(self)
+
+    def _samples(self):
+        if self._collect is not None:
+            return list(self._collect().items())
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in self._samples():
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+
+http_requests = Counter("http_requests_total", "Requests by route template and status code.",
+                        ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                         ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being served.")
+http_db_queries = Histogram("http_request_db_queries", "SQL statements executed per request.",
+                            ("method", "route"), buckets=COUNT_BUCKETS)
+http_db_seconds = Histogram("http_request_db_seconds", "Time spent in SQL per request.",
+                            ("method", "route"))
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set for the duration of a request; shared with the threadpool running sync endpoints
+_request_stats = contextvars.ContextVar("metrics_request_stats", default=None)
+
+
+def _route_template(scope) -> str:
+    """The matched route's path template, e.g. /api/products/{product_id}.
+
+    Unmatched paths share one label so random URLs cannot blow up the number of series.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    # Routes of an included router may only know their path below the include prefix;
+    # recover the prefix from the request path
+    try:
+        rendered = template.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    path = scope["path"]
+    if path.endswith(rendered) and len(path) > len(rendered):
+        return path[: len(path) - len(rendered)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """Outermost middleware: times every HTTP request and labels it with its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_stats.reset(token)
+            route = _route_template(scope)
+            method = scope["method"]
+            http_requests.inc(method, route, str(status["code"]))
+            http_latency.observe(elapsed, method, route)
+            http_db_queries.observe(stats.queries, method, route)
+            http_db_seconds.observe(stats.db_seconds, method, route)
+
+
+# ── SQLAlchemy ────────────────────────────────────────────────────────────────
+
+db_query_seconds = Histogram("db_query_duration_seconds", "Duration of individual SQL statements.",
+                             buckets=QUERY_BUCKETS)
+db_queries = Counter("db_queries_total", "SQL statements executed, by kind.", ("operation",))
+db_pool_wait = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+                         buckets=QUERY_BUCKETS)
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "COPY"}
+_instrumented_engines = []
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    db_query_seconds.observe(elapsed)
+    db_queries.inc(operation if operation in _OPERATIONS else "OTHER")
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def _on_error(context):
+    starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _pool_stats():
+    values = {}
+    for engine in _instrumented_engines:
+        pool = engine.pool
+        for name in ("size", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                # QueuePool.overflow() counts up from -size until the pool is full
+                values[(engine.url.database or "", name)] = max(getattr(pool, name)(), 0)
+    return values
+
+
+db_pool = Gauge("db_pool_connections", "Connection pool size, connections checked out and overflow in use.",
+                ("database", "state"), collect=_pool_stats)
+
+
+def instrument_engine(engine):
+    """Count and time every statement on `engine` and time its pool checkouts. Idempotent."""
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.append(engine)
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _on_error)
+
+    # The pool has no "checkout started" event, so time the call that may block
+    pool = engine.pool
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+
+# ── Sections and caches ───────────────────────────────────────────────────────
+
+section_seconds = Histogram("app_section_duration_seconds", "Time spent in instrumented code sections.",
+                            ("section",))
+startup_seconds = Gauge("app_startup_seconds", "Cold-start time of this worker, by phase (import, lifespan).",
+                        ("phase",))
+
+
+@contextmanager
+def timed(section: str):
+    """Time a block of CPU- or IO-heavy work, e.g. `with metrics.timed("password_hash"):`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        section_seconds.observe(time.perf_counter() - started, section)
+
+
+def _cache_stats(attr):
+    def collect():
+        import cache
+
+        values = {}
+        for c in cache.CACHES:
+            if attr == "ratio":
+                total = c.hits + c.misses
+                values[(c.name,)] = c.hits / total if total else 0.0
+            elif attr == "entries":
+                values[(c.name,)] = len(c._data)
+            else:
+                values[(c.name,)] = getattr(c, attr)
+        return values
+    return collect
+
+
+Counter("cache_hits_total", "Cache lookups that found a live entry.", ("cache",), collect=_cache_stats("hits"))
+Counter("cache_misses_total", "Cache lookups that found nothing or an expired entry.", ("cache",), collect=_cache_stats("misses"))
+Gauge("cache_hit_ratio", "Hits / lookups since the worker started.", ("cache",), collect=_cache_stats("ratio"))
+Gauge("cache_entries", "Entries currently held, including expired ones not yet evicted.", ("cache",), collect=_cache_stats("entries"))
+
+
+# ── Maintenance jobs ──────────────────────────────────────────────────────────
+
+cart_sweeps = Counter("cart_sweeper_runs_total", "Abandoned-cart sweeps completed.")
+carts_expired = Counter("cart_sweeper_carts_deleted_total", "Idle carts deleted by the sweeper.")
+cart_items_expired = Counter("cart_sweeper_items_deleted_total", "Cart items deleted with idle carts.")
+cart_sweep_batch_seconds = Histogram("cart_sweeper_batch_duration_seconds",
+                                     "Duration of one sweeper batch transaction (how long its locks are held).")
+
+
+def _cart_store_dirty():
+    import cart_store
+
+    return {(): cart_store.store.dirty_count()} if cart_store.enabled else {}
+
+
+cart_store_flushed = Counter("cart_store_flushed_carts_total", "Carts written to the database by the write-behind cart store.")
+cart_store_flush_seconds = Histogram("cart_store_flush_duration_seconds", "Duration of one cart store flush transaction.")
+Gauge("cart_store_dirty_carts", "Carts edited in the cart store but not yet written to the database.",
+      collect=_cart_store_dirty)
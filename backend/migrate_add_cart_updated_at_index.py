@@ -0,0 +1,28 @@
+"""
+migrate_add_cart_updated_at_index.py
+Run ONCE to backfill carts.updated_at and index it for cart_sweeper.py.
+Usage: python migrate_add_cart_updated_at_index.py
+
+Works with PostgreSQL (the project default) AND SQLite. Carts that were never edited
+have no updated_at; they get their created_at. On PostgreSQL the index is built
+CONCURRENTLY so the carts table stays writable while it builds.
+"""
+import database  # uses the same engine as the app
+
+from sqlalchemy import text
+
+def run():
+    with database.get_engine().begin() as conn:
+        result = conn.execute(text("UPDATE carts SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"))
+        print(f"[✓] Backfilled updated_at on {result.rowcount} carts")
+
+    concurrently = "CONCURRENTLY " if database.get_engine().dialect.name == "postgresql" else ""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with database.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS ix_carts_updated_at ON carts (updated_at)"))
+        print("[✓] ix_carts_updated_at")
+
+    print("[✓] Migration complete.")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,22 @@
+"""
+migrate_add_order_archive.py
+Run ONCE to create the orders_archive / order_items_archive tables used by archive_orders.py.
+Usage: python migrate_add_order_archive.py
+
+Works with PostgreSQL (the project default) AND SQLite. On PostgreSQL the tables are
+created range partitioned by created_at; archive_orders.py adds the monthly partitions.
+"""
+import database  # uses the same engine as the app
+import models
+
+def run():
+    tables = [models.ArchivedOrder.__table__, models.ArchivedOrderItem.__table__]
+    # checkfirst: tables that already exist are left alone
+    models.Base.metadata.create_all(bind=database.get_engine(), tables=tables)
+    for table in tables:
+        print(f"[✓] {table.name}")
+
+    print("[✓] Migration complete.")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,30 @@
+"""
+migrate_add_order_indexes.py
+Run ONCE to add the composite indexes used by the admin order filters and keyset pagination.
+Usage: python migrate_add_order_indexes.py
+
+Works with PostgreSQL (the project default) AND SQLite. On PostgreSQL the indexes are
+built CONCURRENTLY so the orders table stays writable while they build.
+"""
+import database  # uses the same engine as the app
+
+from sqlalchemy import text
+
+INDEXES = {
+    "ix_orders_created_at_id": "orders (created_at, id)",
+    "ix_orders_status_created_at_id": "orders (status, created_at, id)",
+    "ix_orders_user_id_created_at_id": "orders (user_id, created_at, id)",
+}
+
+def run():
+    concurrently = "CONCURRENTLY " if database.get_engine().dialect.name == "postgresql" else ""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with database.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, target in INDEXES.items():
+            conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {target}"))
+            print(f"[✓] {name}")
+
+    print("[✓] Migration complete.")
+
+if __name__ == "__main__":
+    run()
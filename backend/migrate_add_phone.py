@@ -19,7 +19,7 @@ def column_exists(conn, table, col):
     return result.fetchone() is not None
 
 def run():
-    with database.engine.connect() as conn:
+    with database.get_engine().connect() as conn:
         added = []
 
         if not column_exists(conn, "users", "phone"):
@@ -0,0 +1,38 @@
+"""
+migrate_add_product_updated_at.py
+Run ONCE to add the products.updated_at column (and its index) used by feeds.py.
+Usage: python migrate_add_product_updated_at.py
+
+Works with PostgreSQL (the project default) AND SQLite. Existing products get the
+current time, so the first feeds.py run after this regenerates everything. On
+PostgreSQL the index is built CONCURRENTLY so the products table stays writable.
+"""
+import database  # uses the same engine as the app
+
+from sqlalchemy import inspect, text
+
+def run():
+    postgres = database.get_engine().dialect.name == "postgresql"
+    with database.get_engine().begin() as conn:
+        columns = {c["name"] for c in inspect(conn).get_columns("products")}
+        if "updated_at" in columns:
+            print("[✓] Column already exists.")
+        elif postgres:
+            conn.execute(text("ALTER TABLE products ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()"))
+            print("[✓] Added column: updated_at TIMESTAMP WITH TIME ZONE")
+        else:
+            # SQLite cannot add a column with a non-constant default
+            conn.execute(text("ALTER TABLE products ADD COLUMN updated_at DATETIME"))
+            conn.execute(text("UPDATE products SET updated_at = CURRENT_TIMESTAMP"))
+            print("[✓] Added column: updated_at DATETIME")
+
+    concurrently = "CONCURRENTLY " if postgres else ""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with database.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS ix_products_updated_at ON products (updated_at)"))
+        print("[✓] ix_products_updated_at")
+
+    print("[✓] Migration complete.")
+
+if __name__ == "__main__":
+    run()
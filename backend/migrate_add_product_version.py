@@ -0,0 +1,25 @@
+"""
+migrate_add_product_version.py
+Run ONCE to add the optimistic-locking `version` column to the products table.
+Usage: python migrate_add_product_version.py
+
+Works with PostgreSQL (the project default) AND SQLite.
+"""
+import database  # uses the same engine as the app
+
+from sqlalchemy import inspect, text
+
+def run():
+    with database.get_engine().connect() as conn:
+        columns = {c["name"] for c in inspect(conn).get_columns("products")}
+        if "version" in columns:
+            print("[✓] Column already exists. Nothing to do.")
+            return
+
+        conn.execute(text("ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        conn.commit()
+
+    print("[✓] Migration complete. Added column: version INTEGER")
+
+if __name__ == "__main__":
+    run()
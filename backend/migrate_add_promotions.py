@@ -0,0 +1,41 @@
+"""
+migrate_add_promotions.py
+Run ONCE to create the promotions table and add the discount_total / coupon_code
+columns to orders (and orders_archive, if it exists).
+Usage: python migrate_add_promotions.py
+
+Works with PostgreSQL (the project default) AND SQLite.
+"""
+import database  # uses the same engine as the app
+import models
+
+from sqlalchemy import inspect, text
+
+COLUMNS = {
+    "discount_total": "FLOAT NOT NULL DEFAULT 0",
+    "coupon_code": "VARCHAR",
+}
+
+def run():
+    # checkfirst: left alone if it already exists
+    models.Base.metadata.create_all(bind=database.get_engine(), tables=[models.Promotion.__table__])
+    print("[✓] promotions")
+
+    with database.get_engine().connect() as conn:
+        tables = set(inspect(conn).get_table_names())
+        for table in ("orders", "orders_archive"):
+            if table not in tables:
+                continue
+            existing = {c["name"] for c in inspect(conn).get_columns(table)}
+            for name, ddl in COLUMNS.items():
+                if name in existing:
+                    print(f"[✓] {table}.{name} already exists")
+                    continue
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                print(f"[✓] Added column: {table}.{name}")
+        conn.commit()
+
+    print("[✓] Migration complete.")
+
+if __name__ == "__main__":
+    run()
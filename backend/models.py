@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -28,6 +28,11 @@ class Product(Base):
     # Storing images and sizes as JSON for SQLite compatibility
     images = Column(JSON, default=[]) 
     sizes = Column(JSON, default=[]) 
+    # Bumped on every admin edit; bulk updates can require a matching version
+    version = Column(Integer, default=1, server_default="1", nullable=False)
+    # Last change of any kind, stock included; feeds.py regenerates only what changed.
+    # Raw SQL writers (catalog_import.py) must set it themselves.
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     order_items = relationship("OrderItem", back_populates="product")
 
@@ -36,14 +41,27 @@ class Order(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    status = Column(String, default="Pending") # Pending, Shipped, Delivered
+    status = Column(String, default="Pending") # One of ORDER_STATUSES
     total_price = Column(Float)
     shipping_address = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Promotions applied at checkout; total_price is already net of discount_total
+    discount_total = Column(Float, default=0.0, server_default="0", nullable=False)
+    coupon_code = Column(String, nullable=True)
     
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
 
+    # Composite indexes back the admin filters and (created_at, id) keyset pagination.
+    # Existing databases get them from migrate_add_order_indexes.py.
+    __table_args__ = (
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
+ORDER_STATUSES = ("Pending", "Dispatched", "Shipped", "Delivered")
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -52,22 +70,96 @@ class OrderItem(Base):
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer)
     size = Column(String)
-    price = Column(Float) # Snapshot of price at purchase
+    price = Column(Float) # Snapshot of the unit price paid, after promotions
     
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
 
+# Delivered orders older than the archive age are moved here by archive_orders.py, so the
+# hot orders tables (and their indexes) only hold recent and open orders. Ids are kept.
+# On PostgreSQL both tables are range partitioned by created_at, one partition per month
+# (created by the archive job), which is why created_at is part of the primary key and is
+# copied onto the items.
+class ArchivedOrder(Base):
+    __tablename__ = "orders_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime(timezone=True), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String)
+    total_price = Column(Float)
+    shipping_address = Column(Text)
+    discount_total = Column(Float, default=0.0, server_default="0", nullable=False)
+    coupon_code = Column(String, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    items = relationship(
+        "ArchivedOrderItem",
+        primaryjoin="and_(ArchivedOrder.id == foreign(ArchivedOrderItem.order_id), "
+                    "ArchivedOrder.created_at == foreign(ArchivedOrderItem.created_at))",
+        viewonly=True,
+    )
+
+    __table_args__ = (
+        Index("ix_orders_archive_user_id_created_at_id", "user_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class ArchivedOrderItem(Base):
+    __tablename__ = "order_items_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime(timezone=True), primary_key=True)  # the order's
+    order_id = Column(Integer)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    quantity = Column(Integer)
+    size = Column(String)
+    price = Column(Float)
+
+    __table_args__ = (
+        Index("ix_order_items_archive_order_id", "order_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+# Discount rules, evaluated a whole cart at a time by promotions.py. A rule applies to one
+# product, to a category, or (neither set) to everything; with a coupon_code it only
+# applies when that code is entered. Existing databases get the table and the order
+# discount columns from migrate_add_promotions.py.
+class Promotion(Base):
+    __tablename__ = "promotions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # one of PROMOTION_KINDS
+    value = Column(Float, default=0.0, nullable=False)  # percent, or amount off per unit
+    buy_quantity = Column(Integer, default=0, nullable=False)  # buy_x_get_y only
+    get_quantity = Column(Integer, default=0, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    category = Column(String, nullable=True)
+    coupon_code = Column(String, nullable=True, index=True)
+    starts_at = Column(DateTime(timezone=True), nullable=True)
+    ends_at = Column(DateTime(timezone=True), nullable=True)
+    active = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+PROMOTION_KINDS = ("percent_off", "amount_off", "buy_x_get_y")
+
 class Cart(Base):
     __tablename__ = "carts"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Last activity: set on creation and by every cart edit in crud.py (item changes do not
+    # update the cart row by themselves). cart_sweeper.py expires idle carts by it.
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
 
     user = relationship("User", back_populates="cart")
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
 
+    # Existing databases get it from migrate_add_cart_updated_at_index.py.
+    __table_args__ = (Index("ix_carts_updated_at", "updated_at"),)
+
 class CartItem(Base):
     __tablename__ = "cart_items"
 
@@ -79,3 +171,103 @@ class CartItem(Base):
 
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
+
+# Analytics rollups, maintained incrementally by analytics.py.
+# `grain` is "hour" or "day" and `bucket` is the UTC start of that period.
+class OrderRollup(Base):
+    __tablename__ = "order_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    grain = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    orders = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (UniqueConstraint("grain", "bucket", name="uq_order_rollups_grain_bucket"),)
+
+class SalesRollup(Base):
+    __tablename__ = "sales_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    grain = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    product_id = Column(Integer, nullable=False)
+    category = Column(String, nullable=False, default="")
+    size = Column(String, nullable=False, default="")
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("grain", "bucket", "product_id", "size", name="uq_sales_rollups_key"),
+    )
+
+class StatusRollup(Base):
+    __tablename__ = "status_rollups"
+
+    # Orders are counted in the bucket they were placed in, so a date range
+    # gives the current status funnel for the orders placed in that range.
+    id = Column(Integer, primary_key=True, index=True)
+    grain = Column(String, nullable=False)
+    bucket = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False)
+    orders = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("grain", "bucket", "status", name="uq_status_rollups_key"),
+    )
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # One row per (owner, Idempotency-Key); status_code stays NULL while the first
+    # request is still running. See idempotency.py.
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (UniqueConstraint("owner", "key", name="uq_idempotency_keys_owner_key"),)
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    # Written in the same transaction as the change it describes and drained by
+    # outbox.py; processed_at stays NULL until every handler has succeeded.
+    # handlers_done lists the handlers that already have, so retries skip them.
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, nullable=False)
+    payload = Column(JSON, default={})
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    handlers_done = Column(JSON, default=list)
+
+    __table_args__ = (Index("ix_outbox_events_pending", "processed_at", "available_at", "id"),)
+
+# Neighbours kept per product by recommendations.py, and the most /related can return
+RELATED_TOP_K = 20
+
+class ProductRelation(Base):
+    __tablename__ = "product_relations"
+
+    # Precomputed "bought together" neighbours, rebuilt in full by recommendations.py and
+    # read by crud.get_related_product_ids. rank 1 is the most similar product.
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    related_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    co_purchases = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("product_id", "related_id", name="uq_product_relations_pair"),
+        Index("ix_product_relations_product_rank", "product_id", "rank"),
+    )
@@ -0,0 +1,38 @@
+"""
+notifications.py
+Outgoing email over SMTP, shared by the OTP endpoints (routers/verify.py) and the outbox
+handlers. With SMTP_USER/SMTP_PASSWORD unset, messages are printed instead of sent.
+"""
+import os
+import smtplib
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import tracing
+
+# ── SMTP settings (read from env) ─────────────────────────────────────────────
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER)
+FROM_NAME = os.getenv("FROM_NAME", "AKR Womens Clothing")
+
+
+def send_email(to_email: str, subject: str, html_body: str):
+    """Send email via Gmail SMTP. Falls back to console print if not configured."""
+    if not SMTP_USER or not SMTP_PASSWORD or SMTP_USER == "your_gmail@gmail.com":
+        print(f"\n[SMTP not configured] email to {to_email}:\n{subject}\n")
+        return
+
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
+    msg["To"] = to_email
+    msg.attach(MIMEText(html_body, "html"))
+
+    with tracing.span("smtp.send", **{"server.address": SMTP_HOST, "server.port": SMTP_PORT}):
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+            server.ehlo()
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            server.sendmail(FROM_EMAIL, to_email, msg.as_string())
@@ -0,0 +1,160 @@
+"""
+outbox.py
+Transactional outbox for order side effects (emails, stock alerts, ...).
+
+Request handlers call enqueue() inside their own transaction, so an event exists exactly
+when the change it describes was committed, and checkout never waits on a side effect.
+A separate worker process drains pending events in batches and hands each one to the
+handlers registered for its topic. A batch is claimed in a short transaction (its rows
+leased for LEASE_SECONDS) and the handlers run after that commits, so no row locks are
+held while emails are sent. Each handler's success is recorded on the event: when one
+handler fails, only the ones that have not succeeded yet run again, with exponential
+backoff, up to MAX_ATTEMPTS. Delivery is still at-least-once (a worker can die between a
+handler finishing and its success being recorded), so handlers must be idempotent.
+
+Handlers live in the modules named by OUTBOX_HANDLER_MODULES (default: outbox_handlers)
+and register with the @handler("topic") decorator.
+
+Usage: python outbox.py [--once] [--batch-size 100] [--poll-interval 1.0]
+"""
+import importlib
+import os
+import time
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import models, tracing
+
+MAX_ATTEMPTS = 8
+# Claimed events are hidden from other workers this long; a crashed worker's come back after it
+LEASE_SECONDS = 300
+HANDLERS = defaultdict(list)
+
+
+def handler(topic: str):
+    """Register a function(payload: dict) to be called for every event on `topic`."""
+    def register(fn):
+        HANDLERS[topic].append(fn)
+        return fn
+    return register
+
+
+def enqueue(db: Session, topic: str, payload: dict):
+    """Add an event to the caller's transaction; it is delivered only if that commits."""
+    db.add(models.OutboxEvent(topic=topic, payload=payload, available_at=datetime.now(timezone.utc)))
+
+
+def enqueue_many(db: Session, topic: str, payloads):
+    """Like enqueue() for many events at once, as a single multi-row INSERT."""
+    now = datetime.now(timezone.utc)
+    rows = [{"topic": topic, "payload": p, "available_at": now, "attempts": 0} for p in payloads]
+    if rows:
+        db.execute(insert(models.OutboxEvent), rows)
+
+
+def _handler_name(fn) -> str:
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+
+def _deliver(topic: str, payload: dict, done: list):
+    """Run the handlers of `topic` not in `done`, appending each that succeeds.
+    Returns the traceback of the last failure, or None."""
+    error = None
+    for fn in HANDLERS.get(topic, []):
+        name = _handler_name(fn)
+        if name in done:
+            continue
+        try:
+            fn(payload)
+        except Exception:
+            error = traceback.format_exc(limit=5)
+            print(f"[outbox] {topic} handler {name} failed: {error.splitlines()[-1]}")
+        else:
+            done.append(name)
+    return error
+
+
+def drain(db: Session, batch_size: int = 100) -> int:
+    """Deliver one batch of due events. Returns how many events were picked up."""
+    now = datetime.now(timezone.utc)
+    events = (
+        db.query(models.OutboxEvent)
+        .filter(
+            models.OutboxEvent.processed_at.is_(None),
+            models.OutboxEvent.available_at <= now,
+            models.OutboxEvent.attempts < MAX_ATTEMPTS,
+        )
+        .order_by(models.OutboxEvent.id)
+        .limit(batch_size)
+        # Several workers can drain concurrently on PostgreSQL without double-claiming
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not events:
+        db.commit()
+        return 0
+    # Claim the batch and commit, so the handlers below run without a transaction open
+    claimed = [(e.id, e.topic, e.payload or {}, list(e.handlers_done or []), e.attempts) for e in events]
+    for event in events:
+        event.available_at = now + timedelta(seconds=LEASE_SECONDS)
+    db.commit()
+
+    outcomes = {}
+    for event_id, topic, payload, done, attempts in claimed:
+        with tracing.span(f"outbox.{topic}", **{"outbox.event_id": event_id, "outbox.attempt": attempts + 1}):
+            outcomes[event_id] = (done, _deliver(topic, payload, done))
+
+    finished = datetime.now(timezone.utc)
+    for event in db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(outcomes)):
+        done, error = outcomes[event.id]
+        event.handlers_done = done
+        if error is None:
+            event.processed_at = finished
+        else:
+            event.attempts += 1
+            event.last_error = error
+            event.available_at = finished + timedelta(seconds=min(2 ** event.attempts, 3600))
+            print(f"[outbox] {event.topic} #{event.id} failed (attempt {event.attempts}), "
+                  f"{len(done)} handler(s) done")
+    db.commit()
+    return len(claimed)
+
+
+def load_handlers():
+    for name in os.getenv("OUTBOX_HANDLER_MODULES", "outbox_handlers").split(","):
+        if name.strip():
+            importlib.import_module(name.strip())
+
+
+def run_worker(batch_size: int = 100, poll_interval: float = 1.0, once: bool = False):
+    import database
+
+    load_handlers()
+    tracing.setup(engine=database.get_engine())
+    print(f"[outbox] worker started, topics: {', '.join(sorted(HANDLERS)) or '(none)'}")
+    while True:
+        db = database.get_sessionmaker()()
+        try:
+            picked = drain(db, batch_size)
+        finally:
+            db.close()
+        if once and picked < batch_size:
+            return
+        # Keep draining while there is a backlog; otherwise wait for new events
+        if picked < batch_size:
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Drain the transactional outbox.")
+    parser.add_argument("--once", action="store_true", help="exit once the backlog is empty")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+    run_worker(args.batch_size, args.poll_interval, args.once)
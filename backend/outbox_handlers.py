@@ -0,0 +1,74 @@
+"""
+outbox_handlers.py
+Side effects of order events, run by the outbox worker (python outbox.py), never inline
+in a request. Each handler receives the event payload and loads what it needs itself.
+"""
+import os
+import database, models, notifications
+from outbox import handler
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "")
+
+
+def _order_email_html(order: models.Order, heading: str) -> str:
+    rows = "".join(
+        f"<tr><td>{item.product.title if item.product else item.product_id}</td>"
+        f"<td>{item.size}</td><td>{item.quantity}</td><td>₹{item.price * item.quantity:.2f}</td></tr>"
+        for item in order.items
+    )
+    return f"""
+    <div style="font-family:Arial,sans-serif;max-width:480px;margin:auto;padding:32px;background:#fff8f0;border-radius:16px;border:1px solid #f3d2c1;">
+        <h1 style="color:#e11d48;font-size:24px;margin-bottom:4px;">AKR Womens Clothing</h1>
+        <p style="color:#555;font-size:14px;margin-top:0;">{heading}</p>
+        <hr style="border:none;border-top:1px solid #ffe0d0;margin:16px 0;">
+        <p style="color:#333;font-size:15px;">Order #{order.id} — status: <b>{order.status}</b></p>
+        <table style="width:100%;font-size:13px;color:#333;">{rows}</table>
+        <p style="color:#333;font-size:15px;">Total: <b>₹{order.total_price:.2f}</b></p>
+    </div>
+    """
+
+
+@handler("order.created")
+def send_order_confirmation(payload: dict):
+    db = database.get_sessionmaker()()
+    try:
+        order = db.query(models.Order).filter(models.Order.id == payload["order_id"]).first()
+        if order and order.user:
+            notifications.send_email(order.user.email, f"Your AKR order #{order.id} is confirmed",
+                        _order_email_html(order, "Thank you for your order!"))
+    finally:
+        db.close()
+
+
+@handler("order.created")
+def alert_low_stock(payload: dict):
+    db = database.get_sessionmaker()()
+    try:
+        low = (
+            db.query(models.Product)
+            .filter(models.Product.id.in_(payload.get("product_ids", [])), models.Product.stock <= LOW_STOCK_THRESHOLD)
+            .all()
+        )
+        if not low:
+            return
+        lines = "".join(f"<li>{p.title} (#{p.id}): {p.stock} left</li>" for p in low)
+        if ADMIN_EMAIL:
+            notifications.send_email(ADMIN_EMAIL, "Low stock alert", f"<ul>{lines}</ul>")
+        else:
+            print("[Low stock] " + ", ".join(f"{p.title} (#{p.id}): {p.stock} left" for p in low))
+    finally:
+        db.close()
+
+
+@handler("order.status_changed")
+def send_status_update(payload: dict):
+    db = database.get_sessionmaker()()
+    try:
+        order = db.query(models.Order).filter(models.Order.id == payload["order_id"]).first()
+        # Skip if the order has moved on since; the later event sends its own email
+        if order and order.user and order.status == payload.get("status"):
+            notifications.send_email(order.user.email, f"Your AKR order #{order.id} is {order.status}",
+                        _order_email_html(order, "Your order has been updated"))
+    finally:
+        db.close()
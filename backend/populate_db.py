@@ -1,10 +1,9 @@
-import models, database
-from sqlalchemy.orm import Session
+import models, database, catalog_import
 
 # Create tables if they don't exist (re-run to ensure schema update if needed)
-models.Base.metadata.create_all(bind=database.engine)
+models.Base.metadata.create_all(bind=database.get_engine())
 
-db = database.SessionLocal()
+# Sample products are upserted by title, so re-running refreshes them in place.
 
 sample_products = [
     {
@@ -63,16 +62,8 @@ sample_products = [
     }
 ]
 
-for product_data in sample_products:
-    # Check if product exists
-    existing = db.query(models.Product).filter(models.Product.title == product_data["title"]).first()
-    if not existing:
-        product = models.Product(**product_data)
-        db.add(product)
-        print(f"Added: {product.title}")
-    else:
-        print(f"Skipped (already exists): {product_data['title']}")
-
-db.commit()
-db.close()
+report = catalog_import.import_products(database.get_engine(), sample_products)
+print(f"Inserted {report['inserted']}, updated {report['updated']}.")
+for err in report["errors"]:
+    print(f"Skipped row {err['row']}: {err['error']}")
 print("Database population complete.")
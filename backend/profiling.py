@@ -0,0 +1,330 @@
+"""
+profiling.py
+On-demand profiling for a live worker: per-request flame graphs, tracemalloc
+snapshots/diffs and a slow-query log. Admin only, and entirely absent unless
+PROFILING_ENABLED=1 (main.py then adds the middleware, the /api/debug routes and the
+SQL hooks; otherwise none of this code runs).
+
+Per-request profiles
+    Send `X-Profile: folded|speedscope|top` (or `?__profile=...`) with an admin token and
+    the response is replaced by a profile of that request. The original status code is
+    returned in X-Profiled-Status. With PROFILE_SAMPLE_RATE > 0 a fraction of all requests
+    is also profiled in the background and kept in a small ring buffer (/api/debug/profiles).
+
+    Most endpoints are sync and run in the threadpool, where cProfile/pyinstrument (which
+    only see the thread that started them) cannot follow, so this uses a stack sampler over
+    every thread. Under concurrent load a profile therefore includes other requests' work.
+    "folded" is the input format of flamegraph.pl; "speedscope" opens at speedscope.app.
+
+Slow queries
+    Statements slower than SLOW_QUERY_MS (default 200) are kept with their parameters.
+    Their plan is computed when first viewed (/api/debug/slow-queries/{id}): EXPLAIN ANALYZE
+    for SELECTs on PostgreSQL (run in a rolled-back transaction), plain EXPLAIN for writes.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timezone
+from itertools import count
+from jose import JWTError, jwt
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+import auth, database, models
+
+ENABLED = os.getenv("PROFILING_ENABLED", "") == "1"
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_MS", "200")) / 1000
+FORMATS = ("folded", "speedscope", "top")
+
+# Waiting threads (idle pool workers, the event loop's select) are left out of samples
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+_ids = count(1)
+recent_profiles = deque(maxlen=20)
+slow_queries = deque(maxlen=100)
+# One sampler at a time: concurrent samplers would each see every thread anyway
+_sampler_lock = threading.Lock()
+
+
+# ── Stack sampler ─────────────────────────────────────────────────────────────
+
+class StackSampler:
+    """Sample the Python stacks of all other threads every `interval` seconds."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.started = self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[tuple(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.samples.most_common())
+
+    def speedscope(self, name: str) -> dict:
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, n in self.samples.items():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            samples.append(ids)
+            weights.append(n * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled", "name": name, "unit": "seconds",
+                "startValue": 0, "endValue": self.duration, "samples": samples, "weights": weights,
+            }],
+        }
+
+    def top(self, limit: int = 40) -> str:
+        """Functions by samples where they were running (self) and on the stack (total)."""
+        own, total = Counter(), Counter()
+        for stack, n in self.samples.items():
+            own[stack[-1]] += n
+            for label in set(stack):
+                total[label] += n
+        all_samples = sum(self.samples.values()) or 1
+        lines = [f"{self.duration * 1000:.1f} ms, {all_samples} samples", f"{'self%':>7} {'total%':>7}  function"]
+        for label, n in own.most_common(limit):
+            lines.append(f"{100 * n / all_samples:6.1f}% {100 * total[label] / all_samples:6.1f}%  {label}")
+        return "\n".join(lines) + "\n"
+
+
+def render(sampler: StackSampler, fmt: str, name: str):
+    """(content type, body) of a finished profile in the requested format."""
+    if fmt == "speedscope":
+        return "application/json", json.dumps(sampler.speedscope(name)).encode()
+    if fmt == "top":
+        return "text/plain; charset=utf-8", sampler.top().encode()
+    return "text/plain; charset=utf-8", sampler.folded().encode()
+
+
+# ── Middleware ────────────────────────────────────────────────────────────────
+
+def _is_admin(headers: dict) -> bool:
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        email = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+    except JWTError:
+        return False
+    db = database.get_sessionmaker()()
+    try:
+        user = db.query(models.User).filter(models.User.email == email).first()
+        return bool(user and user.is_admin)
+    finally:
+        db.close()
+
+
+def _requested_format(scope, headers: dict):
+    fmt = headers.get(b"x-profile", b"").decode("latin-1").strip().lower()
+    if not fmt:
+        for part in scope.get("query_string", b"").decode("latin-1").split("&"):
+            key, _, value = part.partition("=")
+            if key == "__profile":
+                fmt = value.lower() or "folded"
+    return fmt if fmt in FORMATS else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        fmt = _requested_format(scope, headers)
+        if fmt and await run_in_threadpool(_is_admin, headers):
+            return await self._profile_response(scope, receive, send, fmt)
+        if SAMPLE_RATE and random.random() < SAMPLE_RATE and _sampler_lock.acquire(blocking=False):
+            return await self._profile_in_background(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+    async def _profile_response(self, scope, receive, send, fmt):
+        status = {"code": 500}
+
+        async def discard(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        # Never wait for the lock: this runs on the event loop, and the holder (another
+        # profiled or sampled request) needs the loop to finish
+        if not _sampler_lock.acquire(blocking=False):
+            body = b'{"detail":"profiler busy"}'
+            await send({"type": "http.response.start", "status": 409, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
+            return
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            sampler.stop()
+            _sampler_lock.release()
+        content_type, body = render(sampler, fmt, f"{scope['method']} {scope['path']}")
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-profiled-status", str(status["code"]).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _profile_in_background(self, scope, receive, send):
+        # _sampler_lock is already held by __call__
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sampler.stop()
+            _sampler_lock.release()
+            recent_profiles.append({
+                "id": next(_ids), "method": scope["method"], "path": scope["path"],
+                "at": datetime.now(timezone.utc).isoformat(), "duration_ms": round(sampler.duration * 1000, 1),
+                "sampler": sampler,
+            })
+
+
+# ── tracemalloc ───────────────────────────────────────────────────────────────
+
+_baseline = None
+_NOISE = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"))
+
+
+def tracemalloc_start(frames: int = 10):
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _baseline = None
+
+
+def tracemalloc_stop():
+    global _baseline
+    tracemalloc.stop()
+    _baseline = None
+
+
+def _stat(stat) -> dict:
+    frame = stat.traceback[0]
+    return {"where": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+
+
+def tracemalloc_snapshot(limit: int = 25) -> dict:
+    """Take a snapshot, make it the baseline for diffs, and list the biggest allocation sites."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc_start()
+    _baseline = tracemalloc.take_snapshot().filter_traces(_NOISE)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1),
+        "top": [_stat(s) for s in _baseline.statistics("lineno")[:limit]],
+    }
+
+
+def tracemalloc_diff(limit: int = 25) -> dict:
+    """Allocation sites that grew the most since the last snapshot."""
+    if _baseline is None:
+        return {"error": "take a snapshot first"}
+    snapshot = tracemalloc.take_snapshot().filter_traces(_NOISE)
+    diffs = snapshot.compare_to(_baseline, "lineno")
+    return {"top": [
+        dict(_stat(d), size_diff_kb=round(d.size_diff / 1024, 1), count_diff=d.count_diff)
+        for d in diffs[:limit]
+    ]}
+
+
+# ── Slow queries ──────────────────────────────────────────────────────────────
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("profiling_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if elapsed >= SLOW_QUERY_SECONDS and not statement.lstrip().upper().startswith("EXPLAIN"):
+        slow_queries.append({
+            "id": next(_ids), "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed * 1000, 1), "statement": statement,
+            # executemany batches are recorded but cannot be re-explained with one parameter set
+            "parameters": None if executemany else parameters, "executemany": executemany,
+            "plan": None,
+        })
+
+
+def _on_error(context):
+    starts = context.connection.info.get("profiling_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _on_error)
+
+
+def explain(record: dict) -> str:
+    """Plan for a recorded slow query, computed once and kept on the record."""
+    if record["plan"] is not None:
+        return record["plan"]
+    if record["executemany"]:
+        record["plan"] = "(executemany batch; not explained)"
+        return record["plan"]
+    statement = record["statement"]
+    is_select = statement.lstrip().upper().startswith(("SELECT", "WITH"))
+    with database.get_engine().connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # ANALYZE runs the statement, so only for reads, and never committed
+            prefix = "EXPLAIN (ANALYZE, BUFFERS) " if is_select else "EXPLAIN "
+        else:
+            prefix = "EXPLAIN QUERY PLAN "
+        trans = conn.begin()
+        try:
+            rows = conn.exec_driver_sql(prefix + statement, record["parameters"] or ()).fetchall()
+        finally:
+            trans.rollback()
+    record["plan"] = "\n".join(" ".join(str(v) for v in row) for row in rows)
+    return record["plan"]
@@ -0,0 +1,254 @@
+"""
+promotions.py
+Prices a cart against the promotion rules in one vectorized pass.
+
+Rules (models.Promotion, managed under /api/promotions) are compiled into a
+PromotionIndex: one numpy array per rule field, plus the rule positions keyed by
+product id and by category, and the rules that apply to everything. Pricing a cart
+looks up only the rules reachable from its products and categories, scores every
+(line, rule) pair as an n x k matrix and keeps the best rule per line, so the cost is
+independent of how many promotions exist for other products.
+
+    percent_off   value% off the line
+    amount_off    value off each unit (never below zero)
+    buy_x_get_y   for every buy_quantity + get_quantity units, get_quantity are free
+
+Rules do not stack: each line gets the single largest discount it qualifies for. A rule
+with a coupon_code only counts when that code is entered (case-insensitive).
+
+The index is rebuilt at most every INDEX_TTL seconds (PROMOTIONS_INDEX_TTL, default 60),
+or on the next request after invalidate(), which the admin endpoints call. Other
+workers pick up rule changes within INDEX_TTL. Priced carts are cached by their
+contents (product, size, quantity, price), the coupon and the index version, so
+re-reading an unchanged cart, as GET /api/cart/ does on every page, is a dict lookup;
+an entry expires no later than the next starts_at/ends_at of a rule it could use.
+Checkout always prices afresh.
+
+numpy is imported where the pricing runs, not at module level, so importing this module
+(crud does, for normalize_code and invalidate) costs nothing until a cart is priced.
+"""
+import os
+import threading
+import time
+from datetime import timezone
+from typing import NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+import cache, models, schemas
+
+INDEX_TTL = float(os.getenv("PROMOTIONS_INDEX_TTL", "60"))
+
+_KIND_CODES = {kind: code for code, kind in enumerate(models.PROMOTION_KINDS)}
+PERCENT_OFF, AMOUNT_OFF, BUY_X_GET_Y = (_KIND_CODES[k] for k in models.PROMOTION_KINDS)
+
+# Pricing results keyed by (index version, coupon, cart lines)
+pricing_cache = cache.TTLCache("cart_pricing", ttl=300.0, maxsize=20000)
+
+
+def normalize_code(code: Optional[str]) -> Optional[str]:
+    code = (code or "").strip().upper()
+    return code or None
+
+
+def _epoch(ts, default: float) -> float:
+    if ts is None:
+        return default
+    if ts.tzinfo is None:  # SQLite hands back naive datetimes; they are stored as UTC
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class PromotionIndex:
+    def __init__(self, rules, version: int):
+        import numpy as np
+        self.version = version
+        self.ids = np.array([r.id for r in rules], dtype=np.int64)
+        self.names = [r.name for r in rules]
+        self.kind = np.array([_KIND_CODES.get(r.kind, -1) for r in rules], dtype=np.int8)
+        self.value = np.array([r.value or 0.0 for r in rules], dtype=np.float64)
+        self.buy = np.array([r.buy_quantity or 0 for r in rules], dtype=np.int64)
+        self.get = np.array([r.get_quantity or 0 for r in rules], dtype=np.int64)
+        self.starts = np.array([_epoch(r.starts_at, -np.inf) for r in rules], dtype=np.float64)
+        self.ends = np.array([_epoch(r.ends_at, np.inf) for r in rules], dtype=np.float64)
+        self.code_of = {}  # coupon code -> int, 0 meaning "no coupon needed"
+        self.coupon = np.array([self.code_of.setdefault(c, len(self.code_of) + 1) if c else 0
+                                for c in map(normalize_code, (r.coupon_code for r in rules))], dtype=np.int64)
+
+        by_product, by_category, everything = {}, {}, []
+        for i, r in enumerate(rules):
+            if r.product_id is not None:
+                by_product.setdefault(r.product_id, []).append(i)
+            elif r.category:
+                by_category.setdefault(r.category, []).append(i)
+            else:
+                everything.append(i)
+        self.by_product = {k: np.array(v, dtype=np.int64) for k, v in by_product.items()}
+        self.by_category = {k: np.array(v, dtype=np.int64) for k, v in by_category.items()}
+        self.everything = np.array(everything, dtype=np.int64)
+        self.empty = np.empty(0, dtype=np.int64)
+        # Scope of each rule as integers (-1: not scoped that way), for the applicability mask
+        self.category_code = {c: i for i, c in enumerate(by_category)}
+        self.scope_product = np.array([-1 if r.product_id is None else r.product_id for r in rules], dtype=np.int64)
+        self.scope_category = np.array([self.category_code[r.category] if r.product_id is None and r.category else -1
+                                        for r in rules], dtype=np.int64)
+
+    def reachable(self, product_ids, categories) -> "np.ndarray":
+        """Positions of the rules scoped to any of these products/categories, or to everything."""
+        import numpy as np
+        parts = [self.everything]
+        parts += [self.by_product.get(p, self.empty) for p in set(product_ids)]
+        parts += [self.by_category.get(c, self.empty) for c in set(categories)]
+        return np.unique(np.concatenate(parts))
+
+    def candidates(self, product_ids, categories, coupon: Optional[str], now: float) -> "np.ndarray":
+        """The reachable rules that are live at `now` and need no coupon or this coupon."""
+        rules = self.reachable(product_ids, categories)
+        if not rules.size:
+            return rules
+        code = self.code_of.get(coupon, -1) if coupon else -1
+        live = (self.starts[rules] <= now) & (now < self.ends[rules])
+        return rules[live & ((self.coupon[rules] == 0) | (self.coupon[rules] == code))]
+
+    def next_change(self, product_ids, categories, coupon: Optional[str], now: float) -> float:
+        """Seconds until one of the rules that could price these lines starts or ends (inf if never)."""
+        import numpy as np
+        rules = self.reachable(product_ids, categories)
+        code = self.code_of.get(coupon) if coupon else None
+        if code is not None:
+            rules = np.union1d(rules, np.flatnonzero(self.coupon == code))
+        bounds = np.concatenate([self.starts[rules], self.ends[rules]])
+        bounds = bounds[bounds > now]
+        return float(bounds.min() - now) if bounds.size else float("inf")
+
+    def coupon_is_live(self, coupon: str, now: float) -> bool:
+        import numpy as np
+        code = self.code_of.get(coupon)
+        if code is None:
+            return False
+        rules = np.flatnonzero(self.coupon == code)
+        return bool(((self.starts[rules] <= now) & (now < self.ends[rules])).any())
+
+
+_index: Optional[PromotionIndex] = None
+_index_built = 0.0
+_index_lock = threading.Lock()
+
+
+def invalidate():
+    """Rebuild the index on the next pricing call in this worker."""
+    global _index_built
+    _index_built = 0.0
+
+
+def get_index(db: Session) -> PromotionIndex:
+    global _index, _index_built
+    if _index is not None and time.monotonic() - _index_built < INDEX_TTL:
+        return _index
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_built >= INDEX_TTL:
+            rules = db.query(models.Promotion).filter(models.Promotion.active.is_(True)).order_by(models.Promotion.id).all()
+            _index = PromotionIndex(rules, version=(_index.version + 1) if _index else 1)
+            _index_built = time.monotonic()
+    return _index
+
+
+class LinePrice(NamedTuple):
+    discount: float
+    promotion_id: Optional[int]
+    promotion: Optional[str]
+
+
+class CartPrice(NamedTuple):
+    subtotal: float
+    discount: float
+    total: float
+    coupon_code: Optional[str]  # the entered code, if it is a live coupon
+    lines: Tuple[LinePrice, ...]
+
+
+def evaluate(index: PromotionIndex, lines, coupon: Optional[str] = None, now: Optional[float] = None) -> CartPrice:
+    """Price `lines`, a sequence of (product_id, category, unit_price, quantity)."""
+    import numpy as np
+    now = time.time() if now is None else now
+    coupon = normalize_code(coupon)
+    n = len(lines)
+    product_ids = np.array([l[0] for l in lines], dtype=np.int64)
+    price = np.array([l[2] or 0.0 for l in lines], dtype=np.float64)
+    qty = np.array([l[3] for l in lines], dtype=np.int64)
+    gross = price * qty
+    discount = np.zeros(n)
+    best = np.full(n, -1, dtype=np.int64)
+
+    rules = index.candidates(product_ids.tolist(), [l[1] for l in lines], coupon, now) if n else index.empty
+    if rules.size:
+        kind, value = index.kind[rules], index.value[rules]
+        buy, get = index.buy[rules], index.get[rules]
+        categories = np.array([index.category_code.get(l[1], -2) for l in lines], dtype=np.int64)
+        rule_products, rule_categories = index.scope_product[rules], index.scope_category[rules]
+        # applies[i, j]: rule j covers line i (its product, its category, or everything)
+        applies = (
+            (rule_products[None, :] == product_ids[:, None])
+            | (rule_categories[None, :] == categories[:, None])
+            | ((rule_products == -1) & (rule_categories == -1))[None, :]
+        )
+        bundle = np.maximum(buy + get, 1)
+        scores = np.select(
+            [kind == PERCENT_OFF, kind == AMOUNT_OFF, (kind == BUY_X_GET_Y) & (get > 0)],
+            [
+                gross[:, None] * (np.clip(value, 0, 100) / 100)[None, :],
+                np.minimum(np.maximum(value, 0)[None, :], price[:, None]) * qty[:, None],
+                (qty[:, None] // bundle[None, :]) * get[None, :] * price[:, None],
+            ],
+            default=0.0,
+        )
+        scores = np.where(applies, scores, 0.0)
+        pick = scores.argmax(axis=1)
+        discount = np.round(scores[np.arange(n), pick], 2)
+        best = np.where(discount > 0, rules[pick], -1)
+
+    subtotal = round(float(gross.sum()), 2)
+    total_discount = round(float(discount.sum()), 2)
+    return CartPrice(
+        subtotal=subtotal,
+        discount=total_discount,
+        total=round(subtotal - total_discount, 2),
+        coupon_code=coupon if coupon and index.coupon_is_live(coupon, now) else None,
+        lines=tuple(
+            LinePrice(float(d), int(index.ids[b]), index.names[b]) if b >= 0 else LinePrice(0.0, None, None)
+            for d, b in zip(discount, best)
+        ),
+    )
+
+
+def price_lines(db: Session, lines, coupon: Optional[str] = None, cached: bool = True) -> CartPrice:
+    """evaluate() against the current index, cached per cart contents and coupon.
+
+    `lines` is a sequence of (product_id, category, unit_price, quantity, size). A cached
+    result never outlives the next start or end of a rule that could apply to it.
+    Checkout passes cached=False: it must see exactly the rules live right now.
+    """
+    index = get_index(db)
+    coupon = normalize_code(coupon)
+    if not cached:
+        return evaluate(index, [line[:4] for line in lines], coupon)
+    key = (index.version, coupon, tuple(lines))
+    priced = pricing_cache.get(key)
+    if priced is cache.MISSING:
+        now = time.time()
+        priced = evaluate(index, [line[:4] for line in lines], coupon, now)
+        lifetime = index.next_change([l[0] for l in lines], [l[1] for l in lines], coupon, now)
+        if lifetime > 0:
+            pricing_cache.set(key, priced, ttl=lifetime)
+    return priced
+
+
+def price_cart(db: Session, cart, coupon: Optional[str] = None) -> schemas.Cart:
+    """A schemas.Cart for `cart` (ORM object or dict) with discounts and totals filled in."""
+    cart = schemas.Cart.model_validate(cart)
+    priced = price_lines(db, [
+        (item.product_id, item.product.category, item.product.price, item.quantity, item.size)
+        for item in cart.items
+    ], coupon)
+    for item, line in zip(cart.items, priced.lines):
+        item.discount, item.promotion_id, item.promotion = line
+    cart.subtotal, cart.discount, cart.total, cart.coupon_code = priced[:4]
+    return cart
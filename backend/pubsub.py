@@ -0,0 +1,212 @@
+"""
+pubsub.py
+Topic-based fan-out for the live update streams in routers/events.py.
+
+Topics used by the app:
+    product:<id>   {"type": "stock", "product_id", "stock", "price"}
+    orders         {"type": "order.created", "order_id", "status", "total_price"}
+                   {"type": "order.status", "order_ids", "status"}                 (admin only)
+
+Within a worker, subscribers get messages straight from an in-process broker. With REDIS_URL
+set (and the `redis` package installed) messages go through Redis pub/sub instead, so a
+change made on one worker reaches subscribers connected to every other worker.
+
+Each subscriber has a bounded queue. A slow consumer first loses its oldest queued messages;
+if it keeps falling behind it is disconnected and is expected to reconnect and refetch.
+
+In-process handlers registered with handle() get every message on their topic, called
+synchronously from the delivering thread; cache.py uses one for cross-worker invalidation.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+QUEUE_SIZE = 100
+MAX_DROPPED = 500
+REDIS_URL = os.getenv("REDIS_URL", "")
+REDIS_CHANNEL_PREFIX = "cloth_store:"
+RECONNECT_MIN, RECONNECT_MAX = 1.0, 30.0  # listener reconnect backoff, seconds
+
+
+class Subscription:
+    def __init__(self, broker, topics):
+        self.broker = broker
+        self.topics = set(topics)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = 0
+        self.closed = False
+
+    def _put(self, message):
+        # Runs on the subscriber's event loop
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.dropped > MAX_DROPPED:
+                self.close()
+                return
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        """Next message, or None once the subscription has been closed."""
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def add(self, topics):
+        self.topics.update(topics)
+        self.broker._ensure_listening(topics)
+
+    def remove(self, topics):
+        self.topics.difference_update(topics)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker._subscribers.discard(self)
+            # Wake a waiting get()
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+
+class LocalBroker:
+    """In-process broker; also the local delivery stage of RedisBroker."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._handlers = {}  # topic -> [callback(message)]
+
+    def subscribe(self, topics) -> Subscription:
+        sub = Subscription(self, topics)
+        self._subscribers.add(sub)
+        self._ensure_listening(topics)
+        return sub
+
+    def add_handler(self, topic: str, callback):
+        self._handlers.setdefault(topic, []).append(callback)
+        self._ensure_listening([topic])
+
+    def _ensure_listening(self, topics):
+        pass
+
+    def _deliver(self, topic: str, message: dict):
+        payload = dict(message, topic=topic)
+        for callback in self._handlers.get(topic, ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"[pubsub] handler for {topic} failed: {e}")
+        for sub in list(self._subscribers):
+            if topic in sub.topics:
+                # Safe from worker threads (sync endpoints) and from the loop itself
+                try:
+                    sub.loop.call_soon_threadsafe(sub._put, payload)
+                except RuntimeError:
+                    # The subscriber's event loop is gone
+                    self._subscribers.discard(sub)
+
+    def publish(self, topic: str, message: dict):
+        self._deliver(topic, message)
+
+
+class RedisBroker(LocalBroker):
+    def __init__(self, url: str):
+        import redis
+
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, message: dict):
+        self._redis.publish(REDIS_CHANNEL_PREFIX + topic, json.dumps(message, default=str))
+
+    def _ensure_listening(self, topics):
+        # One pattern subscription per worker relays every channel to local subscribers
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="pubsub-redis", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        # Runs for the life of the worker: a dropped connection is retried with backoff
+        # (messages published meanwhile are lost, as with any Redis pub/sub gap)
+        delay = RECONNECT_MIN
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(REDIS_CHANNEL_PREFIX + "*")
+                if delay > RECONNECT_MIN:
+                    print("[pubsub] reconnected to Redis")
+                delay = RECONNECT_MIN
+                for item in pubsub.listen():
+                    channel = item["channel"].decode()
+                    try:
+                        message = json.loads(item["data"])
+                    except ValueError:
+                        continue
+                    self._deliver(channel[len(REDIS_CHANNEL_PREFIX):], message)
+            except Exception as e:
+                print(f"[pubsub] Redis listener lost its connection ({e}); retrying in {delay:g}s")
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+
+def _make_broker():
+    if REDIS_URL:
+        try:
+            return RedisBroker(REDIS_URL)
+        except ImportError:
+            print("[pubsub] REDIS_URL is set but the redis package is not installed; using in-process broker")
+    return LocalBroker()
+
+
+broker = _make_broker()
+
+
+def publish(topic: str, message: dict):
+    broker.publish(topic, message)
+
+
+def handle(topic: str, callback):
+    """Call callback(message) in this process for every message published on topic."""
+    broker.add_handler(topic, callback)
+
+
+# ── Publish on commit ─────────────────────────────────────────────────────────
+
+def publish_after_commit(db: Session, topic: str, message: dict):
+    """Queue a message on the session; it is published only if the transaction commits."""
+    db.info.setdefault("pubsub_pending", []).append((topic, message))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    for topic, message in session.info.pop("pubsub_pending", []):
+        try:
+            publish(topic, message)
+        except Exception as e:
+            # Live updates are best effort; never fail a committed write over them
+            print(f"[pubsub] publish to {topic} failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop("pubsub_pending", None)
+
+
+def stock_message(product) -> dict:
+    return {"type": "stock", "product_id": product.id, "stock": product.stock, "price": product.price}
@@ -0,0 +1,120 @@
+"""
+recommendations.py
+"Customers also bought" product relations, computed in batch from order items.
+
+Every order is a row of a sparse orders x products purchase matrix X. X.T @ X gives how
+many orders contain each pair of products; normalising by each product's own order count
+gives the cosine similarity between products. The top TOP_K neighbours of every product
+are written to product_relations in one transaction, so GET /api/products/{id}/related
+only reads a handful of precomputed rows (crud.get_related_product_ids, cached on top
+of that). numpy and scipy are needed by this batch job only, never by the API.
+
+Pairs bought together in fewer than --min-support orders are ignored; otherwise two
+products that each sold once, in the same order, would look perfectly related.
+
+Run after deploying and then periodically (cron, or --interval to keep running):
+Usage: python recommendations.py rebuild [--top-k 20] [--min-support 2] [--interval SECONDS]
+"""
+import time
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, insert, select, union
+import cache, models
+
+TOP_K = models.RELATED_TOP_K
+MIN_SUPPORT = 2
+INSERT_BATCH = 10000
+
+
+def _purchase_pairs(conn) -> np.ndarray:
+    """Distinct (order_id, product_id) pairs, archived orders included, as an (n, 2) int64
+    array read in partitions."""
+    stmt = union(*(
+        select(item.order_id, item.product_id)
+        .where(item.order_id.is_not(None), item.product_id.is_not(None))
+        for item in (models.OrderItem, models.ArchivedOrderItem)
+    ))
+    result = conn.execution_options(yield_per=50000).execute(stmt)
+    chunks = [np.array(part, dtype=np.int64) for part in result.partitions()]
+    return np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+
+def compute_relations(pairs: np.ndarray, top_k: int = TOP_K, min_support: int = MIN_SUPPORT):
+    """Top-k cosine neighbours per product from (order_id, product_id) pairs.
+
+    Returns parallel arrays (product_id, related_id, rank, score, co_purchases),
+    sorted by product_id then rank.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(pairs) == 0:
+        return empty, empty, empty, np.empty(0), empty
+
+    _, order_idx = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, product_idx = np.unique(pairs[:, 1], return_inverse=True)
+    purchases = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (order_idx, product_idx)),
+        shape=(order_idx.max() + 1, len(product_ids)),
+    )
+    # Orders containing each product, and orders containing each pair of products
+    counts = np.asarray(purchases.sum(axis=0)).ravel()
+    co = (purchases.T @ purchases).tocoo()
+
+    keep = (co.row != co.col) & (co.data >= min_support)
+    rows, cols, together = co.row[keep], co.col[keep], co.data[keep]
+    scores = together / np.sqrt(counts[rows].astype(np.float64) * counts[cols])
+
+    # Best first within each product (ties broken by support, then id), then cut at top_k
+    order = np.lexsort((cols, -together, -scores, rows))
+    rows, cols, together, scores = rows[order], cols[order], together[order], scores[order]
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left") + 1
+    keep = ranks <= top_k
+    return (product_ids[rows[keep]], product_ids[cols[keep]], ranks[keep],
+            scores[keep], together[keep].astype(np.int64))
+
+
+def rebuild(engine, top_k: int = TOP_K, min_support: int = MIN_SUPPORT) -> dict:
+    """Recompute product_relations from all orders, replacing the previous results atomically."""
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        pairs = _purchase_pairs(conn)
+        product_ids, related_ids, ranks, scores, together = compute_relations(pairs, top_k, min_support)
+
+        conn.execute(delete(models.ProductRelation))
+        table = models.ProductRelation.__table__
+        for start in range(0, len(product_ids), INSERT_BATCH):
+            end = start + INSERT_BATCH
+            conn.execute(insert(table), [
+                {"product_id": p, "related_id": r, "rank": k, "score": s, "co_purchases": c}
+                for p, r, k, s, c in zip(product_ids[start:end].tolist(), related_ids[start:end].tolist(),
+                                         ranks[start:end].tolist(), scores[start:end].tolist(),
+                                         together[start:end].tolist())
+            ])
+
+    # Drops the cached lists here and, over pubsub, in every API worker
+    cache.invalidate(cache.related_cache)
+    return {
+        "orders": int(len(np.unique(pairs[:, 0]))),
+        "products": int(len(np.unique(product_ids))),
+        "relations": int(len(product_ids)),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import database
+
+    parser = argparse.ArgumentParser(description="Rebuild co-purchase product relations.")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--min-support", type=int, default=MIN_SUPPORT)
+    parser.add_argument("--interval", type=float, default=0, help="rebuild every N seconds instead of once")
+    args = parser.parse_args()
+
+    while True:
+        stats = rebuild(database.get_engine(), args.top_k, args.min_support)
+        print(f"[✓] {stats['relations']} relations for {stats['products']} products "
+              f"from {stats['orders']} orders in {stats['seconds']}s")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
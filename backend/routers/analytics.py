@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from datetime import datetime
+import analytics, schemas, dependencies, models
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"]
+)
+
+def _check_grain(grain: str):
+    if grain not in analytics.GRAINS:
+        raise HTTPException(status_code=400, detail=f"grain must be one of {', '.join(analytics.GRAINS)}")
+
+# All analytics endpoints are admin only and read from the rollup tables, never from orders.
+# Ranges default to the last 30 days; `end` is inclusive of its hour/day bucket.
+@router.get("/sales", response_model=schemas.SalesSummary)
+def sales_summary(start: Optional[datetime] = None, end: Optional[datetime] = None, grain: str = "day", db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    _check_grain(grain)
+    start, end = analytics.default_range(start, end)
+    return analytics.sales_summary(db, start, end, grain)
+
+@router.get("/sales/breakdown", response_model=List[schemas.SalesBreakdownRow])
+def sales_breakdown(group_by: str = "product", start: Optional[datetime] = None, end: Optional[datetime] = None, grain: str = "day", limit: int = 50, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    _check_grain(grain)
+    if group_by not in analytics.GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(analytics.GROUP_BY)}")
+    start, end = analytics.default_range(start, end)
+    return analytics.sales_breakdown(db, start, end, group_by, grain, limit)
+
+@router.get("/funnel", response_model=Dict[str, int])
+def status_funnel(start: Optional[datetime] = None, end: Optional[datetime] = None, grain: str = "day", db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    _check_grain(grain)
+    start, end = analytics.default_range(start, end)
+    return analytics.status_funnel(db, start, end, grain)
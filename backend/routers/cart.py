@@ -1,23 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
-import crud, schemas, dependencies, models
+from typing import List, Optional
+import crud, schemas, dependencies, models, cart_store, promotions
 
 router = APIRouter(
     prefix="/cart",
     tags=["cart"]
 )
 
+# Every endpoint returns the cart priced by promotions.py; pass ?coupon= to include a coupon
+
 @router.get("/", response_model=schemas.Cart)
-def get_cart(db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def get_cart(coupon: Optional[str] = None, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if cart_store.enabled:
+        return promotions.price_cart(db, cart_store.get_cart(db, current_user.id), coupon)
     cart = crud.get_cart(db, user_id=current_user.id)
     if not cart:
         # Auto-create cart if accessing getting it
         cart = crud.create_cart(db, user_id=current_user.id)
-    return cart
+    return promotions.price_cart(db, cart, coupon)
 
 @router.post("/items", response_model=schemas.Cart)
-def add_item_to_cart(item: schemas.CartItemCreate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def add_item_to_cart(item: schemas.CartItemCreate, coupon: Optional[str] = None, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     # Check if stock is available
     product = crud.get_product(db, item.product_id)
     if not product:
@@ -27,25 +31,33 @@ def add_item_to_cart(item: schemas.CartItemCreate, db: Session = Depends(depende
     if product.stock < item.quantity:
         raise HTTPException(status_code=400, detail="Not enough stock")
 
-    return crud.add_to_cart(db, user_id=current_user.id, item=item)
+    if cart_store.enabled:
+        return promotions.price_cart(db, cart_store.add_item(db, current_user.id, item.product_id, item.size, item.quantity), coupon)
+    return promotions.price_cart(db, crud.add_to_cart(db, user_id=current_user.id, item=item), coupon)
 
 @router.put("/items/{product_id}", response_model=schemas.Cart)
-def update_cart_item(product_id: int, update: schemas.CartItemUpdate, size: str = "M", db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def update_cart_item(product_id: int, update: schemas.CartItemUpdate, size: str = "M", coupon: Optional[str] = None, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if cart_store.enabled:
+        return promotions.price_cart(db, cart_store.set_item(db, current_user.id, product_id, size, update.quantity), coupon)
     cart = crud.update_cart_item(db, user_id=current_user.id, product_id=product_id, size=size, quantity=update.quantity)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart or item not found")
-    return cart
+    return promotions.price_cart(db, cart, coupon)
 
 @router.delete("/items/{product_id}", response_model=schemas.Cart)
-def remove_item_from_cart(product_id: int, size: str = "M", db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def remove_item_from_cart(product_id: int, size: str = "M", coupon: Optional[str] = None, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if cart_store.enabled:
+        return promotions.price_cart(db, cart_store.set_item(db, current_user.id, product_id, size, 0), coupon)
     cart = crud.remove_from_cart(db, user_id=current_user.id, product_id=product_id, size=size)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
-    return cart
+    return promotions.price_cart(db, cart, coupon)
 
 @router.delete("/", response_model=schemas.Cart)
 def clear_cart(db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    if cart_store.enabled:
+        return promotions.price_cart(db, cart_store.clear_cart(db, current_user.id))
     cart = crud.clear_cart(db, user_id=current_user.id)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
-    return cart
+    return promotions.price_cart(db, cart)
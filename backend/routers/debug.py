@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+import profiling, dependencies, models
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"]
+)
+
+# Only included when PROFILING_ENABLED=1; every endpoint is admin only.
+
+@router.get("/profiles")
+def list_profiles(current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """Background-sampled request profiles, newest first."""
+    return [{k: v for k, v in p.items() if k != "sampler"} for p in reversed(profiling.recent_profiles)]
+
+@router.get("/profiles/{profile_id}")
+def read_profile(profile_id: int, format: str = Query("folded", pattern="^(folded|speedscope|top)$"), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    for p in profiling.recent_profiles:
+        if p["id"] == profile_id:
+            content_type, body = profiling.render(p["sampler"], format, f"{p['method']} {p['path']}")
+            return Response(body, media_type=content_type)
+    raise HTTPException(status_code=404, detail="Profile not found (only the most recent are kept)")
+
+@router.post("/tracemalloc/start")
+def tracemalloc_start(frames: int = Query(10, ge=1, le=50), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    profiling.tracemalloc_start(frames)
+    return {"tracing": True}
+
+@router.post("/tracemalloc/stop")
+def tracemalloc_stop(current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    profiling.tracemalloc_stop()
+    return {"tracing": False}
+
+@router.post("/tracemalloc/snapshot")
+def tracemalloc_snapshot(limit: int = Query(25, ge=1, le=200), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """Snapshot current allocations; later diffs are relative to this one."""
+    return profiling.tracemalloc_snapshot(limit)
+
+@router.get("/tracemalloc/diff")
+def tracemalloc_diff(limit: int = Query(25, ge=1, le=200), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    result = profiling.tracemalloc_diff(limit)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/slow-queries")
+def list_slow_queries(current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    return [{k: v for k, v in q.items() if k not in ("parameters", "plan")} for q in reversed(profiling.slow_queries)]
+
+@router.get("/slow-queries/{query_id}")
+def read_slow_query(query_id: int, current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """A recorded slow query with its parameters and (computed on first view) its plan."""
+    for q in profiling.slow_queries:
+        if q["id"] == query_id:
+            profiling.explain(q)
+            return {**q, "parameters": repr(q["parameters"])}
+    raise HTTPException(status_code=404, detail="Slow query not found (only the most recent are kept)")
@@ -0,0 +1,121 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+import auth, crud, database, pubsub
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"]
+)
+
+ADMIN_TOPICS = {"orders"}
+HEARTBEAT_SECONDS = 15
+
+
+def _is_admin(token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        email = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+    except JWTError:
+        return False
+    # Short-lived session: a stream can stay open for hours and must not pin a connection
+    db = database.get_sessionmaker()()
+    try:
+        user = crud.get_user_by_email(db, email=email) if email else None
+        return bool(user and user.is_admin)
+    finally:
+        db.close()
+
+
+def _parse_topics(raw) -> set:
+    topics = {t.strip() for t in (raw or []) if t and t.strip()}
+    for topic in topics:
+        if topic not in ADMIN_TOPICS and not (topic.startswith("product:") and topic[8:].isdigit()):
+            raise ValueError(f"Unknown topic: {topic}")
+    return topics
+
+
+async def _authorize(topics: set, token: Optional[str]):
+    if topics & ADMIN_TOPICS and not await run_in_threadpool(_is_admin, token):
+        raise PermissionError("Admin token required for: " + ", ".join(sorted(topics & ADMIN_TOPICS)))
+
+
+# `token` is a query parameter because EventSource cannot send an Authorization header.
+# It is only needed for admin topics.
+@router.get("/stream")
+async def stream_events(request: Request, topics: str, token: Optional[str] = None):
+    """Server-Sent Events: one `data:` line of JSON per message on the comma-separated topics."""
+    try:
+        wanted = _parse_topics(topics.split(","))
+        await _authorize(wanted, token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    subscription = pubsub.broker.subscribe(wanted)
+
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(subscription.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    # Dropped as a slow consumer; the browser reconnects after `retry`
+                    break
+                yield f"event: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket, topics: str = "", token: Optional[str] = None):
+    """WebSocket: send {"subscribe": [...]} / {"unsubscribe": [...]} to change topics at any time."""
+    await websocket.accept()
+    subscription = None
+    try:
+        wanted = _parse_topics(topics.split(","))
+        await _authorize(wanted, token)
+        subscription = pubsub.broker.subscribe(wanted)
+
+        async def forward():
+            while True:
+                message = await subscription.get()
+                if message is None:
+                    await websocket.close(code=1013, reason="Too slow, reconnect")
+                    return
+                await websocket.send_text(json.dumps(message, default=str))
+
+        sender = asyncio.create_task(forward())
+        try:
+            while True:
+                request = json.loads(await websocket.receive_text())
+                if not isinstance(request, dict):
+                    raise ValueError("Expected a JSON object")
+                subscribe, unsubscribe = request.get("subscribe", []), request.get("unsubscribe", [])
+                if not all(isinstance(v, list) and all(isinstance(t, str) for t in v) for v in (subscribe, unsubscribe)):
+                    raise ValueError("subscribe/unsubscribe must be lists of topic strings")
+                added = _parse_topics(subscribe)
+                await _authorize(added, token)
+                subscription.add(added)
+                subscription.remove(set(unsubscribe))
+        finally:
+            sender.cancel()
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, PermissionError) as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+    finally:
+        if subscription is not None:
+            subscription.close()
@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+import database, dependencies, models
+
+router = APIRouter(
+    prefix="/export",
+    tags=["export"]
+)
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+CHUNK_ROWS = 2000
+
+
+def _stream_rows(stmt, fmt: str):
+    """Yield the result of `stmt` as CSV/JSONL text, one chunk per fetched batch of rows.
+
+    Rows come from a server-side cursor (stream_results) on a dedicated connection that
+    is returned to the pool as soon as the last row is written or the client goes away.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    with database.get_engine().connect() as conn:
+        result = conn.execution_options(yield_per=CHUNK_ROWS).execute(stmt)
+        if fmt == "csv":
+            writer.writerow(result.keys())
+        for rows in result.partitions():
+            for row in rows:
+                if fmt == "csv":
+                    # JSON columns (images, sizes) as JSON text rather than Python reprs
+                    writer.writerow([json.dumps(v) if isinstance(v, (list, dict)) else v for v in row])
+                else:
+                    buffer.write(json.dumps(row._asdict(), default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+def _export(stmt, name: str, fmt: str, db: Session):
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    # Give back the request session's connection (used only for the admin check)
+    # so a long download holds exactly one pooled connection.
+    db.close()
+    return StreamingResponse(
+        _stream_rows(stmt, fmt),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+
+def _order_lines(order, item, status: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    stmt = (
+        select(
+            order.id.label("order_id"),
+            order.created_at,
+            order.status,
+            order.user_id,
+            models.User.email,
+            order.total_price,
+            order.shipping_address,
+            item.product_id,
+            models.Product.title.label("product_title"),
+            item.size,
+            item.quantity,
+            item.price,
+            item.id.label("item_id"),
+        )
+        .join(item, item.order_id == order.id)
+        .outerjoin(models.Product, models.Product.id == item.product_id)
+        .outerjoin(models.User, models.User.id == order.user_id)
+    )
+    if status:
+        stmt = stmt.where(order.status == status)
+    if start:
+        stmt = stmt.where(order.created_at >= start)
+    if end:
+        stmt = stmt.where(order.created_at < end)
+    return stmt
+
+
+# Admin only
+@router.get("/orders")
+def export_orders(format: str = "csv", status: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """One row per order line, oldest order first, archived orders included."""
+    lines = union_all(
+        _order_lines(models.Order, models.OrderItem, status, start, end),
+        _order_lines(models.ArchivedOrder, models.ArchivedOrderItem, status, start, end),
+    ).subquery()
+    stmt = (
+        select(*(c for c in lines.c if c.name != "item_id"))
+        .order_by(lines.c.order_id, lines.c.item_id)
+    )
+    return _export(stmt, "orders", format, db)
+
+
+@router.get("/products")
+def export_products(format: str = "csv", db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    stmt = select(
+        models.Product.id,
+        models.Product.title,
+        models.Product.description,
+        models.Product.price,
+        models.Product.category,
+        models.Product.stock,
+        models.Product.images,
+        models.Product.sizes,
+    ).order_by(models.Product.id)
+    return _export(stmt, "products", format, db)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+import database
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"]
+)
+
+@router.get("/live")
+def liveness():
+    """The process is up and serving; never touches the database."""
+    return {"status": "ok"}
+
+@router.get("/ready")
+def readiness(request: Request):
+    """Ready for traffic: startup (and warm-up) finished and the database answers."""
+    startup = getattr(request.app.state, "startup", None)
+    if startup is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    try:
+        with database.get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse({"status": "database unavailable", "error": type(e).__name__}, status_code=503)
+    return {"status": "ready", "startup": startup}
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from typing import List
-from pydantic import BaseModel
-import crud, schemas, dependencies, models
+from typing import List, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+import crud, schemas, dependencies, models, cart_store
 
 router = APIRouter(
     prefix="/orders",
@@ -12,15 +13,65 @@ router = APIRouter(
 class StatusUpdate(BaseModel):
     status: str
 
+class BulkStatusUpdate(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1, max_length=5000)
+    status: str
+    # Only move orders currently in this status (e.g. Pending -> Dispatched)
+    from_status: Optional[str] = None
+
 @router.post("/", response_model=schemas.Order)
 def create_order(order: schemas.OrderCreate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     return crud.create_order(db=db, order=order, user_id=current_user.id)
 
+@router.post("/from-cart", response_model=schemas.Order)
+def create_order_from_cart(body: schemas.CartCheckout, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """Place an order for everything in the user's server-side cart and empty it."""
+    if cart_store.enabled:
+        cart_store.flush_user(current_user.id)
+    order = crud.create_order_from_cart(db, user_id=current_user.id, shipping_address=body.shipping_address, coupon_code=body.coupon_code)
+    if cart_store.enabled:
+        cart_store.checked_out(current_user.id)
+    return order
+
 @router.get("/", response_model=List[schemas.Order])
 def read_orders(skip: int = 0, limit: int = 100, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """Admins: all orders by offset. Customers: their own orders newest first, archived
+    included, at most 100 per page. A customer's `skip` is honored by walking the keyset
+    pages up to it, so deep offsets cost more; /orders/me?cursor= pages in constant time."""
     if current_user.is_admin:
         return crud.get_orders(db, skip=skip, limit=limit)
-    return crud.get_user_orders(db, user_id=current_user.id, skip=skip, limit=limit)
+    cursor = None
+    while skip > 0:
+        skipped, cursor = crud.get_user_orders(db, user_id=current_user.id, cursor=cursor, limit=min(skip, 100))
+        if cursor is None:
+            return []  # fewer than `skip` orders
+        skip -= len(skipped)
+    orders, _ = crud.get_user_orders(db, user_id=current_user.id, cursor=cursor, limit=max(1, min(limit, 100)))
+    return orders
+
+@router.get("/me", response_model=schemas.OrderHistoryPage)
+def read_order_history(cursor: Optional[str] = None, limit: int = 20, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """The current user's orders newest first, including archived ones, paged by cursor."""
+    orders, next_cursor = crud.get_user_orders(db, user_id=current_user.id, cursor=cursor, limit=max(1, min(limit, 100)))
+    return {"items": orders, "next_cursor": next_cursor}
+
+# Admin only
+@router.get("/admin", response_model=schemas.OrderPage)
+def query_orders(status: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None, user_id: Optional[int] = None, email: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    if email:
+        customer = crud.get_user_by_email(db, email=email)
+        if customer is None:
+            return {"items": [], "next_cursor": None}
+        user_id = customer.id
+    orders, next_cursor = crud.query_orders(db, status=status, start=start, end=end, user_id=user_id, cursor=cursor, limit=max(1, min(limit, 500)))
+    return {"items": orders, "next_cursor": next_cursor}
+
+@router.put("/status", response_model=dict)
+def bulk_update_order_status(body: BulkStatusUpdate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    if body.status not in models.ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(models.ORDER_STATUSES)}")
+    updated = crud.bulk_update_order_status(db, body.order_ids, body.status, from_status=body.from_status)
+    return {"updated": updated}
 
 @router.put("/{order_id}/status", response_model=schemas.Order)
 def update_order_status(order_id: int, body: StatusUpdate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
@@ -1,30 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import hashlib
+import io
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Query, status
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from typing import List
-import crud, schemas, dependencies, models
+import crud, schemas, dependencies, models, database, catalog_import, cache
 
 router = APIRouter(
     prefix="/products",
     tags=["products"]
 )
 
+_product_json = TypeAdapter(schemas.Product)
+_product_list_json = TypeAdapter(List[schemas.Product])
+
+def _conditional(request: Request, body: bytes) -> Response:
+    """A JSON response tagged with a hash of its body, or 304 if the client has that version.
+
+    Clients revalidate with If-None-Match (Cache-Control: no-cache), so an unchanged
+    product or page costs them a bodiless 304 instead of the full JSON.
+    """
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=List[schemas.Product])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(dependencies.get_db)):
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+def read_products(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(dependencies.get_db)):
+    # Only the first pages are worth caching; deep pages are rarely requested twice
+    cacheable = skip < 500 and limit <= 100
+    products = cache.product_list_cache.get((skip, limit)) if cacheable else cache.MISSING
+    if products is cache.MISSING:
+        products = [schemas.Product.model_validate(p) for p in crud.get_products(db, skip=skip, limit=limit)]
+        if cacheable:
+            cache.product_list_cache.set((skip, limit), products)
+    return _conditional(request, _product_list_json.dump_json(products))
 
 @router.get("/{product_id}", response_model=schemas.Product)
-def read_product(product_id: int, db: Session = Depends(dependencies.get_db)):
-    db_product = crud.get_product(db, product_id=product_id)
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+def read_product(product_id: int, request: Request, db: Session = Depends(dependencies.get_db)):
+    product = cache.product_cache.get(product_id)
+    if product is cache.MISSING:
+        db_product = crud.get_product(db, product_id=product_id)
+        if db_product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        product = schemas.Product.model_validate(db_product)
+        cache.product_cache.set(product_id, product)
+    return _conditional(request, _product_json.dump_json(product))
+
+@router.get("/{product_id}/related", response_model=List[schemas.Product])
+def read_related_products(product_id: int, request: Request, limit: int = Query(8, ge=1, le=models.RELATED_TOP_K), db: Session = Depends(dependencies.get_db)):
+    """Products most often bought together with this one, from the precomputed relations."""
+    ids = crud.get_related_product_ids(db, product_id)[:limit]
+    products = crud.get_cached_products(db, ids)
+    # Products deleted since the last rebuild are simply skipped
+    return _conditional(request, _product_list_json.dump_json([products[i] for i in ids if i in products]))
 
 # Admin only
 @router.post("/", response_model=schemas.Product)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
     return crud.create_product(db=db, product=product)
 
+@router.post("/import", response_model=schemas.ImportReport)
+def import_products(file: UploadFile = File(...), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """Upsert products by title from an uploaded CSV or JSONL file."""
+    fmt = "jsonl" if (file.filename or "").endswith((".jsonl", ".ndjson")) else "csv"
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    report = catalog_import.import_products(database.get_engine(), catalog_import.read_rows(stream, fmt))
+    cache.invalidate_products()
+    return report
+
+@router.patch("/bulk", response_model=dict)
+def bulk_update_products(body: schemas.ProductBulkUpdate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    """Set price/category and adjust stock for many products in one transaction."""
+    versions = crud.bulk_update_products(db, body.updates)
+    return {"updated": len(versions), "versions": {str(k): v for k, v in versions.items()}}
+
 @router.put("/{product_id}", response_model=schemas.Product)
 def update_product(product_id: int, product: schemas.ProductUpdate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
     db_product = crud.update_product(db, product_id, product)
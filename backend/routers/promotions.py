@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+import crud, schemas, dependencies, models
+
+router = APIRouter(
+    prefix="/promotions",
+    tags=["promotions"]
+)
+
+# Admin only. Changes reach carts in this worker immediately and in the others within
+# promotions.INDEX_TTL seconds.
+@router.get("/", response_model=List[schemas.Promotion])
+def read_promotions(db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    return crud.get_promotions(db)
+
+@router.post("/", response_model=schemas.Promotion)
+def create_promotion(promotion: schemas.PromotionCreate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    return crud.create_promotion(db, promotion)
+
+@router.put("/{promotion_id}", response_model=schemas.Promotion)
+def update_promotion(promotion_id: int, promotion: schemas.PromotionCreate, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    db_promotion = crud.update_promotion(db, promotion_id, promotion)
+    if db_promotion is None:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    return db_promotion
+
+@router.delete("/{promotion_id}", response_model=schemas.Promotion)
+def delete_promotion(promotion_id: int, db: Session = Depends(dependencies.get_db), current_user: models.User = Depends(dependencies.get_current_admin_user)):
+    db_promotion = crud.delete_promotion(db, promotion_id)
+    if db_promotion is None:
+        raise HTTPException(status_code=404, detail="Promotion not found")
+    return db_promotion
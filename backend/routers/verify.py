@@ -4,12 +4,8 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import random
 import string
-import smtplib
-import os
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 
-import crud, schemas
+import crud, schemas, notifications
 from dependencies import get_db
 
 router = APIRouter(prefix="/verify", tags=["verify"])
@@ -19,14 +15,6 @@ _otp_store: dict = {}
 
 OTP_EXPIRY_MINUTES = 10
 
-# ── SMTP settings (read from env) ─────────────────────────────────────────────
-SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
-SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
-SMTP_USER = os.getenv("SMTP_USER", "")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
-FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USER)
-FROM_NAME = os.getenv("FROM_NAME", "AKR Womens Clothing")
-
 
 def _generate_otp() -> str:
     return "".join(random.choices(string.digits, k=6))
@@ -49,25 +37,6 @@ def _validate_otp(key: str, otp: str) -> bool:
     return record["otp"] == otp
 
 
-def _send_email(to_email: str, subject: str, html_body: str):
-    """Send email via Gmail SMTP. Falls back to console print if not configured."""
-    if not SMTP_USER or not SMTP_PASSWORD or SMTP_USER == "your_gmail@gmail.com":
-        print(f"\n[SMTP not configured] OTP email to {to_email}:\n{subject}\n")
-        return
-
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
-    msg["To"] = to_email
-    msg.attach(MIMEText(html_body, "html"))
-
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-        server.ehlo()
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASSWORD)
-        server.sendmail(FROM_EMAIL, to_email, msg.as_string())
-
-
 def _otp_email_html(otp: str) -> str:
     return f"""
     <div style="font-family:Arial,sans-serif;max-width:480px;margin:auto;padding:32px;background:#fff8f0;border-radius:16px;border:1px solid #f3d2c1;">
@@ -113,7 +82,7 @@ def send_email_otp(req: SendEmailOtpRequest, db: Session = Depends(get_db)):
     _save_otp(f"email:{req.email}", otp)
 
     try:
-        _send_email(
+        notifications.send_email(
             to_email=req.email,
             subject="Your AKR Verification Code",
             html_body=_otp_email_html(otp),
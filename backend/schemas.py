@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -36,10 +36,32 @@ class ProductUpdate(ProductBase):
 
 class Product(ProductBase):
     id: int
+    version: int = 1
 
     class Config:
         from_attributes = True
 
+class ProductBulkItem(BaseModel):
+    id: int
+    price: Optional[float] = None
+    stock_delta: Optional[int] = None
+    category: Optional[str] = None
+    # If given, the update only applies while the product is still at this version
+    version: Optional[int] = None
+
+class ProductBulkUpdate(BaseModel):
+    updates: List[ProductBulkItem] = Field(..., min_length=1, max_length=10000)
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    inserted: int
+    updated: int
+    error_count: int
+    errors: List[ImportRowError] = []
+
 # Order Schemas
 class OrderItemBase(BaseModel):
     product_id: int
@@ -49,10 +71,15 @@ class OrderItemBase(BaseModel):
 class OrderCreate(BaseModel):
     items: List[OrderItemBase]
     shipping_address: str
+    coupon_code: Optional[str] = None
+
+class CartCheckout(BaseModel):
+    shipping_address: str
+    coupon_code: Optional[str] = None
 
 class OrderItem(OrderItemBase):
     id: int
-    price: float # Snapshot price
+    price: float # Snapshot of the unit price paid, after promotions
 
     class Config:
         from_attributes = True
@@ -63,11 +90,24 @@ class Order(BaseModel):
     total_price: float
     shipping_address: str
     created_at: datetime
+    discount_total: float = 0.0
+    coupon_code: Optional[str] = None
     items: List[OrderItem] = []
 
     class Config:
         from_attributes = True
 
+class AdminOrder(Order):
+    user_id: Optional[int] = None
+
+class OrderPage(BaseModel):
+    items: List[AdminOrder] = []
+    next_cursor: Optional[str] = None
+
+class OrderHistoryPage(BaseModel):
+    items: List[Order] = []
+    next_cursor: Optional[str] = None
+
 # Cart Schemas
 class CartItemBase(BaseModel):
     product_id: int
@@ -83,6 +123,10 @@ class CartItemUpdate(BaseModel):
 class CartItem(CartItemBase):
     id: int
     product: Product # include product details for frontend display
+    # Filled in by promotions.price_cart: discount on this line and the promotion giving it
+    discount: float = 0.0
+    promotion_id: Optional[int] = None
+    promotion: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -94,6 +138,55 @@ class Cart(CartBase):
     id: int
     user_id: int
     items: List[CartItem] = []
+    subtotal: float = 0.0
+    discount: float = 0.0
+    total: float = 0.0
+    coupon_code: Optional[str] = None
 
     class Config:
         from_attributes = True
+
+# Promotion Schemas
+class PromotionBase(BaseModel):
+    name: str
+    kind: str  # percent_off, amount_off or buy_x_get_y
+    value: float = 0.0
+    buy_quantity: int = 0
+    get_quantity: int = 0
+    product_id: Optional[int] = None
+    category: Optional[str] = None
+    coupon_code: Optional[str] = None
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    active: bool = True
+
+class PromotionCreate(PromotionBase):
+    pass
+
+class Promotion(PromotionBase):
+    id: int
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Analytics Schemas
+class SalesBucket(BaseModel):
+    bucket: datetime
+    orders: int
+    revenue: float
+    units: int
+
+class SalesSummary(BaseModel):
+    grain: str
+    start: datetime
+    end: datetime
+    orders: int
+    revenue: float
+    units: int
+    buckets: List[SalesBucket] = []
+
+class SalesBreakdownRow(BaseModel):
+    key: str
+    units: int
+    revenue: float
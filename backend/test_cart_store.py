@@ -0,0 +1,73 @@
+"""
+test_cart_store.py — write-behind cart store against a throwaway SQLite database.
+Usage: python test_cart_store.py   (or pytest test_cart_store.py)
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="cart-store-test-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "test.db")
+
+from sqlalchemy import create_engine, event
+import database, models, cart_store
+
+
+def _setup():
+    engine = create_engine(os.environ["DATABASE_URL"])
+
+    @event.listens_for(engine, "connect")
+    def _foreign_keys(dbapi_connection, _):
+        # SQLite only enforces cart_items.product_id -> products.id when asked to
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    database.use_engine(engine)
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    db = database.get_sessionmaker()()
+    users = [models.User(email=f"cart{i}@example.com", hashed_password="x") for i in range(3)]
+    products = [models.Product(title=f"P{i}", description="", price=10.0, category="Tops", stock=5,
+                               images=[], sizes=["M"]) for i in range(2)]
+    db.add_all(users + products)
+    db.commit()
+    ids = [u.id for u in users], [p.id for p in products]
+    db.close()
+    return ids
+
+
+def _db_lines(user_id):
+    db = database.get_sessionmaker()()
+    try:
+        return cart_store._load(db, user_id)[1]
+    finally:
+        db.close()
+
+
+def test_deleted_product_does_not_block_flush():
+    (alice, bob, carol), (keep, gone) = _setup()
+    store = cart_store.MemoryCartStore(os.path.join(_tmp, "wal"))
+    empty = lambda user_id: (None, {})
+    store.set_quantity(alice, keep, "M", 1, empty, add=True)
+    store.set_quantity(alice, gone, "M", 2, empty, add=True)
+    store.set_quantity(bob, keep, "M", 3, empty, add=True)
+    # Updating a line that is not in the cart changes nothing, as crud.update_cart_item
+    store.set_quantity(carol, 999999, "M", 4, empty)
+    assert store.state(carol, empty)[1] == {}
+
+    db = database.get_sessionmaker()()
+    db.query(models.Product).filter(models.Product.id == gone).delete()
+    db.commit()
+    db.close()
+
+    sessions = database.get_sessionmaker()
+    assert store.flush(sessions) == 2
+    assert store.dirty_count() == 0
+    assert _db_lines(alice) == {(keep, "M"): 1}
+    assert _db_lines(bob) == {(keep, "M"): 3}
+    # Every logged edit is in the database, so the log is gone and a restart replays nothing
+    assert not os.listdir(os.path.join(_tmp, "wal"))
+    assert store.replay(sessions) == {"segments": 0, "carts": 0}
+    print("Deleted product test PASSED!")
+
+
+if __name__ == "__main__":
+    test_deleted_product_does_not_block_flush()
@@ -0,0 +1,130 @@
+"""
+tracing.py
+Opt-in OpenTelemetry tracing: a span per request, per crud function, per SQL statement,
+plus password hashing (auth.py) and SMTP sends (routers/verify.py).
+
+Off unless TRACING_EXPORTER is set:
+    TRACING_EXPORTER=otlp      OTLP/HTTP to a collector (OTEL_EXPORTER_OTLP_ENDPOINT,
+                               default http://localhost:4318)
+    TRACING_EXPORTER=file      one JSON span per line in TRACING_FILE (default traces.jsonl)
+    TRACING_EXPORTER=console   spans printed to stdout
+    TRACING_SAMPLE_RATIO=0.1   keep 10% of traces (default 1.0); an incoming sampled
+                               `traceparent` is always honoured
+    OTEL_SERVICE_NAME          default cloth-store-api
+
+Needs opentelemetry-sdk, opentelemetry-instrumentation-fastapi and
+opentelemetry-instrumentation-sqlalchemy (plus opentelemetry-exporter-otlp-proto-http
+for otlp). When tracing is off, span() is a shared no-op context manager and nothing
+is imported.
+"""
+import contextlib
+import functools
+import inspect
+import os
+
+EXPORTER = os.getenv("TRACING_EXPORTER", "").lower()
+SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+TRACE_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "cloth-store-api")
+
+_NOOP = contextlib.nullcontext()
+_tracer = None
+
+
+def span(name: str, **attributes):
+    """Context manager for a child span of the current trace; no-op when tracing is off."""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+def traced(name: str = None):
+    """Decorator form of span(), named after the function by default."""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _tracer.start_as_current_span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _exporter():
+    if EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if EXPORTER == "file":
+        out = open(TRACE_FILE, "a", buffering=1, encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    return ConsoleSpanExporter()
+
+
+def _trace_module_functions(module):
+    """Wrap every function defined in `module` in a span, in place.
+
+    Callers reach them as module attributes (crud.get_product, ...), and calls inside the
+    module go through its globals, so both see the wrapped versions.
+    """
+    for attr, fn in list(vars(module).items()):
+        if inspect.isfunction(fn) and fn.__module__ == module.__name__:
+            setattr(module, attr, traced(f"{module.__name__}.{attr}")(fn))
+
+
+def setup(app=None, engine=None):
+    """Enable tracing for this process if TRACING_EXPORTER is set. Safe to call more than once."""
+    global _tracer
+    if not EXPORTER or _tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        exporter = _exporter()
+    except ImportError as e:
+        print(f"[tracing] TRACING_EXPORTER={EXPORTER} but OpenTelemetry is not installed ({e}); tracing disabled")
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(SAMPLE_RATIO)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("cloth_store")
+
+    import crud
+    _trace_module_functions(crud)
+
+    if engine is not None:
+        instrument_engine(engine)
+    if app is not None:
+        try:
+            from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+            # /metrics is scraped constantly and would drown out real traffic
+            FastAPIInstrumentor.instrument_app(app, tracer_provider=provider, excluded_urls="/metrics")
+        except ImportError:
+            print("[tracing] opentelemetry-instrumentation-fastapi not installed; no request spans")
+    print(f"[tracing] exporting to {EXPORTER}, sample ratio {SAMPLE_RATIO}")
+
+
+def instrument_engine(engine):
+    """Add SQL statement spans for `engine`; no-op unless setup() enabled tracing."""
+    if _tracer is None:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+
+        SQLAlchemyInstrumentor().instrument(engine=engine, tracer_provider=trace.get_tracer_provider())
+    except ImportError:
+        print("[tracing] opentelemetry-instrumentation-sqlalchemy not installed; no SQL spans")
@@ -0,0 +1,58 @@
+"""
+warmup.py
+Optional cache warm-up, run by the app's lifespan before the worker reports ready
+(set WARMUP_ON_STARTUP=1). Without it the first requests after a deploy all miss the
+caches and open pool connections one by one.
+
+- opens up to WARMUP_CONNECTIONS pooled connections
+- caches the first catalog page, which is also the home page payload
+- caches the WARMUP_PRODUCTS best sellers of the last 30 days (from the sales rollups)
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+import cache, crud, database, models, schemas
+
+ENABLED = os.getenv("WARMUP_ON_STARTUP", "") == "1"
+WARMUP_PRODUCTS = int(os.getenv("WARMUP_PRODUCTS", "200"))
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "5"))
+
+
+def _open_connections(engine, n: int) -> int:
+    connections = []
+    try:
+        for _ in range(n):
+            connections.append(engine.connect())
+    finally:
+        # Closing returns them to the pool, already connected
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+def warm_up() -> dict:
+    started = time.perf_counter()
+    opened = _open_connections(database.get_engine(), WARMUP_CONNECTIONS)
+
+    db = database.get_sessionmaker()()
+    try:
+        first_page = [schemas.Product.model_validate(p) for p in crud.get_products(db, skip=0, limit=100)]
+        cache.product_list_cache.set((0, 100), first_page)
+
+        since = (datetime.now(timezone.utc) - timedelta(days=30)).replace(tzinfo=None)
+        best_sellers = [
+            product_id for (product_id,) in
+            db.query(models.SalesRollup.product_id)
+            .filter(models.SalesRollup.grain == "day", models.SalesRollup.bucket >= since)
+            .group_by(models.SalesRollup.product_id)
+            .order_by(func.sum(models.SalesRollup.units).desc())
+            .limit(WARMUP_PRODUCTS)
+        ]
+        products = db.query(models.Product).filter(models.Product.id.in_(best_sellers)).all() if best_sellers else []
+        for p in products:
+            cache.product_cache.set(p.id, schemas.Product.model_validate(p))
+    finally:
+        db.close()
+    return {"connections": opened, "catalog_page": len(first_page), "hot_products": len(products),
+            "seconds": round(time.perf_counter() - started, 3)}
@@ -2,6 +2,77 @@ import { useState } from 'react';
 
 const API_URL = 'http://localhost:8000/api';
 
+// ── Request cache for GETs ──────────────────────────────────────────────────
+// Concurrent calls for the same URL share one fetch. With a ttl, responses are kept
+// (keyed by URL and token): within the ttl they are returned without a request; after
+// it the stale copy is returned at once and refreshed in the background (with
+// If-None-Match, so an unchanged resource costs a 304). Mutations call invalidate()
+// for the URLs they affect, so the next read goes to the server.
+const inflight = new Map();
+const responseCache = new Map();
+
+const TTL = {
+    products: 30 * 1000,
+    related: 5 * 60 * 1000,
+};
+
+const cacheKey = (url, token) => `${token || ''} ${url}`;
+
+const revalidate = (url, { token, errorMessage, store }) => {
+    const key = cacheKey(url, token);
+    if (inflight.has(key)) return inflight.get(key);
+
+    const cached = responseCache.get(key);
+    const headers = {};
+    if (token) headers['Authorization'] = `Bearer ${token}`;
+    if (cached?.etag) headers['If-None-Match'] = cached.etag;
+
+    // A request overtaken by invalidate() still answers its callers but caches nothing
+    const current = () => inflight.get(key) === request;
+    const request = fetch(url, { headers })
+        .then(async (response) => {
+            if (response.status === 304 && cached) {
+                if (current()) cached.fetchedAt = Date.now();
+                return cached.data;
+            }
+            if (!response.ok) throw new Error(errorMessage);
+            const data = await response.json();
+            if (store && current()) responseCache.set(key, { data, etag: response.headers.get('ETag'), fetchedAt: Date.now() });
+            return data;
+        })
+        .finally(() => {
+            if (current()) inflight.delete(key);
+        });
+    inflight.set(key, request);
+    return request;
+};
+
+const cachedGet = (url, { ttl = 0, token = null, errorMessage = 'Request failed' } = {}) => {
+    // ttl 0: share the in-flight request but keep nothing afterwards
+    const store = ttl > 0;
+    const cached = store ? responseCache.get(cacheKey(url, token)) : undefined;
+    if (!cached) return revalidate(url, { token, errorMessage, store });
+    if (Date.now() - cached.fetchedAt > ttl) {
+        revalidate(url, { token, errorMessage, store }).catch(() => { });
+    }
+    return Promise.resolve(cached.data);
+};
+
+// Drop cached responses whose URL starts with any of the given prefixes
+const invalidate = (...prefixes) => {
+    for (const entries of [responseCache, inflight]) {
+        for (const key of [...entries.keys()]) {
+            const url = key.slice(key.indexOf(' ') + 1);
+            if (prefixes.some((prefix) => url.startsWith(prefix))) entries.delete(key);
+        }
+    }
+};
+
+const afterMutation = (response, ...prefixes) => {
+    if (response.ok) invalidate(...prefixes);
+    return response;
+};
+
 export const api = {
     login: async (email, password) => {
         const formData = new URLSearchParams();
@@ -70,51 +141,108 @@ export const api = {
         return res.json();
     },
 
+    // Home, the catalog, the sidebar and admin all load the first page: one request serves them
     getProducts: async (skip = 0, limit = 100) => {
-        const response = await fetch(`${API_URL}/products/?skip=${skip}&limit=${limit}`);
-        return response.json();
+        return cachedGet(`${API_URL}/products/?skip=${skip}&limit=${limit}`, {
+            ttl: TTL.products, errorMessage: 'Failed to fetch products',
+        });
     },
 
     getProduct: async (id) => {
-        const response = await fetch(`${API_URL}/products/${id}`);
-        if (!response.ok) throw new Error('Product not found');
-        return response.json();
+        return cachedGet(`${API_URL}/products/${id}`, { ttl: TTL.products, errorMessage: 'Product not found' });
     },
 
-    createOrder: async (orderData, token) => {
-        const response = await fetch(`${API_URL}/orders/`, {
+    getRelatedProducts: async (id, limit = 4) => {
+        return cachedGet(`${API_URL}/products/${id}/related?limit=${limit}`, {
+            ttl: TTL.related, errorMessage: 'Failed to fetch related products',
+        });
+    },
+
+    // Forget every cached response, e.g. on logout
+    clearCache: () => responseCache.clear(),
+
+    // Pass the same idempotencyKey when retrying so the order is only placed once
+    createOrder: async (orderData, token, idempotencyKey = crypto.randomUUID()) => {
+        const response = afterMutation(await fetch(`${API_URL}/orders/`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${token}`,
+                'Idempotency-Key': idempotencyKey,
             },
             body: JSON.stringify(orderData),
-        });
+        }), `${API_URL}/products`, `${API_URL}/cart`);
+        if (!response.ok) throw new Error('Order creation failed');
+        return response.json();
+    },
+
+    // Places an order for the logged-in user's server-side cart and empties it
+    checkoutFromCart: async (shippingAddress, token, idempotencyKey = crypto.randomUUID(), couponCode = null) => {
+        const response = afterMutation(await fetch(`${API_URL}/orders/from-cart`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`,
+                'Idempotency-Key': idempotencyKey,
+            },
+            body: JSON.stringify({ shipping_address: shippingAddress, coupon_code: couponCode || null }),
+        }), `${API_URL}/products`, `${API_URL}/cart`);
         if (!response.ok) throw new Error('Order creation failed');
         return response.json();
     },
 
     // Admin functions
     createProduct: async (productData, token) => {
-        const response = await fetch(`${API_URL}/products/`, {
+        const response = afterMutation(await fetch(`${API_URL}/products/`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${token}`,
             },
             body: JSON.stringify(productData),
-        });
+        }), `${API_URL}/products`);
         if (!response.ok) throw new Error('Failed to create product');
         return response.json();
     },
 
+    // updates: [{ id, price?, stock_delta?, category?, version? }]
+    bulkUpdateProducts: async (updates, token) => {
+        const response = afterMutation(await fetch(`${API_URL}/products/bulk`, {
+            method: 'PATCH',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`,
+            },
+            body: JSON.stringify({ updates }),
+        }), `${API_URL}/products`);
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.detail?.message || 'Bulk update failed');
+        }
+        return response.json();
+    },
+
+    importProducts: async (file, token) => {
+        const formData = new FormData();
+        formData.append('file', file);
+        const response = afterMutation(await fetch(`${API_URL}/products/import`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+            },
+            body: formData,
+        }), `${API_URL}/products`);
+        if (!response.ok) throw new Error('Failed to import products');
+        return response.json(); // { inserted, updated, error_count, errors }
+    },
+
     deleteProduct: async (id, token) => {
-        const response = await fetch(`${API_URL}/products/${id}`, {
+        const response = afterMutation(await fetch(`${API_URL}/products/${id}`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${token}`,
             },
-        });
+        }), `${API_URL}/products`);
         if (!response.ok) throw new Error('Failed to delete product');
         return response.json();
     },
@@ -155,71 +283,157 @@ export const api = {
         return response.json();
     },
 
-    getMe: async (token) => {
-        const response = await fetch(`${API_URL}/users/me/`, {
+    adminQueryOrders: async ({ status, start, end, email, cursor, limit = 50 } = {}, token) => {
+        const params = new URLSearchParams({ limit });
+        if (status) params.append('status', status);
+        if (start) params.append('start', start);
+        if (end) params.append('end', end);
+        if (email) params.append('email', email);
+        if (cursor) params.append('cursor', cursor);
+        const response = await fetch(`${API_URL}/orders/admin?${params}`, {
             headers: {
                 'Authorization': `Bearer ${token}`,
             }
         });
-        if (!response.ok) throw new Error('Failed to fetch user');
+        if (!response.ok) throw new Error('Failed to fetch orders');
+        return response.json(); // { items, next_cursor }
+    },
+
+    bulkUpdateOrderStatus: async (orderIds, newStatus, token, fromStatus = null) => {
+        const response = await fetch(`${API_URL}/orders/status`, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Bearer ${token}`,
+            },
+            body: JSON.stringify({ order_ids: orderIds, status: newStatus, from_status: fromStatus }),
+        });
+        if (!response.ok) throw new Error('Failed to update order status');
+        return response.json();
+    },
+
+    // kind: 'orders' | 'products', format: 'csv' | 'jsonl'. Returns a Blob to save.
+    adminExport: async (kind, format, token) => {
+        const response = await fetch(`${API_URL}/export/${kind}?format=${format}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+            }
+        });
+        if (!response.ok) throw new Error('Export failed');
+        return response.blob();
+    },
+
+    adminGetSalesSummary: async ({ start, end, grain = 'day' } = {}, token) => {
+        const params = new URLSearchParams({ grain });
+        if (start) params.append('start', start);
+        if (end) params.append('end', end);
+        const response = await fetch(`${API_URL}/analytics/sales?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+            }
+        });
+        if (!response.ok) throw new Error('Failed to fetch sales summary');
+        return response.json();
+    },
+
+    adminGetSalesBreakdown: async ({ groupBy = 'product', start, end, grain = 'day' } = {}, token) => {
+        const params = new URLSearchParams({ group_by: groupBy, grain });
+        if (start) params.append('start', start);
+        if (end) params.append('end', end);
+        const response = await fetch(`${API_URL}/analytics/sales/breakdown?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+            }
+        });
+        if (!response.ok) throw new Error('Failed to fetch sales breakdown');
+        return response.json();
+    },
+
+    adminGetOrderFunnel: async ({ start, end } = {}, token) => {
+        const params = new URLSearchParams();
+        if (start) params.append('start', start);
+        if (end) params.append('end', end);
+        const response = await fetch(`${API_URL}/analytics/funnel?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${token}`,
+            }
+        });
+        if (!response.ok) throw new Error('Failed to fetch order funnel');
         return response.json();
     },
 
-    // Cart functions
-    getCart: async (token) => {
-        const response = await fetch(`${API_URL}/cart/`, {
+    getMe: async (token) => {
+        const response = await fetch(`${API_URL}/users/me/`, {
             headers: {
                 'Authorization': `Bearer ${token}`,
             }
         });
-        if (!response.ok) throw new Error('Failed to fetch cart');
+        if (!response.ok) throw new Error('Failed to fetch user');
         return response.json();
     },
 
+    // Live updates over Server-Sent Events. topics: e.g. ['product:3'] or ['orders'] (admin token required).
+    // Returns a function that closes the stream.
+    subscribeEvents: (topics, onMessage, token = null) => {
+        const params = new URLSearchParams({ topics: topics.join(',') });
+        if (token) params.append('token', token);
+        const source = new EventSource(`${API_URL}/events/stream?${params}`);
+        const handler = (e) => onMessage(JSON.parse(e.data));
+        ['stock', 'order.created', 'order.status'].forEach(type => source.addEventListener(type, handler));
+        return () => source.close();
+    },
+
+    // Cart functions. Every cart response is priced: items carry `discount`, the cart
+    // `subtotal`, `discount` and `total`; pass a coupon code to price it in.
+    getCart: async (token, coupon = null) => {
+        const query = coupon ? `?coupon=${encodeURIComponent(coupon)}` : '';
+        return cachedGet(`${API_URL}/cart/${query}`, { token, errorMessage: 'Failed to fetch cart' });
+    },
+
     addToCart: async (itemData, token) => {
-        const response = await fetch(`${API_URL}/cart/items`, {
+        const response = afterMutation(await fetch(`${API_URL}/cart/items`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${token}`,
             },
             body: JSON.stringify(itemData),
-        });
+        }), `${API_URL}/cart`);
         if (!response.ok) throw new Error('Failed to add item to cart');
         return response.json();
     },
 
     updateCartItem: async (productId, size, quantity, token) => {
-        const response = await fetch(`${API_URL}/cart/items/${productId}?size=${size}`, {
+        const response = afterMutation(await fetch(`${API_URL}/cart/items/${productId}?size=${size}`, {
             method: 'PUT',
             headers: {
                 'Content-Type': 'application/json',
                 'Authorization': `Bearer ${token}`,
             },
             body: JSON.stringify({ quantity }),
-        });
+        }), `${API_URL}/cart`);
         if (!response.ok) throw new Error('Failed to update cart item');
         return response.json();
     },
 
     removeFromCart: async (productId, size, token) => {
-        const response = await fetch(`${API_URL}/cart/items/${productId}?size=${size}`, {
+        const response = afterMutation(await fetch(`${API_URL}/cart/items/${productId}?size=${size}`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${token}`,
             }
-        });
+        }), `${API_URL}/cart`);
         if (!response.ok) throw new Error('Failed to remove item from cart');
         return response.json();
     },
 
     clearCart: async (token) => {
-        const response = await fetch(`${API_URL}/cart/`, {
+        const response = afterMutation(await fetch(`${API_URL}/cart/`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${token}`,
             }
-        });
+        }), `${API_URL}/cart`);
         if (!response.ok) throw new Error('Failed to clear cart');
         return response.json();
     }
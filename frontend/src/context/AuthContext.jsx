@@ -52,6 +52,7 @@ export const AuthProvider = ({ children }) => {
         setToken(null);
         setIsAdmin(false);
         localStorage.removeItem('token');
+        api.clearCache();
     };
 
     return (
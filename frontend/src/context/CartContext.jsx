@@ -16,14 +16,20 @@ export const CartProvider = ({ children }) => {
         }
     });
 
+    // Server-side totals after promotions, for logged-in users
+    const [pricing, setPricing] = useState(null);
+
     // Helper to format backend cart items to frontend structure
     const formatBackendCart = (backendCart) => {
+        setPricing({ subtotal: backendCart.subtotal, discount: backendCart.discount, total: backendCart.total });
         return backendCart.items.map(item => ({
             ...item.product,
             id: item.product.id,
             size: item.size,
             quantity: item.quantity,
-            cart_item_id: item.id
+            cart_item_id: item.id,
+            discount: item.discount,
+            promotion: item.promotion
         }));
     };
 
@@ -38,6 +44,7 @@ export const CartProvider = ({ children }) => {
                     console.error("Failed to fetch backend cart", error);
                 }
             } else {
+                setPricing(null);
                 // If logging out, optionally re-load from local or clear
                 // For now, let's fall back to local storage if available or keep empty
                 try {
@@ -148,6 +155,7 @@ export const CartProvider = ({ children }) => {
             try {
                 await api.clearCart(token);
                 setCart([]);
+                setPricing(null);
             } catch (error) {
                 console.error("Failed to clear backend cart", error);
             }
@@ -156,10 +164,18 @@ export const CartProvider = ({ children }) => {
         }
     };
 
-    const total = cart.reduce((sum, item) => sum + item.price * item.quantity, 0);
+    // Drop local cart state without an API call, e.g. after the server emptied it at checkout
+    const resetCart = () => {
+        setCart([]);
+        setPricing(null);
+    };
+
+    const subtotal = cart.reduce((sum, item) => sum + item.price * item.quantity, 0);
+    const discount = token && pricing ? pricing.discount : 0;
+    const total = subtotal - discount;
 
     return (
-        <CartContext.Provider value={{ cart, addToCart, removeFromCart, updateQuantity, clearCart, total }}>
+        <CartContext.Provider value={{ cart, addToCart, removeFromCart, updateQuantity, clearCart, resetCart, subtotal, discount, total }}>
             {children}
         </CartContext.Provider>
     );
@@ -30,6 +30,19 @@ const Admin = () => {
         fetchData();
     }, [isAdmin, activeTab]);
 
+    // Live order updates: new orders are refetched, status changes (including other admins' bulk edits) patched in place
+    useEffect(() => {
+        if (!isAdmin || activeTab !== 'orders') return;
+        return api.subscribeEvents(['orders'], (message) => {
+            if (message.type === 'order.created') {
+                fetchData();
+            } else if (message.type === 'order.status') {
+                const ids = new Set(message.order_ids);
+                setOrders(prev => prev.map(o => ids.has(o.id) ? { ...o, status: message.status } : o));
+            }
+        }, token);
+    }, [isAdmin, activeTab, token]);
+
     // Clean up object URLs on unmount to avoid memory leaks
     useEffect(() => {
         return () => previews.forEach(url => URL.revokeObjectURL(url));
@@ -4,7 +4,7 @@ import { useToast } from '../context/ToastContext';
 import { Trash2, Plus, Minus } from 'lucide-react';
 
 const Cart = () => {
-    const { cart, removeFromCart, updateQuantity, total } = useCart();
+    const { cart, removeFromCart, updateQuantity, subtotal, discount, total } = useCart();
     const navigate = useNavigate();
     const { showToast } = useToast();
 
@@ -51,6 +51,9 @@ const Cart = () => {
                                                 <p className="text-gray-500 bg-gray-100 px-2 py-0.5 rounded text-xs uppercase font-bold">{item.size}</p>
                                             </div>
                                             <p className="mt-1 text-sm font-bold text-rose-500">₹{item.price.toFixed(2)}</p>
+                                            {item.discount > 0 && (
+                                                <p className="mt-1 text-xs text-green-600">{item.promotion}: -₹{item.discount.toFixed(2)}</p>
+                                            )}
                                         </div>
 
                                         <div className="mt-4 sm:mt-0 sm:pr-9">
@@ -95,6 +98,18 @@ const Cart = () => {
                     </h2>
 
                     <div className="mt-6 space-y-4">
+                        {discount > 0 && (
+                            <>
+                                <div className="flex items-center justify-between">
+                                    <dt className="text-sm text-gray-600">Subtotal</dt>
+                                    <dd className="text-sm font-medium text-gray-900">₹{subtotal.toFixed(2)}</dd>
+                                </div>
+                                <div className="flex items-center justify-between">
+                                    <dt className="text-sm text-gray-600">Discounts</dt>
+                                    <dd className="text-sm font-medium text-green-600">-₹{discount.toFixed(2)}</dd>
+                                </div>
+                            </>
+                        )}
                         <div className="border-t border-gray-200 pt-4 flex items-center justify-between">
                             <dt className="text-base font-medium text-gray-900">Order total</dt>
                             <dd className="text-xl font-bold text-rose-600">₹{total.toFixed(2)}</dd>
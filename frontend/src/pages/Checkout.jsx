@@ -1,17 +1,21 @@
-import { useState } from 'react';
+import { useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { useCart } from '../context/CartContext';
 import { api } from '../api';
 
 const Checkout = () => {
-    const { cart, total, clearCart } = useCart();
+    const { cart, total, resetCart } = useCart();
     const { token, user } = useAuth();
     const navigate = useNavigate();
 
     const [address, setAddress] = useState('');
+    const [coupon, setCoupon] = useState('');
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState('');
+    // One key per checkout attempt: resubmitting after a timeout replays the first order
+    // instead of placing a second one
+    const idempotencyKey = useRef(crypto.randomUUID());
 
     if (cart.length === 0) {
         navigate('/cart');
@@ -28,21 +32,16 @@ const Checkout = () => {
         setLoading(true);
         setError('');
 
-        const orderData = {
-            items: cart.map(item => ({
-                product_id: item.id,
-                quantity: item.quantity,
-                size: item.size
-            })),
-            shipping_address: address
-        };
-
         try {
-            await api.createOrder(orderData, token);
-            clearCart();
+            // The server builds the order from the saved cart and empties it in one transaction
+            await api.checkoutFromCart(address, token, idempotencyKey.current, coupon.trim() || null);
+            resetCart();
             alert('Order placed successfully!');
             navigate('/');
         } catch (err) {
+            // The server answered (e.g. out of stock): a fresh attempt needs a fresh key.
+            // Network failures (TypeError) keep the key so the retry can be replayed.
+            if (!(err instanceof TypeError)) idempotencyKey.current = crypto.randomUUID();
             setError('Failed to place order. Please try again.');
             console.error(err);
         } finally {
@@ -74,6 +73,18 @@ const Checkout = () => {
                                     required
                                 />
                             </div>
+                            <div className="col-span-6 sm:col-span-3">
+                                <label htmlFor="coupon" className="block text-sm font-medium text-gray-700">Coupon Code</label>
+                                <input
+                                    id="coupon"
+                                    name="coupon"
+                                    type="text"
+                                    className="mt-1 focus:ring-rose-400 focus:border-rose-400 block w-full shadow-sm sm:text-sm border-gray-300 rounded-md p-2 border uppercase"
+                                    value={coupon}
+                                    onChange={(e) => setCoupon(e.target.value)}
+                                />
+                                <p className="mt-1 text-xs text-gray-500">Coupon discounts are applied when the order is placed.</p>
+                            </div>
                         </div>
 
                         <div className="mt-6 flex items-center justify-between border-t pt-6">
@@ -3,6 +3,7 @@ import { useParams, Link } from 'react-router-dom';
 import { api } from '../api';
 import { useCart } from '../context/CartContext';
 import { useToast } from '../context/ToastContext';
+import ProductCard from '../components/ProductCard';
 import { ShoppingCart, ArrowLeft } from 'lucide-react';
 
 const ProductDetails = () => {
@@ -11,6 +12,7 @@ const ProductDetails = () => {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [selectedSize, setSelectedSize] = useState('');
+    const [related, setRelated] = useState([]);
     const { addToCart } = useCart();
     const { showToast } = useToast();
 
@@ -32,6 +34,18 @@ const ProductDetails = () => {
         fetchProduct();
     }, [id]);
 
+    // "Bought together" suggestions are optional; the page works without them
+    useEffect(() => {
+        api.getRelatedProducts(id).then(setRelated).catch(() => setRelated([]));
+    }, [id]);
+
+    // Keep stock and price current while the page is open
+    useEffect(() => {
+        return api.subscribeEvents([`product:${id}`], (message) => {
+            setProduct(prev => prev && { ...prev, stock: message.stock, price: message.price });
+        });
+    }, [id]);
+
     if (loading) return <div className="text-center py-20"><div className="animate-spin rounded-full h-12 w-12 border-t-2 border-b-2 border-rose-500 mx-auto"></div></div>;
     if (error) return <div className="text-center py-20 text-red-500">{error}</div>;
     if (!product) return <div className="text-center py-20">Product not found.</div>;
@@ -101,6 +115,15 @@ const ProductDetails = () => {
                     </p>
                 </div>
             </div>
+
+            {related.length > 0 && (
+                <div className="mt-16">
+                    <h2 className="text-2xl font-bold text-gray-900 mb-6">Customers also bought</h2>
+                    <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-6">
+                        {related.map(p => <ProductCard key={p.id} product={p} />)}
+                    </div>
+                </div>
+            )}
         </div>
     );
 };